@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark ל-GET /tasks/{id}/audit: עמוד keyset מול טעינת כל ה-audit.
+
+ממלא DB זמני ב---rows שורות audit למשימה אחת (ועוד משימות "רעש"), ואז מודד
+עמוד ראשון, עמוד באמצע ועמוד בסוף (דרך cursor), עם ובלי פענוח data_json,
+מול הבקשה הישנה שמחזירה הכול. זמן עמוד צריך להיות קבוע בלי קשר למיקום.
+
+שימוש (מתיקיית הפרויקט):
+  python scripts/bench_audit_pages.py [--rows 100000] [--page 100] [--repeat 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def _ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--page", type=int, default=100)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="lucy-bench-"))
+    os.environ["LUCY_DB_PATH"] = str(tmp / "bench.db")
+
+    from sqlalchemy import insert, text
+    from starlette.testclient import TestClient
+
+    from src.db import session as db_session
+    from src.main import app
+    from src.models.tasks import AuditLog, Base, Task
+
+    Base.metadata.create_all(db_session._engine)
+    task_id = str(uuid4())
+    events = ["action_start", "action_end", "task_queued"]
+    with db_session._engine.begin() as c:
+        c.execute(insert(Task), [{"id": task_id, "title": "bench", "status": "RUNNING"}])
+        for tid, n in ((task_id, args.rows), (str(uuid4()), args.rows // 10)):
+            rows = [
+                {
+                    "id": str(uuid4()),
+                    "task_id": tid,
+                    "event_type": events[i % 3],
+                    "message": "",
+                    # כמה רשומות בכל שנייה, כמו בפועל (created_at ברזולוציה של שנייה)
+                    "data_json": json.dumps({"i": i, "stdout_tail": "x" * 200}),
+                    "created_at": f"2025-01-01T00:{i // 3600 % 60:02d}:{i // 60 % 60:02d}Z",
+                }
+                for i in range(n)
+            ]
+            c.execute(insert(AuditLog), rows)
+        plan = c.execute(
+            text(
+                "EXPLAIN QUERY PLAN SELECT id FROM audit_logs WHERE task_id = :t "
+                "AND (created_at, rowid) > ('2025-01-01T00:30:00Z', 0) "
+                "ORDER BY created_at, rowid LIMIT 100"
+            ),
+            {"t": task_id},
+        ).all()
+    print("plan:", " | ".join(r[-1] for r in plan))
+    print(f"rows: {args.rows}  page: {args.page}")
+
+    url = f"/tasks/{task_id}/audit"
+    with TestClient(app) as client:
+        # cursors לעמודים בהתחלה/באמצע/בסוף: הולכים בעמודים גדולים עד המיקום
+        cursors: dict[str, str | None] = {"first": None}
+        marks = {"middle": args.rows // 2, "last": args.rows - args.page}
+        seen, cur = 0, None
+        while marks:
+            r = client.get(
+                url, params={"limit": 1000, "decode": "false", **({"cursor": cur} if cur else {})}
+            )
+            seen += len(r.json())
+            cur = r.headers.get("x-next-cursor")
+            for name, pos in list(marks.items()):
+                if seen >= pos or cur is None:
+                    cursors[name] = cur
+                    del marks[name]
+
+        print(f"{'page':>8} {'decode ms':>10} {'raw ms':>8}")
+        for name, cursor in cursors.items():
+            params = {"limit": args.page, **({"cursor": cursor} if cursor else {})}
+            dec = _ms(lambda p=params: client.get(url, params=p).raise_for_status(), args.repeat)
+            raw = _ms(
+                lambda p=params: client.get(
+                    url, params={**p, "decode": "false"}
+                ).raise_for_status(),
+                args.repeat,
+            )
+            print(f"{name:>8} {dec:>10.2f} {raw:>8.2f}")
+        full = _ms(lambda: client.get(url).raise_for_status(), max(1, args.repeat // 10))
+        print(f"{'all rows':>8} {full:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
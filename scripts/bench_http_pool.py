@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark ל-action ה-/http: requests/sec עם client חדש לכל בקשה (הדרך הקודמת)
+מול ה-client המשותף מ-src/services/http_pool.py.
+
+מרים שרת HTTP מקומי (uvicorn, ASGI מינימלי) בתהליך נפרד ושולח אליו --requests
+בקשות, --concurrency במקביל. שרת מקומי בלי TLS הוא המקרה הזול ביותר לחיבור
+חדש — מול שירות אמיתי עם DNS ו-TLS הפער גדול יותר.
+
+שימוש (מתיקיית הפרויקט):
+  python scripts/bench_http_pool.py [--requests 2000] [--concurrency 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+from src.services.http_pool import HttpClientPool  # noqa: E402
+
+
+async def _app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    await send({"type": "http.response.body", "body": b'{"status":"ok"}'})
+
+
+def _serve() -> tuple[str, multiprocessing.Process]:
+    """השרת בתהליך נפרד, כדי שלא יתחרה על ה-GIL עם הלקוח הנמדד."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    config = uvicorn.Config(_app, host="127.0.0.1", port=port, log_level="warning")
+    proc = multiprocessing.Process(target=uvicorn.Server(config).run, daemon=True)
+    proc.start()
+    for _ in range(500):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/health", proc
+
+
+async def _run(url: str, n: int, concurrency: int, pooled: bool) -> float:
+    pool = HttpClientPool()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with sem:
+            if pooled:
+                async with pool.client(url) as client:
+                    r = await client.get(url, timeout=10)
+            else:
+                async with httpx.AsyncClient(timeout=10, follow_redirects=True) as client:
+                    r = await client.get(url)
+            r.raise_for_status()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    await pool.close()
+    return n / elapsed
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=20)
+    args = ap.parse_args()
+
+    url, server = _serve()
+    try:
+        print(f"requests: {args.requests}  concurrency: {args.concurrency}  url: {url}")
+        fresh = asyncio.run(_run(url, args.requests, args.concurrency, pooled=False))
+        pooled = asyncio.run(_run(url, args.requests, args.concurrency, pooled=True))
+        print(f"client per request  {fresh:8.0f} req/s")
+        print(f"pooled client       {pooled:8.0f} req/s  ({pooled / fresh:.1f}x)")
+    finally:
+        server.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: עלות בניית שורות Action/Run לכל action ב-quick_run.
+
+"legacy" משחזר את הדרך הקודמת (sa_inspect + בדיקת "x in cols" + hasattr
+לכל שורה); "shapes" בונה את אותן שורות דרך _ACTION_SHAPE/_RUN_SHAPE (עמודות
+ותבניות kwargs שמחושבות פעם אחת). אין כתיבה ל-DB — רק בניית האובייקטים.
+
+שימוש (מתיקיית הפרויקט):
+  python scripts/bench_model_shapes.py [--actions 50] [--repeat 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from uuid import uuid4
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("LUCY_DB_PATH", str(Path(tempfile.mkdtemp()) / "bench.db"))
+
+from sqlalchemy.inspection import inspect as sa_inspect  # noqa: E402
+
+from src.models.tasks import Action, Run, now_iso  # noqa: E402
+from src.routers.tasks import _ACTION_SHAPE, _RUN_SHAPE  # noqa: E402
+
+
+def _legacy_cols(cls):
+    try:
+        return {c.key for c in sa_inspect(cls).columns}
+    except Exception:
+        return set()
+
+
+def legacy_rows(cmds: list[str], task_id: str) -> list:
+    rows = []
+    A = _legacy_cols(Action)
+    for i, cmd in enumerate(cmds):
+        a_kwargs = {}
+        if "id" in A:
+            a_kwargs["id"] = str(uuid4())
+        if "task_id" in A:
+            a_kwargs["task_id"] = task_id
+        if "idx" in A:
+            a_kwargs["idx"] = i + 1
+        if "type" in A:
+            a_kwargs["type"] = "shell"
+        if "created_at" in A:
+            a_kwargs["created_at"] = now_iso()
+        if "updated_at" in A:
+            a_kwargs["updated_at"] = now_iso()
+        if "params_json" in A:
+            a_kwargs["params_json"] = json.dumps({"cmd": cmd})
+        act = Action(**a_kwargs)
+
+        R = _legacy_cols(Run)
+        r_kwargs = {}
+        if "id" in R:
+            r_kwargs["id"] = str(uuid4())
+        if "action_id" in R:
+            r_kwargs["action_id"] = getattr(act, "id", None)
+        if "status" in R:
+            r_kwargs["status"] = "PENDING"
+        r = Run(**r_kwargs)
+        if hasattr(r, "stdout_path"):
+            r.stdout_path = "stdout.log"
+        if hasattr(r, "stderr_path"):
+            r.stderr_path = "stderr.log"
+        rows += [act, r]
+    return rows
+
+
+def shape_rows(cmds: list[str], task_id: str) -> list:
+    rows = []
+    now = now_iso()
+    for i, cmd in enumerate(cmds):
+        action_id = str(uuid4())
+        rows.append(
+            _ACTION_SHAPE.build(
+                id=action_id,
+                task_id=task_id,
+                idx=i + 1,
+                type="shell",
+                created_at=now,
+                updated_at=now,
+                params_json=json.dumps({"cmd": cmd}),
+            )
+        )
+        rows.append(
+            _RUN_SHAPE.build(
+                id=str(uuid4()),
+                action_id=action_id,
+                status="PENDING",
+                stdout_path="stdout.log",
+                stderr_path="stderr.log",
+            )
+        )
+    return rows
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--actions", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    cmds = ["true"] * args.actions
+    n = args.actions * args.repeat
+    legacy = timeit.timeit(lambda: legacy_rows(cmds, "t"), number=args.repeat)
+    shapes = timeit.timeit(lambda: shape_rows(cmds, "t"), number=args.repeat)
+    print(f"actions/request: {args.actions}  requests: {args.repeat}")
+    print(f"legacy  {legacy / n * 1e6:8.2f} us/action")
+    print(f"shapes  {shapes / n * 1e6:8.2f} us/action  ({legacy / shapes:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
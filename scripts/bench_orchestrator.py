@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark ל-orchestrator של lucy_agent (src/lucy_agent/orchestrator.py): משימה
+עם --steps צעדי shell, כל אחד ישן --sleep שניות ומדפיס --lines שורות.
+
+מודד זמן כולל, מספר ה-commits ל-DB וכמה פלט נשמר ב-steps.stdout:
+- per-step commits (הדרך הקודמת, על כל הצעדים): commit אחרי כל שינוי סטטוס
+  ואירוע, וכל ה-stdout/stderr נשמרים ב-DB.
+- run_task ברצף, ו-run_task עם params["group"] (--group-size צעדים במקביל):
+  פלט לקבצים, tail ב-DB, עדכונים ואירועים ב-batch.
+
+רץ על DB זמני (לא על ה-DB של lucy_agent).
+
+שימוש (מתיקיית הפרויקט):
+  python scripts/bench_orchestrator.py [--steps 100] [--lines 20000] [--sleep 0.05]
+                                       [--group-size 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+_tmp = Path(tempfile.mkdtemp(prefix="lucy-orch-bench-"))
+os.environ.setdefault("LUCY_ORCH_OUTPUT_DIR", str(_tmp / "steps"))
+
+from sqlalchemy import event, func, select  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from src.lucy_agent import orchestrator  # noqa: E402
+from src.lucy_agent.db import Base  # noqa: E402
+from src.lucy_agent.models import EventLog, RunStatus, Step, Task  # noqa: E402
+
+
+async def _legacy_run(task_id: str, session_factory) -> None:
+    """הדפוס הקודם של run_task, על כל הצעדים: commit לכל שינוי, כל הפלט ב-DB."""
+    async with session_factory() as session:
+        task = await session.get(Task, task_id)
+        task.status = RunStatus.running.value
+        task.started_at = datetime.now(UTC)
+        session.add(EventLog(task_id=task_id, ts=datetime.now(UTC), event_type="started"))
+        await session.commit()
+        for step in task.steps:
+            step.status = RunStatus.running.value
+            step.started_at = datetime.now(UTC)
+            await session.commit()
+            proc = await asyncio.create_subprocess_exec(
+                *step.params["cmd"], stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            session.add(EventLog(task_id=task_id, ts=datetime.now(UTC), event_type="heartbeat"))
+            await session.commit()
+            out, err = await proc.communicate()
+            step.exit_code = proc.returncode
+            step.stdout, step.stderr = out.decode(errors="replace"), err.decode(errors="replace")
+            step.status = RunStatus.succeeded.value
+            step.ended_at = datetime.now(UTC)
+            session.add(EventLog(task_id=task_id, ts=datetime.now(UTC), event_type="update"))
+            await session.commit()
+        task.status = RunStatus.succeeded.value
+        session.add(EventLog(task_id=task_id, ts=datetime.now(UTC), event_type="done"))
+        await session.commit()
+
+
+async def _bench(args: argparse.Namespace) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{_tmp / 'bench.db'}")
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    commits = 0
+
+    @event.listens_for(engine.sync_engine, "commit")
+    def _count(conn):
+        nonlocal commits
+        commits += 1
+
+    cmd = ["sh", "-c", f"sleep {args.sleep}; seq 1 {args.lines}"]
+    runs = [
+        ("per-step commits (old)", None, 0),
+        ("run_task sequential", orchestrator.run_task, 0),
+        (f"run_task groups of {args.group_size}", orchestrator.run_task, args.group_size),
+    ]
+    print(
+        f"steps: {args.steps}  lines/step: {args.lines}  concurrency: {orchestrator._CONCURRENCY}"
+    )
+    print(f"{'':<26} {'total s':>8} {'commits':>8} {'stdout in DB':>13} {'status':>10}")
+    for n, (label, runner, group) in enumerate(runs):
+        task_id = f"bench-{n}"
+        async with session_factory() as s:
+            s.add(Task(id=task_id, title=label, status=RunStatus.pending.value))
+            for i in range(args.steps):
+                params = {"cmd": cmd}
+                if group:
+                    params["group"] = i // group
+                s.add(
+                    Step(
+                        id=f"{task_id}-{i:04d}",
+                        task_id=task_id,
+                        type="shell",
+                        params=params,
+                        status=RunStatus.pending.value,
+                    )
+                )
+            await s.commit()
+
+        before = commits
+        t0 = time.perf_counter()
+        if runner is None:
+            await _legacy_run(task_id, session_factory)
+        else:
+            await runner(task_id, session_factory=session_factory)
+        elapsed = time.perf_counter() - t0
+
+        async with session_factory() as s:
+            stored = await s.scalar(
+                select(func.sum(func.length(Step.stdout))).where(Step.task_id == task_id)
+            )
+            status = await s.scalar(select(Task.status).where(Task.id == task_id))
+        print(
+            f"{label:<26} {elapsed:>8.2f} {commits - before:>8} "
+            f"{(stored or 0) / 1024 / 1024:>10.1f} MB {status:>10}"
+        )
+    await engine.dispose()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--steps", type=int, default=100)
+    ap.add_argument("--lines", type=int, default=20000)
+    ap.add_argument("--sleep", type=float, default=0.05)
+    ap.add_argument("--group-size", type=int, default=10)
+    asyncio.run(_bench(ap.parse_args()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark ל-POST /tasks/quick-run: latency ומספר ה-commits ל-1/10/100 actions.
+
+שימוש (מתיקיית הפרויקט):
+  python scripts/bench_quick_run.py [--sizes 1,10,100] [--repeat 5]
+
+רץ על DB זמני (LUCY_DB_PATH) עם פקודת `true`, כך שהזמן הנמדד הוא כמעט כולו
+עבודת ה-DB וה-orchestration ולא הפקודות עצמן.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1,10,100")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="lucy-bench-"))
+    os.environ["LUCY_DB_PATH"] = str(tmp / "bench.db")
+    os.environ["LUCY_RUNS_DIR"] = str(tmp / "runs")
+    os.environ["LUCY_AUTOPILOT_MIN_INTERVAL_SEC"] = "0"
+    os.environ["LUCY_AUTOPILOT_RATE_FILE"] = str(tmp / "rate")
+    os.environ.setdefault("LUCY_TASK_CONCURRENCY", "1")
+
+    from sqlalchemy import event
+    from starlette.testclient import TestClient
+
+    from src.db import session as db_session
+    from src.main import app
+    from src.models.tasks import Base
+
+    Base.metadata.create_all(db_session._engine)
+    commits = 0
+
+    @event.listens_for(db_session._engine, "commit")
+    def _count(conn):
+        nonlocal commits
+        commits += 1
+
+    print(f"{'actions':>8} {'median ms':>10} {'min ms':>8} {'ms/action':>10} {'commits':>8}")
+    with TestClient(app) as client:
+        for n in [int(x) for x in args.sizes.split(",") if x.strip()]:
+            body = {"title": "bench", "actions": [{"params": {"cmd": "true"}}] * n}
+            samples: list[float] = []
+            per_run_commits = 0
+            for _ in range(args.repeat):
+                before = commits
+                t0 = time.perf_counter()
+                resp = client.post("/tasks/quick-run", json=body)
+                samples.append((time.perf_counter() - t0) * 1000)
+                per_run_commits = commits - before
+                resp.raise_for_status()
+            med = statistics.median(samples)
+            print(f"{n:>8} {med:>10.1f} {min(samples):>8.1f} {med / n:>10.2f} {per_run_commits:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
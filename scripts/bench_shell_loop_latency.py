@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Load test ל-action ה-/shell: השהיית ה-event loop בזמן שפקודות shell רצות.
+
+ticker מודד כל --tick-ms כמה באיחור ה-loop מתעורר, בזמן ש---requests פקודות
+(--concurrency במקביל) רצות: פעם בדרך הקודמת (subprocess.check_output בתוך
+handler async) ופעם דרך run_shell_capture מ-src/services/runner.py (מה שה-action
+משתמש בו). בדרך החדשה ה-latency צריך להישאר שטוח.
+
+שימוש (מתיקיית הפרויקט):
+  python scripts/bench_shell_loop_latency.py [--requests 20] [--concurrency 8]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from src.services.runner import run_shell_capture  # noqa: E402
+
+CMD = "sleep 0.2; seq 1 200000"
+
+
+async def _blocking(cmd: str) -> str:
+    # המימוש הקודם: async def שקורא ל-API חוסם
+    return subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT, text=True, timeout=10)
+
+
+async def _async(cmd: str) -> str:
+    _, buf = await run_shell_capture(cmd, timeout=10)
+    return buf.text()
+
+
+async def _measure(runner, n: int, concurrency: int, tick: float) -> tuple[list[float], float, int]:
+    lags: list[float] = []
+    stop = asyncio.Event()
+
+    async def ticker() -> None:
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            t0 = loop.time()
+            await asyncio.sleep(tick)
+            lags.append((loop.time() - t0 - tick) * 1000)
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> int:
+        async with sem:
+            return len(await runner(CMD))
+
+    t = asyncio.create_task(ticker())
+    await asyncio.sleep(tick * 3)
+    t0 = time.perf_counter()
+    sizes = await asyncio.gather(*(one() for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await t
+    return lags, elapsed, max(sizes)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--tick-ms", type=float, default=10)
+    args = ap.parse_args()
+
+    print(f"cmd: {CMD!r}  requests: {args.requests}  concurrency: {args.concurrency}")
+    print(f"{'':<22} {'p50 lag':>9} {'p99 lag':>9} {'max lag':>9} {'total s':>8} {'output':>9}")
+    for name, runner in (("check_output (old)", _blocking), ("run_shell_capture", _async)):
+        lags, elapsed, size = asyncio.run(
+            _measure(runner, args.requests, args.concurrency, args.tick_ms / 1000)
+        )
+        q = statistics.quantiles(lags, n=100, method="inclusive")
+        print(
+            f"{name:<22} {q[49]:>7.1f}ms {q[98]:>7.1f}ms {max(lags):>7.1f}ms"
+            f" {elapsed:>8.2f} {size:>9}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
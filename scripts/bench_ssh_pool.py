@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark ל-action ה-/ssh: N פקודות קצרות לאותו host — חיבור חדש לכל פקודה
+(הדרך הקודמת) מול ה-pool מ-src/services/ssh_pool.py.
+
+מרים שרת SSH מקומי (asyncssh, בתהליך נפרד) שמריץ כל פקודה כ-"echo" ומחזיר
+exit 0, ומודד זמן כולל ומספר ה-handshakes. שרת מקומי הוא המקרה הזול ביותר
+ל-handshake — מול host מרוחק (RTT, אימות) הפער גדול יותר.
+
+שימוש (מתיקיית הפרויקט):
+  python scripts/bench_ssh_pool.py [--commands 50] [--concurrency 1]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import asyncssh  # noqa: E402
+
+from src.services.ssh_pool import SshConnectionPool, ssh_target  # noqa: E402
+
+
+class _NoAuthServer(asyncssh.SSHServer):
+    def begin_auth(self, username: str) -> bool:
+        return False
+
+
+async def _handle(process: asyncssh.SSHServerProcess) -> None:
+    process.stdout.write(f"{process.command}\n")
+    process.exit(0)
+
+
+def _serve(port: int) -> None:
+    async def main() -> None:
+        key = asyncssh.generate_private_key("ssh-ed25519")
+        await asyncssh.listen(
+            "127.0.0.1",
+            port,
+            server_host_keys=[key],
+            server_factory=_NoAuthServer,
+            process_factory=_handle,
+        )
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def _start_server() -> tuple[int, multiprocessing.Process]:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = multiprocessing.Process(target=_serve, args=(port,), daemon=True)
+    proc.start()
+    for _ in range(500):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.01)
+    return port, proc
+
+
+async def _run(port: int, n: int, concurrency: int, pooled: bool) -> tuple[float, int]:
+    key, options = ssh_target("127.0.0.1", port, "bench", timeout=10)
+    pool = SshConnectionPool()
+    sem = asyncio.Semaphore(concurrency)
+    handshakes = 0
+
+    async def one(i: int) -> None:
+        nonlocal handshakes
+        async with sem:
+            if pooled:
+                async with pool.connection(key, options, timeout=10) as conn:
+                    res = await conn.run(f"echo {i}", check=True)
+            else:
+                handshakes += 1
+                async with asyncssh.connect(**options) as conn:
+                    res = await conn.run(f"echo {i}", check=True)
+            assert res.stdout.strip() == f"echo {i}"
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    elapsed = time.perf_counter() - t0
+    if pooled:
+        handshakes = pool.created
+    await pool.close()
+    return elapsed, handshakes
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--commands", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=1)
+    args = ap.parse_args()
+
+    port, server = _start_server()
+    try:
+        print(f"commands: {args.commands}  concurrency: {args.concurrency}")
+        for label, pooled in (("connect per command", False), ("pooled connection", True)):
+            elapsed, handshakes = asyncio.run(_run(port, args.commands, args.concurrency, pooled))
+            print(
+                f"{label:<20} {elapsed * 1000:9.1f} ms  "
+                f"{elapsed * 1000 / args.commands:7.2f} ms/cmd  handshakes: {handshakes}"
+            )
+    finally:
+        server.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
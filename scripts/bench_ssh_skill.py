@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark ל-SSHSkill: קריאות חוזרות לאותו host עם מפתח RSA (inline PEM).
+
+legacy — המימוש הקודם מבוסס paramiko: SSHClient חדש בכל קריאה, ו-_load_pkey
+מפענח את ה-PEM מחדש (Ed25519 -> RSA -> ...). מול ה-facade הסינכרוני החדש
+(SSHSkill: loop ייעודי + pool) ו-AsyncSSHSkill ישירות מתוך event loop.
+מרים שרת SSH מקומי (asyncssh, בתהליך נפרד) שמקבל כל מפתח.
+
+שימוש (מתיקיית הפרויקט; דורש paramiko להשוואה ל-legacy):
+  python scripts/bench_ssh_skill.py [--calls 30]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import multiprocessing
+import socket
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import asyncssh  # noqa: E402
+
+from src.lucy_agent.skills.ssh_skill import AsyncSSHSkill, SSHSkill  # noqa: E402
+from src.services.ssh_pool import SshConnectionPool  # noqa: E402
+
+
+class _AnyKeyServer(asyncssh.SSHServer):
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def public_key_auth_supported(self) -> bool:
+        return True
+
+    def validate_public_key(self, username: str, key: asyncssh.SSHKey) -> bool:
+        return True
+
+
+async def _handle(process: asyncssh.SSHServerProcess) -> None:
+    process.stdout.write(f"{process.command}\n")
+    process.exit(0)
+
+
+def _serve(port: int) -> None:
+    async def main() -> None:
+        await asyncssh.listen(
+            "127.0.0.1",
+            port,
+            server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+            server_factory=_AnyKeyServer,
+            process_factory=_handle,
+        )
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def _legacy_run(host: str, port: int, user: str, cmd: str, pem: str) -> tuple[int, str]:
+    """העתק של SSHSkill.run הקודם (paramiko), לצורך השוואה בלבד."""
+    import paramiko
+
+    def load_pkey(private_key: str):
+        buf = io.StringIO(private_key)
+        for cls in (paramiko.Ed25519Key, paramiko.RSAKey, paramiko.ECDSAKey):
+            try:
+                buf.seek(0)
+                return cls.from_private_key(buf)
+            except Exception:
+                pass
+        raise ValueError("unsupported key")
+
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(
+        hostname=host,
+        port=port,
+        username=user,
+        pkey=load_pkey(pem),
+        timeout=10,
+        look_for_keys=False,
+        allow_agent=False,
+    )
+    try:
+        _, stdout, _ = client.exec_command(cmd, timeout=10)
+        rc = stdout.channel.recv_exit_status()
+        return rc, stdout.read().decode()
+    finally:
+        client.close()
+
+
+def _timed(fn, calls: int) -> list[float]:
+    samples = []
+    for i in range(calls):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calls", type=int, default=30)
+    args = ap.parse_args()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = multiprocessing.Process(target=_serve, args=(port,), daemon=True)
+    server.start()
+    for _ in range(500):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.01)
+
+    pem = (
+        asyncssh.generate_private_key("ssh-rsa", key_size=2048)
+        .export_private_key("pkcs1-pem")
+        .decode()
+    )
+    results: dict[str, list[float]] = {}
+    try:
+        try:
+            results["legacy (paramiko)"] = _timed(
+                lambda i: _legacy_run("127.0.0.1", port, "bench", f"echo {i}", pem), args.calls
+            )
+        except ImportError:
+            print("paramiko not installed — skipping legacy")
+
+        skill = SSHSkill()
+        results["SSHSkill (sync facade)"] = _timed(
+            lambda i: skill.run("127.0.0.1", "bench", f"echo {i}", port=port, private_key=pem),
+            args.calls,
+        )
+
+        async def run_async() -> list[float]:
+            a = AsyncSSHSkill(SshConnectionPool())
+            samples = []
+            for i in range(args.calls):
+                t0 = time.perf_counter()
+                await a.run("127.0.0.1", "bench", f"echo {i}", port=port, private_key=pem)
+                samples.append((time.perf_counter() - t0) * 1000)
+            await a.pool.close()
+            return samples
+
+        results["AsyncSSHSkill"] = asyncio.run(run_async())
+    finally:
+        server.terminate()
+
+    print(f"calls: {args.calls}")
+    print(f"{'':<24} {'first ms':>9} {'median ms':>10} {'total ms':>9}")
+    for name, samples in results.items():
+        print(
+            f"{name:<24} {samples[0]:>9.1f} {statistics.median(samples[1:] or samples):>10.2f}"
+            f" {sum(samples):>9.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,16 @@
+"""
+ה-actions של הסוכן (/http, /ssh, /shell ...) כ-router אחד שה-app מרכיב.
+כולם מאחורי אותה בדיקת טוקן כמו /tasks/quick-run (LUCY_AUTOPILOT_TOKEN); מה שמריץ
+פקודות או חושף לוגים (/shell, /ssh, /logs) חסום לגמרי כל עוד לא הוגדר טוקן.
+"""
+
+from fastapi import APIRouter, Depends
+
+from ..routers.tasks import _auth_check, _require_token
+from . import echo, gads, http, logs, shell, ssh, waha
+
+router = APIRouter(tags=["actions"])
+for _module in (echo, gads, http, waha):
+    router.include_router(_module.router, dependencies=[Depends(_auth_check)])
+for _module in (logs, shell, ssh):
+    router.include_router(_module.router, dependencies=[Depends(_require_token)])
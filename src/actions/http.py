@@ -1,14 +1,168 @@
+import asyncio
+import hashlib
 import json
+import os
+import time
+from pathlib import Path
 from typing import Any
+from uuid import uuid4
 
 import httpx
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 
 from ..db import log_action
 from ..models import ActionRequest, ActionResult
+from ..services.http_pool import pool as http_pool
 
 router = APIRouter()
 
+# הגוף נקרא ב-stream; בזיכרון נשארים רק ההתחלה והסוף שלו (תצוגה מקדימה)
+_PREVIEW_HEAD_BYTES = int(os.environ.get("LUCY_HTTP_PREVIEW_BYTES", "2000"))
+_PREVIEW_TAIL_BYTES = int(os.environ.get("LUCY_HTTP_PREVIEW_TAIL_BYTES", "500"))
+# /http/batch
+_BATCH_CONCURRENCY = int(os.environ.get("LUCY_HTTP_BATCH_CONCURRENCY", "20"))
+_BATCH_MAX = int(os.environ.get("LUCY_HTTP_BATCH_MAX", "1000"))
+_BACKOFF_MAX_SEC = float(os.environ.get("LUCY_HTTP_BACKOFF_MAX_SECONDS", "30"))
+_RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def _runs_dir() -> Path:
+    return Path(os.environ.get("LUCY_RUNS_DIR", str(Path.home() / ".local/share/lucy-agent/runs")))
+
+
+class _Timing:
+    """זמני connect/TTFB/transfer; connect נמדד דרך ה-trace extension של httpx."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.connect = 0.0
+        self.connected = False
+        self.headers: float | None = None
+        self.end: float | None = None
+        self._mark: float | None = None
+
+    async def trace(self, name: str, info: dict[str, Any]) -> None:
+        now = time.perf_counter()
+        if name == "connection.connect_tcp.started":
+            self._mark = now
+        elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            if self._mark is not None:
+                # TCP + TLS (ובהפניות — כל החיבורים החדשים); 0 כשהחיבור מה-pool
+                self.connect += now - self._mark
+                self._mark = now
+                self.connected = True
+
+    def as_ms(self) -> dict[str, float]:
+        end = self.end or time.perf_counter()
+        headers = self.headers or end
+        return {
+            "connect": round(self.connect * 1000, 2),
+            "ttfb": round((headers - self.start) * 1000, 2),
+            "transfer": round((end - headers) * 1000, 2),
+            "total": round((end - self.start) * 1000, 2),
+        }
+
+
+async def _capture(
+    resp: httpx.Response, timing: _Timing, spool: Path | None
+) -> tuple[str, dict[str, Any]]:
+    """קורא את הגוף ב-aiter_bytes: head/tail חסומים, ואופציונלית spool לקובץ + sha256."""
+    head = bytearray()
+    tail = bytearray()
+    size = 0
+    digest = hashlib.sha256() if spool is not None else None
+    f = None
+    if spool is not None:
+        spool.parent.mkdir(parents=True, exist_ok=True)
+        f = open(spool.with_suffix(".part"), "wb")
+    try:
+        async for chunk in resp.aiter_bytes():
+            size += len(chunk)
+            if f is not None:
+                f.write(chunk)
+                digest.update(chunk)
+            room = _PREVIEW_HEAD_BYTES - len(head)
+            if room > 0:
+                head += chunk[:room]
+                chunk = chunk[room:]
+            if chunk and _PREVIEW_TAIL_BYTES > 0:
+                tail += chunk
+                if len(tail) > _PREVIEW_TAIL_BYTES:
+                    del tail[: len(tail) - _PREVIEW_TAIL_BYTES]
+        timing.end = time.perf_counter()
+        if f is not None:
+            f.close()
+            spool.with_suffix(".part").replace(spool)
+    except BaseException:
+        if f is not None:
+            f.close()
+            spool.with_suffix(".part").unlink(missing_ok=True)
+        raise
+
+    encoding = resp.encoding or "utf-8"
+    text = head.decode(encoding, "replace")
+    omitted = size - len(head) - len(tail)
+    if tail:
+        if omitted > 0:
+            text += f"\n... [{omitted} bytes omitted] ...\n"
+        text += tail.decode(encoding, "replace")
+
+    details: dict[str, Any] = {
+        "status_code": resp.status_code,
+        "http_version": resp.http_version,
+        "bytes": size,
+        "bytes_downloaded": resp.num_bytes_downloaded,
+        "truncated": omitted > 0,
+        "connection_reused": not timing.connected,
+        "timing_ms": timing.as_ms(),
+    }
+    if spool is not None:
+        details["body_path"] = str(spool)
+        details["sha256"] = digest.hexdigest()
+    return text, details
+
+
+def _spool_path(p: dict[str, Any], name: str = "http_body") -> Path | None:
+    if not p.get("save_body"):
+        return None
+    base = _runs_dir().resolve()
+    run_dir = (base / str(p.get("run_id") or uuid4())).resolve()
+    # run_id הוא שם תיקייה אחת מתחת ל-runs ("../x" או נתיב מוחלט נדחים)
+    if run_dir.parent != base:
+        raise ValueError(f"Invalid run_id: {p.get('run_id')!r}")
+    return run_dir / name
+
+
+async def _send(p: dict[str, Any], spool: Path | None) -> tuple[int, str, dict[str, Any]]:
+    """בקשה אחת דרך ה-client המשותף; חריגים (רשת/timeout) עולים לקורא."""
+    url: str = p["url"]
+    timing = _Timing()
+    # client משותף לפי origin (keep-alive, HTTP/2 אם זמין) — לא client חדש לכל בקשה
+    async with http_pool.client(url, verify=p.get("verify", True)) as client:
+        async with client.stream(
+            (p.get("method") or "GET").upper(),
+            url,
+            headers=p.get("headers"),
+            params=p.get("params"),
+            json=p.get("json"),
+            data=p.get("data"),
+            timeout=float(p.get("timeout") or 10),
+            follow_redirects=True,
+            extensions={"trace": timing.trace},
+        ) as resp:
+            timing.headers = time.perf_counter()
+            body, details = await _capture(resp, timing, spool)
+    return resp.status_code, f"HTTP {resp.status_code}\n{body}", details
+
+
+def _http_status(code: int) -> str:
+    return "ok" if 200 <= code < 400 else "error"
+
+
+def _error_msg(e: BaseException) -> str:
+    return f"HTTP ERROR: {type(e).__name__}: {str(e) or 'timed out'}"
+
 
 @router.post("/http", response_model=ActionResult)
 async def run_http(req: ActionRequest):
@@ -21,35 +175,128 @@ async def run_http(req: ActionRequest):
       json:    dict לגוף JSON (אופציונלי)
       data:    dict/str לגוף טופס/טקסט (אופציונלי)
       timeout: שניות (ברירת מחדל: 10)
+      verify:  False לביטול בדיקת TLS, או נתיב ל-CA bundle (ברירת מחדל: True)
+      save_body: True לשמירת הגוף המלא ל-<LUCY_RUNS_DIR>/<run_id>/http_body (עם sha256)
+      run_id:    ה-run שאליו שייך הקובץ (ברירת מחדל: מזהה חדש)
+
+    הגוף נקרא ב-stream: ב-output רק head/tail, ו-details מכיל גודל, זמנים ונתיב הקובץ.
     """
     p: dict[str, Any] = req.params or {}
-    method: str = (p.get("method") or "GET").upper()
-    url: str = p.get("url") or ""
-    headers: dict[str, str] | None = p.get("headers")
-    qparams: dict[str, Any] | None = p.get("params")
-    json_body: Any = p.get("json")
-    data_body: Any = p.get("data")
-    timeout: float = float(p.get("timeout") or 10)
-
-    if not url:
+
+    if not p.get("url"):
         await log_action("http", json.dumps(p), "Missing URL", "error")
         return ActionResult(status="error", output="", error="Missing 'url' in params")
 
     try:
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-            resp = await client.request(
-                method,
-                url,
-                headers=headers,
-                params=qparams,
-                json=json_body,
-                data=data_body,
-            )
-        out = f"HTTP {resp.status_code}\n{resp.text[:2000]}"
-        status = "ok" if 200 <= resp.status_code < 400 else "error"
+        code, out, details = await _send(p, _spool_path(p))
+        status = _http_status(code)
         await log_action("http", json.dumps(p), out, status)
-        return ActionResult(status=status, output=out)
+        return ActionResult(status=status, output=out, details=details)
     except Exception as e:
-        msg = f"HTTP ERROR: {type(e).__name__}: {e}"
+        msg = _error_msg(e)
         await log_action("http", json.dumps(p), msg, "error")
         return ActionResult(status="error", output="", error=msg)
+
+
+async def _batch_item(
+    idx: int, spec: dict[str, Any], defaults: dict[str, Any], sem: asyncio.Semaphore
+) -> dict[str, Any]:
+    """פריט אחד ב-batch: timeout כולל לכל ניסיון, ו-retry עם backoff אקספוננציאלי."""
+    p = {**defaults, **spec}
+    if not p.get("url"):
+        return {"index": idx, "status": "error", "error": "Missing 'url'", "attempts": 0}
+    retries = int(p.get("retries") or 0)
+    backoff = float(p.get("backoff") or 0.5)
+    retry_on = set(p.get("retry_on") or _RETRY_STATUSES)
+    timeout = float(p.get("timeout") or 10)
+    try:
+        spool = _spool_path(p, f"http_body_{idx}")
+    except ValueError as e:
+        return {"index": idx, "status": "error", "error": str(e), "attempts": 0}
+
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            async with sem:
+                async with asyncio.timeout(timeout):
+                    code, out, details = await _send(p, spool)
+            if code not in retry_on or attempt > retries:
+                item = {"status": _http_status(code), "output": out, "details": details}
+                return {"index": idx, **item, "attempts": attempt}
+        except (httpx.TransportError, TimeoutError) as e:
+            if attempt > retries:
+                return {
+                    "index": idx,
+                    "status": "error",
+                    "error": _error_msg(e),
+                    "attempts": attempt,
+                }
+        except Exception as e:
+            return {"index": idx, "status": "error", "error": _error_msg(e), "attempts": attempt}
+        # ההמתנה מחוץ ל-semaphore — לא תופסת מקום של בקשות אחרות
+        await asyncio.sleep(min(_BACKOFF_MAX_SEC, backoff * 2 ** (attempt - 1)))
+
+
+@router.post("/http/batch")
+async def run_http_batch(req: ActionRequest):
+    """
+    params:
+      requests:    list של specs — כל spec עם אותם שדות כמו ב-/http (url חובה)
+      defaults:    dict שדות משותפים לכל ה-specs (spec גובר)
+      concurrency: כמה בקשות במקביל (ברירת מחדל: LUCY_HTTP_BATCH_CONCURRENCY)
+      retries:     ניסיונות חוזרים על שגיאת רשת/timeout או status ב-retry_on (ברירת מחדל: 0)
+      backoff:     שניות להמתנה לפני ה-retry הראשון, מוכפל בכל ניסיון (ברירת מחדל: 0.5)
+      retry_on:    list של status codes (ברירת מחדל: 429, 502, 503, 504)
+
+    retries/backoff/retry_on/timeout אפשר לקבוע גם לכל spec בנפרד.
+    התשובה היא NDJSON: שורה לכל בקשה לפי סדר הסיום (עם index), ובסוף שורת summary.
+    כל ה-batch נכתב ל-task_log ברשומה אחת.
+    """
+    p: dict[str, Any] = req.params or {}
+    specs = p.get("requests")
+    if not isinstance(specs, list) or not specs:
+        await log_action("http_batch", json.dumps(p), "Missing requests", "error")
+        return ActionResult(status="error", output="", error="Missing 'requests' list in params")
+    if len(specs) > _BATCH_MAX:
+        msg = f"Too many requests (max {_BATCH_MAX})"
+        await log_action("http_batch", json.dumps(p), msg, "error")
+        return ActionResult(status="error", output="", error=msg)
+
+    defaults = {k: p[k] for k in ("retries", "backoff", "retry_on") if k in p}
+    defaults.update(p.get("defaults") or {})
+    sem = asyncio.Semaphore(max(1, int(p.get("concurrency") or _BATCH_CONCURRENCY)))
+
+    async def lines():
+        t0 = time.perf_counter()
+        results: list[dict[str, Any]] = []
+        tasks = [
+            asyncio.create_task(_batch_item(i, s if isinstance(s, dict) else {}, defaults, sem))
+            for i, s in enumerate(specs)
+        ]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                item = await fut
+                results.append(item)
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            ok = sum(r["status"] == "ok" for r in results)
+            summary = {
+                "total": len(specs),
+                "ok": ok,
+                "error": len(results) - ok,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+            }
+            yield json.dumps({"summary": summary}) + "\n"
+        finally:
+            # לקוח שהתנתק באמצע — הבקשות שנותרו מבוטלות
+            for t in tasks:
+                t.cancel()
+            # רשומה אחת לכל ה-batch (ולא אחת לכל בקשה)
+            log = [{k: v for k, v in r.items() if k != "details"} for r in results]
+            status = "ok" if results and all(r["status"] == "ok" for r in results) else "error"
+            try:
+                await log_action("http_batch", json.dumps(p), json.dumps(log), status)
+            except Exception:
+                pass
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
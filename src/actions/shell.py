@@ -1,12 +1,23 @@
-import subprocess
+import asyncio
+import os
 
 from fastapi import APIRouter
 from pydantic import BaseModel
 
 from ..models import ActionResult
+from ..routers.tasks import _allow_deny_check, _rate_limit, _resource_limiter
+from ..services.runner import run_shell_capture
 
 router = APIRouter()
 
+_TIMEOUT_SEC = float(os.environ.get("LUCY_SHELL_TIMEOUT_SECONDS", "10"))
+# בזיכרון נשמרים רק ההתחלה והסוף של הפלט; מה שבאמצע מוחלף בסימון truncated
+_HEAD_BYTES = int(os.environ.get("LUCY_SHELL_OUTPUT_HEAD_BYTES", "65536"))
+_TAIL_BYTES = int(os.environ.get("LUCY_SHELL_OUTPUT_TAIL_BYTES", "65536"))
+# כמה פקודות רצות במקביל; השאר ממתינות בתור
+_CONCURRENCY = int(os.environ.get("LUCY_SHELL_CONCURRENCY", "8"))
+_slots = asyncio.Semaphore(_CONCURRENCY)
+
 
 class ShellRequest(BaseModel):
     command: str
@@ -14,12 +25,24 @@ class ShellRequest(BaseModel):
 
 @router.post("/shell", response_model=ActionResult)
 async def run_shell(req: ShellRequest):
+    # אותם guardrails כמו /tasks/quick-run: allow/deny, rate limit ו-rlimits לתהליך
+    _allow_deny_check(req.command)
+    _rate_limit()
+    # asyncio subprocess — לא חוסם את ה-event loop (ושאר הבקשות וה-SSE) בזמן הריצה
     try:
-        out = subprocess.check_output(
-            req.command, shell=True, stderr=subprocess.STDOUT, text=True, timeout=10
+        async with _slots:
+            rc, buf = await run_shell_capture(
+                req.command,
+                timeout=_TIMEOUT_SEC,
+                head_bytes=_HEAD_BYTES,
+                tail_bytes=_TAIL_BYTES,
+                preexec_fn=_resource_limiter(),
+            )
+        return ActionResult(status="ok" if rc == 0 else "error", output=buf.text())
+    except TimeoutError:
+        # כל קבוצת התהליכים כבר נהרגה (כולל צאצאים של ה-shell)
+        return ActionResult(
+            status="error", output=f"Command '{req.command}' timed out after {_TIMEOUT_SEC} seconds"
         )
-        return ActionResult(status="ok", output=out)
-    except subprocess.CalledProcessError as e:
-        return ActionResult(status="error", output=e.output)
     except Exception as e:
         return ActionResult(status="error", output=str(e))
@@ -1,14 +1,22 @@
 import asyncio
 import json
+import os
 import time
 import traceback
+from collections import Counter
+from pathlib import Path
 from typing import Any, Union
+from uuid import uuid4
 
 import asyncssh
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 
 from ..db import log_action
+from ..events import OutputPublisher
 from ..models import ActionRequest, ActionResult
+from ..services.ssh_pool import pool as ssh_pool, ssh_target
+from ..services.ssh_runner import RemoteResult, run_remote_to_files
 
 router = APIRouter()
 
@@ -48,6 +56,9 @@ def _redact(p: dict[str, Any]) -> dict[str, Any]:
         q["private_key"] = f"***PEM({len(str(q['private_key']))} chars)***"
     if q.get("private_key_path"):
         q["private_key_path"] = "***PATH***"
+    # fan-out: לכל host יכולים להיות פרטי הזדהות משלו
+    if isinstance(q.get("hosts"), list):
+        q["hosts"] = [_redact(h) if isinstance(h, dict) else h for h in q["hosts"]]
     return q
 
 
@@ -66,8 +77,11 @@ async def _try_log(
             if hasattr(request, "model_dump")
             else (request.dict() if hasattr(request, "dict") else {})
         )
+        # פרטי ההזדהות לא נכתבים ל-task_log (גם לא דרך request.params)
+        if isinstance(rq.get("params"), dict):
+            rq["params"] = _redact(rq["params"])
         payload = {
-            "params": params or {},
+            "params": _redact(params),
             "request": rq,
             "meta": meta or {},
             "success": bool(success),
@@ -82,6 +96,66 @@ async def _try_log(
         pass
 
 
+def _runs_dir() -> Path:
+    return Path(os.environ.get("LUCY_RUNS_DIR", str(Path.home() / ".local/share/lucy-agent/runs")))
+
+
+async def _exec(
+    p: dict[str, Any], host: str, port: int, username: str, full_cmd: str, timeout: float
+) -> RemoteResult:
+    """
+    מריץ full_cmd על host דרך חיבור מה-pool (פרטי ההזדהות מ-p). הפלט נכתב ב-stream
+    ל-<LUCY_RUNS_DIR>/<run_id>/stdout.log|stderr.log, ועם task_id גם מתפרסם חי ב-SSE.
+    """
+    key, options = ssh_target(
+        host,
+        port,
+        username,
+        password=p.get("password"),
+        private_key_path=p.get("private_key_path"),
+        private_key=p.get("private_key"),
+        passphrase=p.get("passphrase"),
+        known_hosts=p.get("known_hosts", None),
+        timeout=timeout,
+    )
+    run_id = str(p.get("run_id") or uuid4())
+    base = _runs_dir().resolve()
+    run_dir = (base / run_id).resolve()
+    if run_dir.parent != base:
+        raise ValueError(f"Invalid run_id: {run_id!r}")
+    on_output = None
+    if p.get("task_id"):
+        on_output = OutputPublisher(str(p["task_id"]), run_id, p.get("action_id"), host=host)
+    # חיבור משותף מה-pool: הפקודה רצה כ-channel, בלי handshake חדש לכל בקשה
+    for attempt in (1, 2):
+        try:
+            async with ssh_pool.connection(key, options, timeout=timeout) as conn:
+                return await run_remote_to_files(
+                    conn,
+                    full_cmd,
+                    run_dir / "stdout.log",
+                    run_dir / "stderr.log",
+                    timeout=timeout,
+                    on_output=on_output,
+                )
+        except asyncssh.ChannelOpenError:
+            # השרת סירב ל-channel נוסף (חיבור שנסגר, MaxSessions) — הפקודה לא רצה,
+            # אז ניסיון אחד נוסף בטוח; ה-pool כבר הוריד את תקרת ה-channels של החיבור
+            if attempt == 2:
+                raise
+
+
+def _result_details(res: RemoteResult) -> dict[str, Any]:
+    return {
+        "exit_status": res.exit_status,
+        "stdout_path": res.stdout_path,
+        "stderr_path": res.stderr_path,
+        "stdout_bytes": res.stdout.total,
+        "stderr_bytes": res.stderr.total,
+        "truncated": res.stdout.truncated or res.stderr.truncated,
+    }
+
+
 @router.post("/ssh", response_model=ActionResult)
 async def run_ssh(req: ActionRequest):
     t0 = time.time()
@@ -111,22 +185,10 @@ async def run_ssh(req: ActionRequest):
         return ActionResult(status=True, output=msg, error=None)
 
     try:
-        conn_params: dict[str, Any] = {
-            "host": host,
-            "port": port,
-            "username": username,
-            "known_hosts": p.get("known_hosts", None),
-            "login_timeout": timeout,
-            "connect_timeout": timeout,
-        }
-        if p.get("password"):
-            conn_params["password"] = p["password"]
-        if p.get("private_key_path"):
-            conn_params["client_keys"] = [p["private_key_path"]]
-        async with asyncssh.connect(**conn_params) as conn:
-            res = await asyncio.wait_for(conn.run(full_cmd, check=False), timeout=timeout)
-        out = (res.stdout or "") + (("\n" + res.stderr) if res.stderr else "")
+        res = await _exec(p, host, port, username, full_cmd, timeout)
+        out = res.output()
         ok = res.exit_status == 0
+        details = _result_details(res)
         await _try_log(
             "ssh",
             req,
@@ -134,9 +196,11 @@ async def run_ssh(req: ActionRequest):
             ok,
             out.strip(),
             None if ok else f"exit_status={res.exit_status}",
-            {"exit_status": res.exit_status, "duration": time.time() - t0},
+            {**details, "duration": time.time() - t0},
+        )
+        return ActionResult(
+            status=ok, output=out, error=None if ok else "Command failed", details=details
         )
-        return ActionResult(status=ok, output=out, error=None if ok else "Command failed")
     except Exception as e:
         err = f"{type(e).__name__}: {e}"
         await _try_log(
@@ -149,3 +213,155 @@ async def run_ssh(req: ActionRequest):
             {"trace": traceback.format_exc(), "duration": time.time() - t0},
         )
         return ActionResult(status=False, output="", error=err)
+
+
+# ------------------ fan-out למספר hosts ------------------
+_FANOUT_PARALLELISM = int(os.environ.get("LUCY_SSH_FANOUT_PARALLELISM", "20"))
+_FANOUT_MAX_HOSTS = int(os.environ.get("LUCY_SSH_FANOUT_MAX_HOSTS", "1000"))
+# JSON: {"<group>": ["host", "user@host:port", {"host": ..., "port": ..., ...}], ...}
+_INVENTORY_PATH = Path(
+    os.environ.get(
+        "LUCY_SSH_INVENTORY", str(Path.home() / ".local/share/lucy-agent/inventory.json")
+    )
+)
+_inventory_cache: tuple[int, dict[str, list[Any]]] | None = None
+
+
+def _load_inventory() -> dict[str, list[Any]]:
+    """ה-inventory מהקובץ; נקרא מחדש רק כשה-mtime שלו משתנה."""
+    global _inventory_cache
+    mtime = _INVENTORY_PATH.stat().st_mtime_ns
+    if _inventory_cache is None or _inventory_cache[0] != mtime:
+        _inventory_cache = (mtime, json.loads(_INVENTORY_PATH.read_text()))
+    return _inventory_cache[1]
+
+
+def _parse_host(entry: Any, defaults: dict[str, Any]) -> dict[str, Any]:
+    """ "host" / "user@host:port" / dict → params של host אחד (ה-host גובר על defaults)."""
+    if isinstance(entry, dict):
+        return {**defaults, **entry}
+    h = str(entry).strip()
+    out = dict(defaults)
+    if "@" in h:
+        out["username"], h = h.rsplit("@", 1)
+    if h.count(":") == 1:
+        h, out["port"] = h.split(":")
+    out["host"] = h
+    return out
+
+
+async def _fanout_one(
+    hp: dict[str, Any], full_cmd: str, timeout: float, dry: bool, sem: asyncio.Semaphore
+) -> dict[str, Any]:
+    host, username, port = hp.get("host"), hp.get("username"), int(hp.get("port") or 22)
+    item: dict[str, Any] = {"host": host, "port": port, "username": username}
+    if not host or not username:
+        return {**item, "ok": False, "exit_status": None, "error": "missing 'host' or 'username'"}
+    if dry:
+        msg = f"[DRY-RUN] {username}@{host}:{port} → {full_cmd}"
+        return {**item, "ok": True, "exit_status": None, "output": msg}
+    timeout = float(hp.get("timeout") or timeout)
+    t0 = time.time()
+    try:
+        async with sem:
+            async with asyncio.timeout(timeout):
+                res = await _exec(hp, host, port, username, full_cmd, timeout)
+        item.update(ok=res.exit_status == 0, output=res.output(), **_result_details(res))
+    except TimeoutError:
+        item.update(ok=False, exit_status=None, error=f"timeout after {timeout}s")
+    except Exception as e:
+        item.update(ok=False, exit_status=None, error=f"{type(e).__name__}: {e}")
+    item["duration"] = round(time.time() - t0, 3)
+    return item
+
+
+@router.post("/ssh/fanout")
+async def run_ssh_fanout(req: ActionRequest):
+    """
+    אותה פקודה על הרבה hosts במקביל.
+
+    params:
+      hosts:       list של "host" / "user@host:port" / dict עם שדות כמו ב-/ssh
+      group:       שם קבוצה מה-inventory (LUCY_SSH_INVENTORY) — במקום hosts או בנוסף
+      parallelism: כמה hosts במקביל (ברירת מחדל: LUCY_SSH_FANOUT_PARALLELISM)
+      timeout:     שניות לכל host (ברירת מחדל: 30)
+      command/commands/workdir/env/exec/dry_run ופרטי הזדהות — כמו ב-/ssh,
+      וברירת מחדל לכל host (dict של host גובר).
+      task_id:     אם קיים — הפלט של כל host מתפרסם חי ב-SSE של המשימה
+      run_id:      אם קיים — הפלט של host מס' i נכתב ל-<LUCY_RUNS_DIR>/<run_id>-<i>
+
+    התשובה היא NDJSON: שורה לכל host לפי סדר הסיום, ובסוף שורת summary.
+    כל ה-fan-out נכתב ל-task_log ברשומה אחת.
+    """
+    t0 = time.time()
+    p: dict[str, Any] = dict(getattr(req, "params", {}) or {})
+    entries: list[Any] = list(p.get("hosts") or [])
+    if p.get("group"):
+        try:
+            entries += _load_inventory()[p["group"]]
+        except (OSError, ValueError, KeyError) as e:
+            return ActionResult(status=False, output="", error=f"inventory: {e!r}")
+    if not entries:
+        return ActionResult(status=False, output="", error="missing 'hosts' or 'group'")
+    if len(entries) > _FANOUT_MAX_HOSTS:
+        return ActionResult(
+            status=False, output="", error=f"too many hosts (max {_FANOUT_MAX_HOSTS})"
+        )
+
+    skip = ("hosts", "group", "parallelism", "command", "run_id")
+    shared = {k: v for k, v in p.items() if k not in skip}
+    hosts = [_parse_host(e, shared) for e in entries]
+    # run_id משותף → תיקייה נפרדת לכל host (<run_id>-<i>), לא stdout.log אחד לכולם
+    if p.get("run_id"):
+        for i, h in enumerate(hosts):
+            h.setdefault("run_id", f"{p['run_id']}-{i}")
+    timeout = float(p.get("timeout") or 30)
+    full_cmd = _normalize_command(
+        p.get("command"), p.get("commands"), p.get("workdir"), p.get("env") or {}
+    )
+    dry = bool(p.get("dry_run") or getattr(req, "dry_run", False)) or p.get("exec") is not True
+    sem = asyncio.Semaphore(max(1, int(p.get("parallelism") or _FANOUT_PARALLELISM)))
+
+    async def lines():
+        results: list[dict[str, Any]] = []
+        tasks = [asyncio.create_task(_fanout_one(h, full_cmd, timeout, dry, sem)) for h in hosts]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                item = await fut
+                results.append(item)
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            yield json.dumps({"summary": _fanout_summary(results, t0)}) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+            # רשומה אחת לכל ה-fan-out; בלי פרטי הזדהות ובלי הפלט המלא
+            log = [{k: v for k, v in r.items() if k != "output"} for r in results]
+            summary = _fanout_summary(results, t0)
+            ok = bool(results) and summary["ok"] == len(hosts)
+            await _try_log(
+                "ssh_fanout",
+                None,
+                p,
+                ok,
+                json.dumps(log, ensure_ascii=False),
+                None if ok else f"{len(hosts) - summary['ok']} of {len(hosts)} hosts failed",
+                {"dry_run": dry, **summary},
+            )
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _fanout_summary(results: list[dict[str, Any]], t0: float) -> dict[str, Any]:
+    exit_codes = Counter(str(r["exit_status"]) for r in results if r.get("exit_status") is not None)
+    ok = sum(1 for r in results if r.get("ok"))
+    errors = sum(1 for r in results if r.get("error"))
+    slowest = max(results, key=lambda r: r.get("duration", 0), default=None)
+    return {
+        "total": len(results),
+        "ok": ok,
+        "failed": len(results) - ok - errors,
+        "errors": errors,
+        "exit_codes": dict(exit_codes),
+        "slowest": slowest and {"host": slowest["host"], "duration": slowest.get("duration")},
+        "duration": round(time.time() - t0, 3),
+    }
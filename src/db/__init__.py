@@ -1,6 +1,7 @@
 """
 DB exports shim:
 from src.db import get_session, safe_commit
+from src.db import log_action  (task_log של ה-actions, src/db/action_log.py)
 
 - מנסה לייבא מימושים קיימים (session/core/database/db וכו').
 - אם אין, מספק placeholder עם שגיאה ברורה כשהם נקראים.
@@ -8,7 +9,9 @@ from src.db import get_session, safe_commit
 
 from importlib import import_module
 
-__all__ = ["get_session", "safe_commit"]
+from .action_log import close_action_log, log_action, start_action_log
+
+__all__ = ["get_session", "safe_commit", "log_action", "start_action_log", "close_action_log"]
 
 
 def _import_first(candidates, names):
@@ -0,0 +1,173 @@
+"""
+task_log של ה-actions (/http, /ssh, /shell ...) ב-DB של lucy_agent (LUCY_AGENT_DB).
+"""
+
+import asyncio
+import datetime as dt
+import os
+
+import aiosqlite
+
+DB_PATH = os.getenv("LUCY_AGENT_DB", "lucy_agent.db")
+
+# ------------------ log writer (env) ------------------
+# חיבור aiosqlite אחד לכל התהליך; log_action רק מכניס לתור, ו-task ברקע כותב
+# batch (עד _BATCH_SIZE שורות או כל _FLUSH_MS) ב-INSERT+commit אחד.
+# fast:    log_action חוזר מיד, synchronous=NORMAL (fsync רק ב-checkpoint של WAL).
+# durable: log_action ממתין עד שה-batch שלו נכתב, synchronous=FULL.
+LOG_MODE = os.getenv("LUCY_LOG_MODE", "fast")
+_BATCH_SIZE = int(os.getenv("LUCY_LOG_BATCH_SIZE", "200"))
+_FLUSH_MS = int(os.getenv("LUCY_LOG_FLUSH_MS", "200"))
+_QUEUE_MAX = int(os.getenv("LUCY_LOG_QUEUE_MAX", "10000"))
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS task_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts DATETIME DEFAULT CURRENT_TIMESTAMP,
+        action TEXT NOT NULL,
+        input TEXT,
+        output TEXT,
+        status TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_task_log_ts ON task_log(ts)",
+)
+_INSERT = "INSERT INTO task_log(ts, action, input, output, status) VALUES(?,?,?,?,?)"
+
+
+_CLOSE = object()
+
+
+class LogWriter:
+    def __init__(
+        self,
+        path: str = DB_PATH,
+        *,
+        mode: str = LOG_MODE,
+        batch_size: int = _BATCH_SIZE,
+        flush_ms: int = _FLUSH_MS,
+        max_queue: int = _QUEUE_MAX,
+    ) -> None:
+        self.path = path
+        self.durable = mode == "durable"
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_ms / 1000
+        self._max_queue = max_queue
+        self._queue: asyncio.Queue | None = None
+        self._db: aiosqlite.Connection | None = None
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+        self.written = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._task is not None:
+                return
+            db = await aiosqlite.connect(self.path)
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute(f"PRAGMA synchronous={'FULL' if self.durable else 'NORMAL'}")
+            await db.execute("PRAGMA busy_timeout=10000")
+            for stmt in _SCHEMA:
+                await db.execute(stmt)
+            await db.commit()
+            self._db = db
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def write(self, action: str, input_: str, output: str, status: str) -> None:
+        if self._task is None:
+            await self.start()
+        # ts בזמן הקריאה (ולא בזמן ה-flush), באותו פורמט כמו CURRENT_TIMESTAMP
+        ts = dt.datetime.now(dt.UTC).strftime("%Y-%m-%d %H:%M:%S")
+        done = asyncio.get_running_loop().create_future() if self.durable else None
+        # תור מלא = backpressure: הכותב ממתין במקום שהזיכרון יגדל בלי גבול
+        await self._queue.put(((ts, action, input_, output, status), done))
+        if done is not None:
+            await done
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _CLOSE:
+                self._queue.task_done()
+                return
+            batch = [item]
+            closing = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    item = self._queue.get_nowait()
+                elif self.durable:
+                    # group commit: מי שממתין לא מחכה לטיימר; מה שמצטבר בזמן
+                    # הכתיבה הנוכחית ייכנס ל-batch הבא
+                    break
+                else:
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                    except TimeoutError:
+                        break
+                if item is _CLOSE:
+                    # close: ה-batch החלקי נכתב מיד, בלי לחכות לטיימר
+                    self._queue.task_done()
+                    closing = True
+                    break
+                batch.append(item)
+            await self._write_batch(batch)
+            if closing:
+                return
+
+    async def _write_batch(self, batch: list) -> None:
+        error: Exception | None = None
+        try:
+            await self._db.executemany(_INSERT, [row for row, _ in batch])
+            await self._db.commit()
+            self.written += len(batch)
+        except Exception as e:
+            # לוג לא מפיל את הפעולה; ב-durable הכותבים מקבלים את השגיאה
+            error = e
+            self.errors += 1
+            try:
+                await self._db.rollback()
+            except Exception:
+                pass
+        for _, done in batch:
+            if done is not None and not done.done():
+                if error is None:
+                    done.set_result(None)
+                else:
+                    done.set_exception(error)
+            self._queue.task_done()
+
+    async def flush(self) -> None:
+        """ממתין עד שכל מה שכבר בתור נכתב."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """flush מסודר ב-shutdown, ואז סגירת החיבור."""
+        if self._task is None:
+            return
+        await self._queue.put(_CLOSE)
+        await self._task
+        await self._db.close()
+        self._task = self._db = self._queue = None
+
+
+_writer = LogWriter()
+
+
+async def start_action_log():
+    """יוצר את task_log (WAL + אינדקס על ts) ומפעיל את ה-writer; ל-startup של האפליקציה."""
+    await _writer.start()
+
+
+async def close_action_log():
+    """כותב את מה שנשאר בתור וסוגר את החיבור; ל-shutdown של האפליקציה."""
+    await _writer.close()
+
+
+async def log_action(action: str, input_: str, output: str, status: str):
+    await _writer.write(action, input_, output, status)
@@ -1,7 +1,8 @@
 import os
 from pathlib import Path
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 
 
@@ -11,9 +12,81 @@ def _db_path() -> str:
     return p
 
 
-_engine = create_engine(f"sqlite:///{_db_path()}", echo=False, future=True)
+# ------------------ SQLite tuning (env) ------------------
+# WAL: קוראים (למשל GET /tasks/{id}/audit) לא חוסמים כותבים ולהפך.
+# synchronous=NORMAL ב-WAL: fsync רק ב-checkpoint, לא בכל commit.
+# busy_timeout: כותב שמחכה לכותב אחר ממתין במקום "database is locked" מיידי.
+# Pool: ברירת המחדל (20+20) מכסה את 40 ה-threads של ה-threadpool של Starlette.
+_JOURNAL_MODE = os.environ.get("LUCY_DB_JOURNAL_MODE", "WAL")
+_SYNCHRONOUS = os.environ.get("LUCY_DB_SYNCHRONOUS", "NORMAL")
+_BUSY_TIMEOUT_MS = int(os.environ.get("LUCY_DB_BUSY_TIMEOUT_MS", "10000"))
+_CACHE_SIZE_KB = int(os.environ.get("LUCY_DB_CACHE_SIZE_KB", "65536"))
+_MMAP_SIZE_MB = int(os.environ.get("LUCY_DB_MMAP_SIZE_MB", "256"))
+_POOL_SIZE = int(os.environ.get("LUCY_DB_POOL_SIZE", "20"))
+_MAX_OVERFLOW = int(os.environ.get("LUCY_DB_MAX_OVERFLOW", "20"))
+_POOL_TIMEOUT_SEC = float(os.environ.get("LUCY_DB_POOL_TIMEOUT_SECONDS", "30"))
+
+
+def create_db_engine(
+    path: str | Path | None = None,
+    *,
+    journal_mode: str | None = None,
+    synchronous: str | None = None,
+    busy_timeout_ms: int | None = None,
+    cache_size_kb: int | None = None,
+    mmap_size_mb: int | None = None,
+    pool_size: int | None = None,
+    max_overflow: int | None = None,
+) -> Engine:
+    """Engine ל-SQLite עם pragmas על כל חיבור חדש; ערכים שלא הועברו נלקחים מה-env."""
+    journal_mode = journal_mode or _JOURNAL_MODE
+    synchronous = synchronous or _SYNCHRONOUS
+    busy_timeout_ms = _BUSY_TIMEOUT_MS if busy_timeout_ms is None else busy_timeout_ms
+    cache_size_kb = _CACHE_SIZE_KB if cache_size_kb is None else cache_size_kb
+    mmap_size_mb = _MMAP_SIZE_MB if mmap_size_mb is None else mmap_size_mb
+
+    engine = create_engine(
+        f"sqlite:///{path or _db_path()}",
+        echo=False,
+        future=True,
+        pool_size=_POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_timeout=_POOL_TIMEOUT_SEC,
+        connect_args={"timeout": busy_timeout_ms / 1000, "check_same_thread": False},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            cur.execute(f"PRAGMA journal_mode={journal_mode}")
+            cur.execute(f"PRAGMA synchronous={synchronous}")
+            cur.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+            # ערך שלילי = KiB (ולא מספר עמודים)
+            cur.execute(f"PRAGMA cache_size={-int(cache_size_kb)}")
+            cur.execute(f"PRAGMA mmap_size={int(mmap_size_mb) * 1024 * 1024}")
+            cur.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cur.close()
+
+    return engine
+
+
+_engine = create_db_engine()
 SessionLocal = sessionmaker(bind=_engine, autoflush=False, autocommit=False, future=True)
 
 
 def get_session():
     return SessionLocal()
+
+
+def safe_commit(s) -> None:
+    """Commit and roll back on error (shared by background code outside the routers)."""
+    try:
+        s.commit()
+    except Exception:
+        try:
+            s.rollback()
+        except Exception:
+            pass
+        raise
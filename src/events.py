@@ -1,42 +1,276 @@
 from __future__ import annotations
 
 import asyncio
+import codecs
 import datetime as dt
 import json
+import os
 import re
 import time
+from collections import deque
 from collections.abc import AsyncIterator
 from typing import Any
 
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import select
 
-router = APIRouter(prefix="/stream", tags=["stream"])
-
-# === EventBus מינימלי לדוגמה (אפשר להחליף בבאסים הפנימי שלך) ===
-_event_queues: dict[str, asyncio.Queue[dict[str, Any]]] = {}
+from .db.session import get_session
+from .models.tasks import Task
+from .services.event_log import event_log
 
+router = APIRouter(prefix="/stream", tags=["stream"])
 
-def get_queue(task_id: str) -> asyncio.Queue[dict[str, Any]]:
-    q = _event_queues.get(task_id)
-    if q is None:
-        q = asyncio.Queue()
-        _event_queues[task_id] = q
-    return q
+# כמה זמן EventSource ממתין לפני חיבור מחדש (עם Last-Event-ID)
+RETRY_MS = int(os.getenv("LUCY_STREAM_RETRY_MS", "3000"))
+
+# === EventBus: fan-out לכל המנויים, buffer חסום לכל מנוי ===
+# כל task_id הוא topic וכל חיבור SSE הוא מנוי עם ring buffer משלו, כך שכל לקוח
+# מקבל את כל האירועים. מנוי איטי לא מעכב את האחרים: כשה-buffer שלו מלא, chunk
+# פלט מתמזג (coalesce) ל-chunk הקודם של אותו stream אם אפשר, ואחרת האירוע הישן
+# ביותר נזרק ונספר. topic קיים רק כל עוד יש לו מנויים — אחרי האירוע הסופי
+# המנויים יוצאים והמנוי האחרון מוחק אותו; פרסום ל-topic בלי מנויים לא נשמר.
+SUBSCRIBER_BUFFER = int(os.getenv("LUCY_STREAM_SUBSCRIBER_BUFFER", "256"))
+SLOW_CONSUMER_POLICY = os.getenv("LUCY_STREAM_SLOW_POLICY", "coalesce")  # coalesce | drop_oldest
+COALESCE_MAX_CHARS = int(os.getenv("LUCY_STREAM_COALESCE_MAX_CHARS", "65536"))
+
+
+class Subscription:
+    """מנוי אחד: ring buffer חסום + Event שמעיר את ה-stream."""
+
+    def __init__(self, topic: Topic, maxlen: int, policy: str) -> None:
+        self.topic = topic
+        self.maxlen = max(1, maxlen)
+        self.policy = policy
+        self.buf: deque[dict[str, Any]] = deque()
+        self.dropped = 0
+        self.coalesced = 0
+        # מנוי שכבר עיכב את ה-runner עד OUTPUT_MAX_WAIT לא מעכב אותו שוב עד שיתרוקן
+        self.lagging = False
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.buf)
+
+    def push(self, evt: dict[str, Any]) -> None:
+        if len(self.buf) >= self.maxlen:
+            if self._coalesce(evt):
+                return
+            self.buf.popleft()
+            self.dropped += 1
+        self.buf.append(evt)
+        self._ready.set()
+
+    def _coalesce(self, evt: dict[str, Any]) -> bool:
+        if self.policy != "coalesce" or evt["type"] != "output" or not self.buf:
+            return False
+        last = self.buf[-1]
+        if last["type"] != "output":
+            return False
+        a, b = last["data"], evt["data"]
+        if (a.get("run_id"), a.get("stream")) != (b.get("run_id"), b.get("stream")):
+            return False
+        if len(a.get("text", "")) + len(b.get("text", "")) > COALESCE_MAX_CHARS:
+            return False
+        # האירוע משותף לכל המנויים — בונים עותק ולא משנים אותו במקום
+        merged = {**a, "text": a.get("text", "") + b.get("text", "")}
+        if b.get("dropped_bytes"):
+            merged["dropped_bytes"] = a.get("dropped_bytes", 0) + b["dropped_bytes"]
+        # ה-id של ה-chunk האחרון שמוזג, כך ש-Last-Event-ID לא יחזיר אותו שוב
+        self.buf[-1] = {**last, "data": merged}
+        if "id" in evt:
+            self.buf[-1]["id"] = evt["id"]
+        self.coalesced += 1
+        return True
+
+    async def get(self, timeout: float) -> dict[str, Any]:
+        """האירוע הבא; TimeoutError אם לא הגיע אירוע תוך timeout."""
+        if not self.buf:
+            self._ready.clear()
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        evt = self.buf.popleft()
+        if not self.buf:
+            self.lagging = False
+        self.topic.drained.set()
+        return evt
+
+
+class Topic:
+    def __init__(self, task_id: str) -> None:
+        self.task_id = task_id
+        self.subscribers: set[Subscription] = set()
+        self.terminal: dict[str, Any] | None = None
+        self.drained = asyncio.Event()
+
+    async def wait_for_room(self, limit: int, timeout: float) -> None:
+        """backpressure: ממתין עד שלכל מנוי שעומד בקצב יש פחות מ-limit אירועים ממתינים."""
+        deadline = time.monotonic() + timeout
+        while True:
+            full = [s for s in self.subscribers if not s.lagging and len(s) >= limit]
+            if not full:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                for s in full:
+                    s.lagging = True
+                return
+            self.drained.clear()
+            try:
+                await asyncio.wait_for(self.drained.wait(), timeout=remaining)
+            except TimeoutError:
+                pass
+
+
+class EventBus:
+    def __init__(self, maxlen: int = SUBSCRIBER_BUFFER, policy: str = SLOW_CONSUMER_POLICY):
+        self.maxlen = maxlen
+        self.policy = policy
+        self.topics: dict[str, Topic] = {}
+        self.published = 0
+        # מונים של מנויים שכבר עזבו (של הפעילים נספרים ב-metrics)
+        self.dropped = 0
+        self.coalesced = 0
+
+    def subscribe(self, task_id: str) -> Subscription:
+        topic = self.topics.get(task_id)
+        if topic is None:
+            topic = self.topics[task_id] = Topic(task_id)
+        sub = Subscription(topic, self.maxlen, self.policy)
+        if topic.terminal is not None:
+            sub.push(topic.terminal)
+        topic.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        topic = sub.topic
+        topic.subscribers.discard(sub)
+        self.dropped += sub.dropped
+        self.coalesced += sub.coalesced
+        if not topic.subscribers and self.topics.get(topic.task_id) is topic:
+            del self.topics[topic.task_id]
+
+    def publish(self, task_id: str, evt: dict[str, Any]) -> int:
+        """מפיץ את evt לכל המנויים של task_id; מחזיר את מספר המנויים שקיבלו אותו."""
+        topic = self.topics.get(task_id)
+        if topic is None:
+            return 0
+        self.published += 1
+        for sub in topic.subscribers:
+            sub.push(evt)
+        if _event_is_terminal(task_id, evt):
+            topic.terminal = evt
+        return len(topic.subscribers)
+
+    def metrics(self) -> dict[str, Any]:
+        per_topic: dict[str, dict[str, Any]] = {}
+        for task_id, t in self.topics.items():
+            subs = list(t.subscribers)
+            per_topic[task_id] = {
+                "subscribers": len(subs),
+                "depth": sum(len(s) for s in subs),
+                "max_depth": max((len(s) for s in subs), default=0),
+                "dropped": sum(s.dropped for s in subs),
+                "coalesced": sum(s.coalesced for s in subs),
+                "lagging": sum(s.lagging for s in subs),
+                "terminal": t.terminal is not None,
+            }
+        return {
+            "policy": self.policy,
+            "buffer_size": self.maxlen,
+            "topics": len(per_topic),
+            "subscribers": sum(m["subscribers"] for m in per_topic.values()),
+            "published": self.published,
+            "dropped": self.dropped + sum(m["dropped"] for m in per_topic.values()),
+            "coalesced": self.coalesced + sum(m["coalesced"] for m in per_topic.values()),
+            "per_topic": per_topic,
+        }
+
+
+bus = EventBus()
+
+
+async def _publish(task_id: str, evt: dict[str, Any]) -> int:
+    """
+    מפיץ את evt למנויים. משימה שהיה לה מאזין אי-פעם נרשמת גם בלוג (evt מקבל id
+    לחידוש ה-stream); משימות שאף אחד לא צופה בהן לא משלמות על הלוג.
+    """
+    # גם משימה שיש לה מנויים כרגע: הסימון watched הולך לאיבוד ב-LRU של הלוג
+    if event_log.is_watched(task_id) or task_id in bus.topics:
+        evt = await event_log.record(task_id, evt, terminal=_event_is_terminal(task_id, evt))
+    return bus.publish(task_id, evt)
 
 
 async def publish_update(task_id: str, payload: dict[str, Any]) -> None:
-    await get_queue(task_id).put({"type": "update", "data": payload, "ts": time.time()})
+    await _publish(task_id, {"type": "update", "data": payload, "ts": time.time()})
 
 
 async def publish_done(task_id: str, payload: dict[str, Any]) -> None:
-    await get_queue(task_id).put({"type": "done", "data": payload, "ts": time.time()})
+    await _publish(task_id, {"type": "done", "data": payload, "ts": time.time()})
+
+
+# === פלט חי (output) עם backpressure ===
+# ה-runner ממתין (ולכן קורא לאט יותר מה-pipe) כל עוד למנוי כלשהו יש
+# OUTPUT_MAX_INFLIGHT chunks שטרם נשלחו, עד OUTPUT_MAX_WAIT. מנוי שלא התרוקן
+# בזמן מסומן lagging ומכאן מטופל לפי SLOW_CONSUMER_POLICY בלי לעכב את ההרצה.
+# הפלט המלא תמיד נשאר בקובץ הלוג של ה-run.
+OUTPUT_MAX_INFLIGHT = int(os.getenv("LUCY_STREAM_OUTPUT_INFLIGHT", "64"))
+OUTPUT_MAX_WAIT = float(os.getenv("LUCY_STREAM_OUTPUT_MAX_WAIT_SECONDS", "2.0"))
+
+
+async def publish_output(task_id: str, payload: dict[str, Any]) -> bool:
+    """
+    מפרסם chunk פלט; מחזיר False אם לא נשלח (אף אחד לא האזין למשימה).
+    מאזין שהתנתק יכול להתחבר מחדש ולהשלים מהלוג.
+    """
+    topic = bus.topics.get(task_id)
+    if topic is None and not event_log.is_watched(task_id):
+        return False
+    if topic is not None:
+        await topic.wait_for_room(OUTPUT_MAX_INFLIGHT, OUTPUT_MAX_WAIT)
+    await _publish(task_id, {"type": "output", "data": payload, "ts": time.time()})
+    return True
+
+
+class OutputPublisher:
+    """
+    הופך chunks גולמיים (מה-runner המקומי או מ-SSH) לאירועי output ב-SSE: פענוח
+    UTF-8 אינקרמנטלי (תו רב-בתי שנחתך בין chunks לא נשבר), seq רץ ו-offset בתוך
+    קובץ הלוג. chunks שלא נשלחו נספרים ומדווחים ב-dropped_bytes של האירוע הבא.
+    """
+
+    def __init__(self, task_id: str, run_id: str, action_id: str | None = None, **extra) -> None:
+        self.task_id = task_id
+        self.ids = {"run_id": run_id, "action_id": action_id, **extra}
+        self.seq = 0
+        self.offset = {"stdout": 0, "stderr": 0}
+        self.dropped = {"stdout": 0, "stderr": 0}
+        self.decoders = {
+            name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for name in ("stdout", "stderr")
+        }
+
+    async def __call__(self, stream: str, data: bytes) -> None:
+        payload = {
+            **self.ids,
+            "stream": stream,
+            "seq": self.seq,
+            "offset": self.offset[stream],
+            "text": self.decoders[stream].decode(data),
+        }
+        if self.dropped[stream]:
+            payload["dropped_bytes"] = self.dropped[stream]
+        self.seq += 1
+        self.offset[stream] += len(data)
+        if await publish_output(self.task_id, payload):
+            self.dropped[stream] = 0
+        else:
+            self.dropped[stream] += len(data)
 
 
 # === מודלים ===
 class TaskEvent(BaseModel):
-    type: str  # "heartbeat" | "update" | "done"
+    type: str  # "heartbeat" | "update" | "output" | "done"
     data: dict[str, Any] | str | None = None
     ts: float
 
@@ -46,15 +280,16 @@ def now_iso() -> str:
     return dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
 
-def sse_event(event: str, data: dict[str, Any] | None) -> bytes:
+def sse_event(event: str, data: dict[str, Any] | None, *, event_id: int | None = None) -> bytes:
     payload = "" if data is None else json.dumps(data, ensure_ascii=False, separators=(",", ":"))
-    out = f"event: {event}\n"
+    out = f"id: {event_id}\n" if event_id is not None else ""
+    out += f"event: {event}\n"
     out += f"data: {payload}\n\n"
     return out.encode("utf-8")
 
 
 # === נירמול נתונים שמגיעים מה-runner (גם אם הם repr של אובייקט) ===
-_STATUS_TERMINAL = {"SUCCEEDED", "FAILED", "CANCELLED"}
+_STATUS_TERMINAL = {"SUCCEEDED", "FAILED", "CANCELED", "CANCELLED"}
 _RE_STATUS = re.compile(
     r"status(?:=|:)\s*<[^>]*:\s*'([A-Z]+)'>|status(?:=|:)\s*'([A-Z]+)'", re.IGNORECASE
 )
@@ -92,57 +327,130 @@ def payload_is_terminal(data: dict[str, Any]) -> bool:
     return False
 
 
-async def _event_stream(task_id: str) -> AsyncIterator[bytes]:
-    queue = get_queue(task_id)
+def _event_is_terminal(task_id: str, evt: dict[str, Any]) -> bool:
+    if evt["type"] == "done":
+        return True
+    return evt["type"] == "update" and payload_is_terminal(
+        normalize_update_payload(task_id, evt.get("data"))
+    )
+
+
+def _task_finished(task_id: str) -> bool | None:
+    """האם המשימה (ב-DB הראשי) בסטטוס סופי; None — משימה שלא שם (למשל של lucy_agent)."""
+    with get_session() as s:
+        status = s.scalar(select(Task.status).where(Task.id == task_id))
+    if status is None:
+        return None
+    return status in _STATUS_TERMINAL or status == "REJECTED"
+
+
+def _render_event(task_id: str, evt: dict[str, Any]) -> tuple[list[bytes], bool]:
+    """אירוע מה-bus/מהלוג -> (אירועי SSE, האם זה סוף ה-stream)."""
+    evt_obj = TaskEvent(type=evt["type"], data=evt.get("data"), ts=evt["ts"])
+    eid = evt.get("id")
+
+    if evt_obj.type == "update":
+        norm = normalize_update_payload(task_id, evt_obj.data)
+        out = [sse_event("update", norm, event_id=eid)]
+        if payload_is_terminal(norm):
+            out.append(
+                sse_event(
+                    "done",
+                    {"task_id": task_id, "ts": now_iso(), "data": norm.get("data", {})},
+                )
+            )
+            return out, True
+        return out, False
+
+    if evt_obj.type == "output":
+        data = {"task_id": task_id, "ts": now_iso(), "data": evt_obj.data}
+        return [sse_event("output", data, event_id=eid)], False
+
+    if evt_obj.type == "done":
+        norm = {
+            "task_id": task_id,
+            "ts": now_iso(),
+            "data": (
+                evt_obj.data if isinstance(evt_obj.data, dict) else {"raw": str(evt_obj.data)}
+            ),
+        }
+        return [sse_event("done", norm, event_id=eid)], True
+
+    norm = {
+        "task_id": task_id,
+        "ts": now_iso(),
+        "data": {"raw": evt_obj.data, "note": "unknown_event_type"},
+    }
+    return [sse_event("update", norm, event_id=eid)], False
+
+
+async def _event_stream(task_id: str, last_event_id: int | None = None) -> AsyncIterator[bytes]:
+    """
+    זרם האירועים של משימה. עם last_event_id (מה-header Last-Event-ID) קודם נשלח
+    כל מה שפורסם אחריו מהלוג, ואז ממשיכים בשידור חי; בלי — רק שידור חי, ואם
+    המשימה כבר הסתיימה נשלח מיד האירוע הסופי שלה.
+    """
+    # נרשמים ל-bus לפני ה-replay כדי שלא ייפול אירוע בין השניים; כפילויות מסוננות לפי id
+    sub = bus.subscribe(task_id)
+    event_log.watch(task_id)
     heartbeat_interval = 15.0
     last_heartbeat = 0.0
+    reported_drops = 0
+    last_seq = last_event_id or 0
 
     try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
         # heartbeat ראשון מיידי
         yield sse_event("heartbeat", {"task_id": task_id, "ts": now_iso()})
         last_heartbeat = time.time()
 
+        if last_event_id is None:
+            tail = await event_log.last(task_id)
+            # done ישן בלוג לא מספיק: המשימה אולי רצה שוב מאז (והאירועים שלה לא נרשמו)
+            if (
+                tail is not None
+                and _event_is_terminal(task_id, tail)
+                and await asyncio.to_thread(_task_finished, task_id) is not False
+            ):
+                for chunk in _render_event(task_id, tail)[0]:
+                    yield chunk
+                return
+        else:
+            async for evt in event_log.replay(task_id, last_event_id):
+                last_seq = evt["id"]
+                chunks, end = _render_event(task_id, evt)
+                for chunk in chunks:
+                    yield chunk
+                if end:
+                    return
+
         while True:
             timeout = max(0.0, heartbeat_interval - (time.time() - last_heartbeat))
             try:
-                evt = await asyncio.wait_for(queue.get(), timeout=timeout)
-                evt_obj = TaskEvent(type=evt["type"], data=evt.get("data"), ts=evt["ts"])
-
-                if evt_obj.type == "update":
-                    norm = normalize_update_payload(task_id, evt_obj.data)
-                    yield sse_event("update", norm)
-                    if payload_is_terminal(norm):
-                        yield sse_event(
-                            "done",
-                            {
-                                "task_id": task_id,
-                                "ts": now_iso(),
-                                "data": norm.get("data", {}),
-                            },
-                        )
-                        break
-
-                elif evt_obj.type == "done":
-                    norm = {
-                        "task_id": task_id,
-                        "ts": now_iso(),
-                        "data": (
-                            evt_obj.data
-                            if isinstance(evt_obj.data, dict)
-                            else {"raw": str(evt_obj.data)}
-                        ),
-                    }
-                    yield sse_event("done", norm)
+                evt = await sub.get(timeout=timeout)
+                if evt.get("id", last_seq + 1) <= last_seq:
+                    continue  # כבר נשלח ב-replay
+                last_seq = evt.get("id", last_seq)
+
+                if sub.dropped > reported_drops:
+                    # הלקוח איטי מדי ואירועים נזרקו מה-buffer שלו; אפשר להשלים
+                    # אותם בחיבור מחדש עם Last-Event-ID
+                    yield sse_event(
+                        "dropped",
+                        {
+                            "task_id": task_id,
+                            "ts": now_iso(),
+                            "data": {"events": sub.dropped - reported_drops},
+                        },
+                    )
+                    reported_drops = sub.dropped
+
+                chunks, end = _render_event(task_id, evt)
+                for chunk in chunks:
+                    yield chunk
+                if end:
                     break
 
-                else:
-                    norm = {
-                        "task_id": task_id,
-                        "ts": now_iso(),
-                        "data": {"raw": evt_obj.data, "note": "unknown_event_type"},
-                    }
-                    yield sse_event("update", norm)
-
             except TimeoutError:
                 yield sse_event("heartbeat", {"task_id": task_id, "ts": now_iso()})
                 last_heartbeat = time.time()
@@ -152,15 +460,31 @@ async def _event_stream(task_id: str) -> AsyncIterator[bytes]:
         return
     except Exception:
         return
+    finally:
+        bus.unsubscribe(sub)
+
+
+def _parse_last_event_id(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+@router.get("/metrics")
+async def stream_metrics():
+    """עומק ה-buffers, אירועים שנזרקו/מוזגו, ומצב לוג האירועים (ring/DB)."""
+    return {**bus.metrics(), "event_log": event_log.metrics()}
 
 
 @router.get("/tasks/{task_id}")
 async def stream_task_events(request: Request, task_id: str):
     if not task_id:
         raise HTTPException(status_code=400, detail="task_id is required")
+    last_event_id = _parse_last_event_id(request.headers.get("last-event-id"))
 
     async def generator():
-        async for chunk in _event_stream(task_id):
+        async for chunk in _event_stream(task_id, last_event_id):
             if await request.is_disconnected():
                 break
             yield chunk
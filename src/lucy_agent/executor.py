@@ -1,7 +1,22 @@
 import asyncio
+import codecs
 import os
+import signal
+import tempfile
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO
+from uuid import uuid4
 
-from .redaction import redact
+from .redaction import StreamRedactor
+
+_CHUNK_BYTES = int(os.getenv("LUCY_EXEC_CHUNK_BYTES", "65536"))
+# כמה פלט (אחרי redaction) נשמר בזיכרון לכל stream; מעבר ל-_SPILL_BYTES הפלט
+# המלא עובר לקובץ ובזיכרון נשאר רק ה-tail של _RETAIN_BYTES
+_RETAIN_BYTES = int(os.getenv("LUCY_EXEC_RETAIN_BYTES", "65536"))
+_SPILL_BYTES = int(os.getenv("LUCY_EXEC_SPILL_BYTES", str(1024 * 1024)))
+_SPILL_DIR = os.getenv("LUCY_EXEC_SPILL_DIR", os.path.join(tempfile.gettempdir(), "lucy-exec"))
 
 
 def _env_merge(env: dict[str, str] | None) -> dict[str, str]:
@@ -17,25 +32,198 @@ def normalize_command(cmd: str | list[str]) -> list[str]:
     return cmd
 
 
+@dataclass
+class ShellChunk:
+    stream: str  # "stdout" | "stderr"
+    text: str  # כבר אחרי redaction
+
+
+@dataclass
+class _Capture:
+    """מצב של stream אחד: פענוח UTF-8 ו-redaction אינקרמנטליים, tail בזיכרון ו-spill לקובץ."""
+
+    name: str
+    retain: int
+    spill_at: int
+    spill_dir: str
+    decoder: codecs.IncrementalDecoder = field(
+        default_factory=lambda: codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    )
+    redactor: StreamRedactor = field(default_factory=StreamRedactor)
+    parts: list[str] = field(default_factory=list)
+    held: int = 0
+    total: int = 0  # bytes (UTF-8, אחרי redaction) — כגודל קובץ ה-spill
+    spill_path: str | None = None  # קבוע מראש (log_paths) — כל הפלט נכתב אליו מההתחלה
+    _spill: IO[str] | None = None
+
+    def feed(self, data: bytes, final: bool = False) -> str:
+        text = self.redactor.feed(self.decoder.decode(data, final))
+        if final:
+            text += self.redactor.flush()
+        if text:
+            self._keep(text)
+        return text
+
+    def _keep(self, text: str) -> None:
+        self.total += len(text.encode("utf-8"))
+        if self._spill is None and (self.spill_path or self.held + len(text) > self.spill_at):
+            if self.spill_path is None:
+                self.spill_path = os.path.join(self.spill_dir, f"{self.name}-{uuid4().hex}.log")
+            Path(self.spill_path).parent.mkdir(parents=True, exist_ok=True)
+            self._spill = open(self.spill_path, "w", encoding="utf-8")
+            self._spill.writelines(self.parts)
+        if self._spill is not None:
+            self._spill.write(text)
+        self.parts.append(text)
+        self.held += len(text)
+        limit = self.retain if self._spill is not None else self.spill_at
+        while self.held - len(self.parts[0]) >= limit:
+            self.held -= len(self.parts.pop(0))
+
+    def text(self) -> str:
+        out = "".join(self.parts)
+        return out[-self.retain :] if self._spill is not None else out
+
+    @property
+    def truncated(self) -> bool:
+        return self._spill is not None
+
+    def close(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+
+
+class ShellStream:
+    """
+    async iterator על הפלט של פקודה: ShellChunk לכל חלק (stdout/stderr, אחרי
+    redaction), בזמן הריצה. בסוף ה-iteration יש returncode, ו-stdout/stderr
+    מחזירים את מה שנשמר (הכול, או רק ה-tail אם הפלט עבר ל-spill_paths).
+    עם log_paths ({"stdout": path, ...}) הפלט של אותו stream נכתב כולו לקובץ
+    הנתון מההתחלה, ובזיכרון נשאר רק ה-tail.
+    ב-timeout, ביטול או יציאה מוקדמת מה-loop — כל קבוצת התהליכים נהרגת.
+    """
+
+    def __init__(
+        self,
+        cmd: str | list[str],
+        workdir: str | None = None,
+        env: dict[str, str] | None = None,
+        timeout: float = 600,
+        *,
+        retain_bytes: int = _RETAIN_BYTES,
+        spill_bytes: int = _SPILL_BYTES,
+        spill_dir: str = _SPILL_DIR,
+        log_paths: dict[str, str] | None = None,
+    ) -> None:
+        self.argv = normalize_command(cmd)
+        self.workdir = workdir
+        self.env = env
+        self.timeout = timeout
+        self.returncode: int | None = None
+        self._captures = {
+            name: _Capture(
+                name,
+                retain_bytes,
+                max(spill_bytes, retain_bytes),
+                spill_dir,
+                spill_path=(log_paths or {}).get(name),
+            )
+            for name in ("stdout", "stderr")
+        }
+
+    @property
+    def stdout(self) -> str:
+        return self._captures["stdout"].text()
+
+    @property
+    def stderr(self) -> str:
+        return self._captures["stderr"].text()
+
+    @property
+    def spill_paths(self) -> dict[str, str]:
+        return {n: c.spill_path for n, c in self._captures.items() if c.spill_path}
+
+    @property
+    def output_bytes(self) -> dict[str, int]:
+        return {n: c.total for n, c in self._captures.items()}
+
+    def __aiter__(self) -> AsyncIterator[ShellChunk]:
+        return self._run()
+
+    async def _read(self, stream: asyncio.StreamReader, cap: _Capture, queue: asyncio.Queue):
+        while data := await stream.read(_CHUNK_BYTES):
+            if text := cap.feed(data):
+                await queue.put(ShellChunk(cap.name, text))
+        if text := cap.feed(b"", final=True):
+            await queue.put(ShellChunk(cap.name, text))
+        await queue.put(None)
+
+    async def _run(self) -> AsyncIterator[ShellChunk]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        proc = await asyncio.create_subprocess_exec(
+            *self.argv,
+            cwd=self.workdir or None,
+            env=_env_merge(self.env),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        # queue חסום: צרכן איטי מאט את הקריאה מה-pipes (ולכן גם את התהליך)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+        readers = [
+            asyncio.create_task(self._read(proc.stdout, self._captures["stdout"], queue)),
+            asyncio.create_task(self._read(proc.stderr, self._captures["stderr"], queue)),
+        ]
+        try:
+            open_streams = 2
+            while open_streams:
+                item = await asyncio.wait_for(queue.get(), deadline - loop.time())
+                if item is None:
+                    open_streams -= 1
+                else:
+                    yield item
+            self.returncode = await asyncio.wait_for(proc.wait(), deadline - loop.time())
+        except BaseException:
+            # גם צאצאים של bash -lc (כל ה-session), לא רק התהליך הישיר
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            await proc.wait()
+            raise
+        finally:
+            for t in readers:
+                t.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            for cap in self._captures.values():
+                cap.close()
+
+
+def stream_shell(
+    cmd: str | list[str],
+    workdir: str | None = None,
+    env: dict[str, str] | None = None,
+    timeout: float = 600,
+    **limits,
+) -> ShellStream:
+    """`async for chunk in stream_shell(...)` — ראו ShellStream."""
+    return ShellStream(cmd, workdir, env, timeout, **limits)
+
+
 async def run_shell(
     cmd: str | list[str],
     workdir: str | None = None,
     env: dict[str, str] | None = None,
     timeout: int = 600,
+    **limits,
 ):
-    argv = normalize_command(cmd)
-    proc = await asyncio.create_subprocess_exec(
-        *argv,
-        cwd=workdir or None,
-        env=_env_merge(env),
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    try:
-        stdout_b, stderr_b = await asyncio.wait_for(proc.communicate(), timeout=timeout)
-    except TimeoutError:
-        proc.kill()
-        raise
-    stdout = stdout_b.decode(errors="ignore")
-    stderr = stderr_b.decode(errors="ignore")
-    return proc.returncode, redact(stdout), redact(stderr)
+    """
+    מריץ עד הסוף ומחזיר (returncode, stdout, stderr, spill_paths) — עם redaction,
+    בגודל חסום. פלט שעבר את סף ה-spill נמצא במלואו בקבצים שב-spill_paths; הם של
+    הקורא (קורא ומוחק).
+    """
+    stream = stream_shell(cmd, workdir, env, timeout, **limits)
+    async for _ in stream:
+        pass
+    return stream.returncode, stream.stdout, stream.stderr, stream.spill_paths
@@ -1,7 +1,21 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from pydantic import BaseModel
 
-app = FastAPI(title="Lucy Agent")
+from . import orchestrator
+from .routers import tasks as tasks_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # משימות שעדיין רצות נסגרות ב-CANCELED (והאירועים שלהן נכתבים) לפני היציאה
+    await orchestrator.shutdown()
+
+
+app = FastAPI(title="Lucy Agent", lifespan=lifespan)
+app.include_router(tasks_router.router)
 
 
 class Ping(BaseModel):
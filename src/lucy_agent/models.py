@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import JSON, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import JSON, DateTime, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -57,10 +57,13 @@ class Step(Base):
 
 class EventLog(Base):
     __tablename__ = "event_logs"
+    __table_args__ = (Index("ix_event_logs_task_seq", "task_id", "seq"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     task_id: Mapped[str] = mapped_column(String(64), index=True)
+    # מספר רץ בתוך המשימה = ה-id: של אירוע ה-SSE (Last-Event-ID)
+    seq: Mapped[int | None] = mapped_column(Integer, nullable=True)
     ts: Mapped[datetime] = mapped_column(DateTime, index=True)
     event_type: Mapped[str] = mapped_column(
         String(32)
-    )  # heartbeat | update | done | created | started
+    )  # heartbeat | update | output | done | created | started
     payload: Mapped[dict | None] = mapped_column(JSON)
@@ -1,118 +1,319 @@
 from __future__ import annotations
 
 import asyncio
+import os
+from collections.abc import Iterator
+from dataclasses import dataclass
 from datetime import UTC, datetime
 from typing import Any
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
 from sqlalchemy.orm import selectinload
 
-from .db import SessionLocal
-from .models import EventLog, RunStatus, Task as TaskORM
+from .db import DATA_DIR, SessionLocal
+from .executor import stream_shell
+from .models import EventLog, RunStatus, Step as StepORM, StepType, Task as TaskORM
 
 UTC = UTC
 
+# כמה צעדים רצים במקביל בכל התהליך (בכל המשימות יחד)
+_CONCURRENCY = int(os.getenv("LUCY_ORCH_CONCURRENCY", "8"))
+_slots = asyncio.Semaphore(_CONCURRENCY)
+_STEP_TIMEOUT_SEC = float(os.getenv("LUCY_ORCH_STEP_TIMEOUT_SECONDS", "600"))
+# הפלט המלא של כל צעד בקבצים; ב-Step.stdout/stderr נשמר רק ה-tail
+_OUTPUT_DIR = os.getenv("LUCY_ORCH_OUTPUT_DIR", os.path.join(DATA_DIR, "steps"))
+_TAIL_BYTES = int(os.getenv("LUCY_ORCH_TAIL_BYTES", "16384"))
+# עדכוני סטטוס ואירועים נאספים ונכתבים בקומיט אחד כל _FLUSH_MS (או כל _FLUSH_BATCH)
+_FLUSH_MS = int(os.getenv("LUCY_ORCH_FLUSH_MS", "250"))
+_FLUSH_BATCH = int(os.getenv("LUCY_ORCH_FLUSH_BATCH", "200"))
 
-async def _log(
-    session: AsyncSession, task_id: str, event_type: str, payload: dict[str, Any] | None
-):
-    session.add(
-        EventLog(
-            task_id=task_id,
-            ts=datetime.now(UTC),
-            event_type=event_type,
-            payload=payload or {},
+# המשימות שרצות כרגע בתהליך הזה, לביטול
+_running: dict[str, asyncio.Task] = {}
+
+
+def _now() -> datetime:
+    return datetime.now(UTC)
+
+
+class _Recorder:
+    """
+    כל הכתיבות של משימה אחת ל-DB: עדכוני steps/task ו-EventLog נאספים בזיכרון
+    (עדכונים לאותה שורה מתמזגים) ונכתבים ברקע ב-batch, בקומיט אחד.
+    """
+
+    def __init__(self, task_id: str, session_factory=None) -> None:
+        self.task_id = task_id
+        self._session_factory = session_factory or SessionLocal
+        self._task: dict[str, Any] = {}
+        self._steps: dict[str, dict[str, Any]] = {}
+        self._events: list[EventLog] = []
+        self._lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._eager: asyncio.Task | None = None
+        self.commits = 0
+        self.errors = 0
+
+    def task(self, **values: Any) -> None:
+        self._task.update(values)
+        self._schedule()
+
+    def step(self, step_id: str, **values: Any) -> None:
+        self._steps.setdefault(step_id, {}).update(values)
+        self._schedule()
+
+    def event(self, event_type: str, payload: dict[str, Any] | None = None) -> None:
+        self._events.append(
+            EventLog(task_id=self.task_id, ts=_now(), event_type=event_type, payload=payload or {})
         )
-    )
-    await session.flush()
+        self._schedule()
+
+    def _schedule(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._flusher is None:
+            self._flusher = loop.create_task(self._flush_later())
+        if len(self._events) + len(self._steps) >= _FLUSH_BATCH:
+            if self._eager is None or self._eager.done():
+                self._eager = loop.create_task(self._flush_quietly())
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(_FLUSH_MS / 1000)
+            await self._flush_quietly()
+        finally:
+            self._flusher = None
+        # מה שנאסף בזמן ה-flush (ה-_schedule שלו ראה flusher פעיל) או נשאר אחרי כשל
+        if self._task or self._steps or self._events:
+            self._schedule()
+
+    async def _flush_quietly(self) -> None:
+        # flush ברקע: כשל נספר והשורות נשארות ל-flush הבא
+        try:
+            await asyncio.shield(self.flush())
+        except Exception:
+            self.errors += 1
 
+    async def flush(self) -> None:
+        async with self._lock:
+            task, self._task = self._task, {}
+            steps, self._steps = self._steps, {}
+            events, self._events = self._events, []
+            if not (task or steps or events):
+                return
+            try:
+                async with self._session_factory() as session:
+                    if task:
+                        await session.execute(
+                            update(TaskORM).where(TaskORM.id == self.task_id).values(**task)
+                        )
+                    for step_id, values in steps.items():
+                        await session.execute(
+                            update(StepORM).where(StepORM.id == step_id).values(**values)
+                        )
+                    session.add_all(events)
+                    await session.commit()
+            except BaseException:
+                # מחזירים את ה-batch לפני מה שנאסף בינתיים
+                self._task = {**task, **self._task}
+                for step_id, values in self._steps.items():
+                    steps[step_id] = {**steps.get(step_id, {}), **values}
+                self._steps = steps
+                self._events = events + self._events
+                raise
+            self.commits += 1
 
-async def run_task(task_id: str):
-    """מריץ משימה (כרגע צעד shell אחד), מעדכן סטטוסים ושומר לוגים ב־DB."""
-    async with SessionLocal() as session:
-        # טען משימה + steps
+    async def close(self) -> None:
+        """כותב את כל מה שנשאר (סוף המשימה); גם כשהמשימה עצמה בוטלה."""
+        for t in (self._flusher, self._eager):
+            if t is not None and not t.done():
+                t.cancel()
+        await asyncio.shield(self.flush())
+
+
+@dataclass
+class _StepRun:
+    id: str
+    type: str
+    params: dict[str, Any]
+    status: str = RunStatus.pending.value
+
+
+def _stages(steps: list[_StepRun]) -> Iterator[list[_StepRun]]:
+    """צעדים רצופים עם אותו params["group"] רצים יחד; צעד בלי group — לבד."""
+    stage: list[_StepRun] = []
+    for step in steps:
+        group = step.params.get("group")
+        if stage and (group is None or group != stage[0].params.get("group")):
+            yield stage
+            stage = []
+        stage.append(step)
+    if stage:
+        yield stage
+
+
+def _tail(text: str, total: int, path: str | None) -> str:
+    shown = len(text.encode("utf-8"))
+    if total <= shown:
+        return text
+    return f"... [{total - shown} bytes truncated, full output: {path}] ...\n{text}"
+
+
+async def _run_step(rec: _Recorder, step: _StepRun) -> None:
+    async with _slots:
+        step.status = RunStatus.running.value
+        rec.step(step.id, status=step.status, started_at=_now())
+        rec.event("update", {"step_id": step.id, "status": step.status})
+        if step.type != StepType.shell.value:
+            step.status = RunStatus.failed.value
+            rec.step(step.id, status=step.status, ended_at=_now())
+            rec.event(
+                "update",
+                {"step_id": step.id, "status": step.status, "error": f"unsupported: {step.type}"},
+            )
+            return
+
+        base = os.path.join(_OUTPUT_DIR, rec.task_id, step.id)
+        cmd = step.params.get("cmd", "")
+        stream = stream_shell(
+            # כמו create_subprocess_shell: sh -c (לא bash -lc של ה-executor, בלי profile)
+            ["sh", "-c", cmd] if isinstance(cmd, str) else cmd,
+            step.params.get("workdir"),
+            step.params.get("env"),
+            float(step.params.get("timeout", _STEP_TIMEOUT_SEC)),
+            retain_bytes=_TAIL_BYTES,
+            log_paths={"stdout": f"{base}.stdout.log", "stderr": f"{base}.stderr.log"},
+        )
+        error = None
+        try:
+            async for _ in stream:
+                pass
+            step.status = (
+                RunStatus.succeeded.value if stream.returncode == 0 else RunStatus.failed.value
+            )
+        except TimeoutError:
+            step.status, error = RunStatus.failed.value, "timed out"
+        except asyncio.CancelledError:
+            step.status = RunStatus.canceled.value
+            raise
+        except Exception as e:
+            step.status, error = RunStatus.failed.value, str(e)
+        finally:
+            sizes, paths = stream.output_bytes, stream.spill_paths
+            rec.step(
+                step.id,
+                status=step.status,
+                ended_at=_now(),
+                exit_code=stream.returncode,
+                stdout=_tail(stream.stdout, sizes["stdout"], paths.get("stdout")),
+                stderr=_tail(stream.stderr, sizes["stderr"], paths.get("stderr")),
+            )
+            payload = {
+                "step_id": step.id,
+                "exit_code": stream.returncode,
+                "stdout_len": sizes["stdout"],
+                "stderr_len": sizes["stderr"],
+                "stdout_path": paths.get("stdout"),
+                "stderr_path": paths.get("stderr"),
+                "status": step.status,
+            }
+            if error:
+                payload["error"] = error
+            rec.event("update", payload)
+
+
+async def run_task(task_id: str, *, session_factory=None):
+    """
+    מריץ את כל ה-steps של המשימה לפי הסדר; צעדים רצופים עם אותו params["group"]
+    רצים במקביל (כולם תחת _slots הגלובלי). צעד שנכשל עוצר את ההמשך, אלא אם יש לו
+    params["continue_on_error"]. סטטוסים ולוגים נכתבים ל-DB ב-batch.
+    """
+    session_factory = session_factory or SessionLocal
+    async with session_factory() as session:
         res = await session.execute(
             select(TaskORM).options(selectinload(TaskORM.steps)).where(TaskORM.id == task_id)
         )
         task = res.scalar_one_or_none()
         if not task:
             return
+        title = task.title
+        steps = [_StepRun(s.id, s.type, dict(s.params or {})) for s in task.steps]
 
-        # התחלת משימה
-        task.status = RunStatus.running.value
-        task.started_at = datetime.now(UTC)
-        await _log(session, task_id, "started", {"status": task.status})
-        await session.commit()
-
-        if not task.steps:
-            task.status = RunStatus.failed.value
-            task.ended_at = datetime.now(UTC)
-            await _log(session, task_id, "done", {"status": task.status, "error": "no steps"})
-            await session.commit()
-            return
+    rec = _Recorder(task_id, session_factory)
+    status = RunStatus.running.value
+    rec.task(status=status, started_at=_now())
+    rec.event("started", {"status": status})
+    error = None
+    try:
+        if not steps:
+            status, error = RunStatus.failed.value, "no steps"
+        for stage in _stages(steps):
+            await asyncio.gather(*(_run_step(rec, s) for s in stage))
+            failed = [s for s in stage if s.status != RunStatus.succeeded.value]
+            if failed:
+                status = RunStatus.failed.value
+                if not all(s.params.get("continue_on_error") for s in failed):
+                    break
+        else:
+            if status == RunStatus.running.value:
+                status = RunStatus.succeeded.value
+    except asyncio.CancelledError:
+        status = RunStatus.canceled.value
+        raise
+    except Exception as e:
+        status, error = RunStatus.failed.value, str(e)
+    finally:
+        if status == RunStatus.running.value:
+            status = RunStatus.failed.value
+        # צעדים שלא רצו (אחרי כישלון או ביטול)
+        for s in steps:
+            if s.status in (RunStatus.pending.value, RunStatus.running.value):
+                s.status = RunStatus.canceled.value
+                rec.step(s.id, status=s.status, ended_at=_now())
+        rec.task(status=status, ended_at=_now())
+        done: dict[str, Any] = {
+            "status": status,
+            "result": {"task_id": task_id, "title": title, "status": status},
+        }
+        if error:
+            done["error"] = error
+        rec.event("done", done)
+        await rec.close()
 
-        step = task.steps[0]
-        step.status = RunStatus.running.value
-        step.started_at = datetime.now(UTC)
-        await session.commit()
 
-        cmd = (step.params or {}).get("cmd", "")
-        try:
-            proc = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
+def is_running(task_id: str) -> bool:
+    running = _running.get(task_id)
+    return running is not None and not running.done()
 
-            await _log(session, task_id, "heartbeat", {"step_id": step.id})
-            await session.commit()
 
-            stdout_b, stderr_b = await proc.communicate()
-            step.exit_code = proc.returncode
-            step.stdout = (stdout_b or b"").decode(errors="replace")
-            step.stderr = (stderr_b or b"").decode(errors="replace")
-            step.ended_at = datetime.now(UTC)
-            step.status = (
-                RunStatus.succeeded.value if proc.returncode == 0 else RunStatus.failed.value
-            )
+def start_task(task_id: str) -> asyncio.Task:
+    """מריץ את המשימה ברקע (פעם אחת לכל task_id) וזוכר אותה לביטול."""
+    if is_running(task_id):
+        return _running[task_id]
+    t = asyncio.get_running_loop().create_task(run_task(task_id))
+    _running[task_id] = t
 
-            task.status = step.status
-            task.ended_at = datetime.now(UTC)
+    def _forget(done: asyncio.Task) -> None:
+        if _running.get(task_id) is done:
+            del _running[task_id]
 
-            await _log(
-                session,
-                task_id,
-                "update",
-                {
-                    "step_id": step.id,
-                    "exit_code": step.exit_code,
-                    "stdout_len": len(step.stdout or ""),
-                    "stderr_len": len(step.stderr or ""),
-                    "status": step.status,
-                },
-            )
-            await session.commit()
-
-            await _log(
-                session,
-                task_id,
-                "done",
-                {
-                    "status": task.status,
-                    "result": {
-                        "task_id": task.id,
-                        "title": task.title,
-                        "status": task.status,
-                    },
-                },
-            )
-            await session.commit()
+    t.add_done_callback(_forget)
+    return t
 
-        except Exception as e:
-            step.status = RunStatus.failed.value
-            step.ended_at = datetime.now(UTC)
-            task.status = RunStatus.failed.value
-            task.ended_at = datetime.now(UTC)
-            await _log(session, task_id, "done", {"status": task.status, "error": str(e)})
-            await session.commit()
+
+def cancel_task(task_id: str) -> bool:
+    """
+    מבטל משימה שרצה: הצעדים הפעילים נהרגים (כל קבוצת התהליכים), השאר מסומנים
+    CANCELED, והמשימה נגמרת ב-CANCELED עם אירוע done. False אם היא לא רצה כאן.
+    """
+    running = _running.get(task_id)
+    if running is None or running.done():
+        return False
+    running.cancel()
+    return True
+
+
+async def shutdown() -> None:
+    """shutdown: כל המשימות שרצות מבוטלות ונסגרות ב-CANCELED (עם done ב-DB)."""
+    tasks = [t for t in _running.values() if not t.done()]
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
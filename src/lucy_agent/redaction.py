@@ -1,15 +1,202 @@
+import os
 import re
+from collections.abc import Iterable, Iterator
 
-SECRET_PATTERNS = [
-    re.compile(r"(?i)(x-api-key|authorization|password|passphrase|token)\s*[:=]\s*([^\s]+)"),
-    re.compile(r"(?i)(AGENT_API_KEY)=([^\s]+)"),
-]
+# מפתחות שהערך שאחריהם (key=value / key: value) מוסתר; כולל השדות ש-/ssh מסתיר
+# בלוג (private_key, private_key_path) ו-token (גם X-Token / WAHA_TOKEN של WAHA)
+SECRET_KEYS = (
+    "x-api-key",
+    "authorization",
+    "password",
+    "passphrase",
+    "token",
+    "private_key",
+    "private_key_path",
+    "agent_api_key",
+)
+# מפתחות נוספים (מופרדים בפסיק), ומשתני סביבה שהערך שלהם עצמו הוא סוד שמוסתר בכל מקום
+_EXTRA_KEYS = os.getenv("LUCY_REDACT_KEYS", "")
+_SECRET_ENV = os.getenv("LUCY_REDACT_ENV", "AGENT_API_KEY,WAHA_TOKEN")
+# ערך קצר מזה לא מוסתר כליטרל (אחרת כל מופע של "abc" בפלט היה נמחק)
+_MIN_VALUE_LEN = 8
+
+_PEM_BEGIN = "-----BEGIN"
+_PEM_BEGIN_RE = re.compile(re.escape(_PEM_BEGIN), re.IGNORECASE)
+_PEM_HEADER_RE = re.compile(r"-----BEGIN [A-Z ]*PRIVATE KEY-----", re.IGNORECASE)
+
+
+class Redactor:
+    """
+    כל הדפוסים מקומפלים ל-regex אחד (alternation). הוא לא סורק את כל הטקסט:
+    prefilter ליטרלי (lowercase + find על מילות המפתח, בקוד C) מוצא את המקומות
+    שבהם התאמה יכולה להתחיל, וה-regex מורץ רק שם (match מעוגן). טקסט בלי אף
+    מילת מפתח חוזר כמו שהוא.
+    """
+
+    def __init__(self, keys: Iterable[str] = SECRET_KEYS, values: Iterable[str] = ()) -> None:
+        keys = sorted({k.lower() for k in keys if k}, key=len, reverse=True)
+        values = sorted({v for v in values if len(v) >= _MIN_VALUE_LEN}, key=len, reverse=True)
+        alts = [
+            # Bearer/Basic הם חלק מהערך — אחרת ה-credential עצמו נשאר גלוי
+            r"(?P<key>" + "|".join(map(re.escape, keys)) + r")\s*[:=]\s*"
+            r"(?:(?:bearer|basic)[ \t]+)?[^\s]+",
+            r"(?P<pem>-----BEGIN [A-Z ]*PRIVATE KEY-----.*?-----END [A-Z ]*PRIVATE KEY-----)",
+        ]
+        if values:
+            alts.append(r"(?-i:" + "|".join(map(re.escape, values)) + ")")
+        self.pattern = re.compile("|".join(alts), re.IGNORECASE | re.DOTALL)
+        self._keys = tuple(keys) + (_PEM_BEGIN.lower(),)
+        self._values = tuple(values)
+
+    def matches(self, text: str) -> Iterator[re.Match[str]]:
+        """ההתאמות ב-text, משמאל לימין ובלי חפיפה — כמו finditer של pattern."""
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # lower() ששינה אורך (למשל İ) — המיקומים לא תואמים; סריקה מלאה
+            yield from self.pattern.finditer(text)
+            return
+        starts: set[int] = set()
+        for needles, hay in ((self._keys, lowered), (self._values, text)):
+            for needle in needles:
+                i = hay.find(needle)
+                while i >= 0:
+                    starts.add(i)
+                    i = hay.find(needle, i + 1)
+        end = 0
+        for pos in sorted(starts):
+            if pos < end:
+                continue
+            m = self.pattern.match(text, pos)
+            if m is not None:
+                end = m.end()
+                yield m
+
+    @staticmethod
+    def _replace(m: re.Match[str]) -> str:
+        if m.group("key") is not None:
+            return f"{m.group('key')}=<REDACTED>"
+        if m.group("pem") is not None:
+            return "<REDACTED PRIVATE KEY>"
+        return "<REDACTED>"
+
+    def substitute(self, text: str, matches: Iterable[re.Match[str]]) -> str:
+        parts, last = [], 0
+        for m in matches:
+            parts += (text[last : m.start()], self._replace(m))
+            last = m.end()
+        if not parts:
+            return text
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def redact(self, text: str) -> str:
+        if not text:
+            return text
+        # prefilter: רוב שורות הלוג לא מכילות אף מילת מפתח
+        lowered = text.lower()
+        for needle in self._keys:
+            if needle in lowered:
+                return self.substitute(text, self.matches(text))
+        for needle in self._values:
+            if needle in text:
+                return self.substitute(text, self.matches(text))
+        return text
+
+
+def _configured() -> Redactor:
+    keys = SECRET_KEYS + tuple(k.strip() for k in _EXTRA_KEYS.split(",") if k.strip())
+    values = (os.getenv(name.strip(), "") for name in _SECRET_ENV.split(",") if name.strip())
+    return Redactor(keys, (v for v in values if not any(c.isspace() for c in v)))
+
+
+_default = _configured()
+SECRET_PATTERNS = [_default.pattern]
 
 
 def redact(text: str | None) -> str | None:
     if text is None:
         return None
-    redacted = text
-    for pat in SECRET_PATTERNS:
-        redacted = pat.sub(lambda m: f"{m.group(1)}=<REDACTED>", redacted)
-    return redacted
+    return _default.redact(text)
+
+
+class StreamRedactor:
+    """
+    redact על טקסט שמגיע בחלקים. הסוף של כל chunk (עד window תווים, או מתחילת
+    התאמה שעדיין יכולה להמשיך) נשמר ל-chunk הבא, כך שסוד שנחתך בין chunks עדיין
+    מוסתר (window צריך להיות ארוך מהמפתח+המפריד הארוך ביותר). מעבר ל-max_carry
+    הטקסט יוצא בכוח; אם נחתך באמצע ערך של סוד, המשך הערך ב-chunk הבא נזרק.
+    """
+
+    def __init__(
+        self, window: int = 1024, max_carry: int = 65536, redactor: Redactor | None = None
+    ) -> None:
+        self.window = window
+        self.max_carry = max_carry
+        self.redactor = redactor or _default
+        self._buf = ""
+        self._skip_value = False
+
+    def feed(self, text: str) -> str:
+        if self._skip_value:
+            # המשך של ערך סודי שכבר הוסתר ונחתך ביציאה הכפויה — עד הרווח הראשון
+            i = next((n for n, c in enumerate(text) if c.isspace()), None)
+            if i is None:
+                return ""
+            text, self._skip_value = text[i:], False
+        self._buf += text
+        # עד סוף השורה האחרונה אפשר לשחרר מיד (פלט חי), אלא אם השורה נגמרת
+        # במפתח או במפריד (password\n: <value>); אחרת — הכול חוץ מ-window התווים האחרונים
+        nl = self._buf.rfind("\n") + 1
+        cut = len(self._buf) - self.window
+        if nl > cut and not self._open_line(self._buf[:nl]):
+            cut = nl
+        if cut <= 0:
+            return ""
+        cut = self._before_open_key(cut)
+        done: list[re.Match[str]] = []
+        open_match = False
+        for m in self.redactor.matches(self._buf):
+            if m.start() >= cut:
+                break
+            if m.end() > cut or m.end() == len(self._buf):
+                cut, open_match = m.start(), m.end() == len(self._buf)
+                break
+            done.append(m)
+        if cut <= 0 and len(self._buf) > self.max_carry:
+            # התאמה אחת ארוכה מ-max_carry (ערך בלי רווחים) — מוסתרת ויוצאת בכוח
+            out, self._buf = self.redactor.redact(self._buf), ""
+            self._skip_value = open_match
+            return out
+        if cut <= 0:
+            return ""
+        out, self._buf = self._buf[:cut], self._buf[cut:]
+        return self.redactor.substitute(out, done)
+
+    def _open_line(self, head: str) -> bool:
+        """השורה האחרונה ב-head יכולה להמשיך להתאמה בשורה הבאה (key / key: / key=)."""
+        tail = head.rstrip().lower()
+        return tail.endswith((":", "=")) or tail.endswith(self.redactor._keys)
+
+    def _before_open_key(self, cut: int) -> int:
+        """
+        private key שה-END המלא שלו עוד לא הגיע נשמר כולו מה-BEGIN (עד max_carry):
+        END חלקי ("-----END OPENSSH PRI") עדיין לא סוגר את ההתאמה.
+        """
+        pos = 0
+        while (begin := _PEM_BEGIN_RE.search(self._buf, pos)) is not None:
+            if begin.start() >= cut:
+                break
+            m = self.redactor.pattern.match(self._buf, begin.start())
+            if m is not None and m.group("pem") is not None:
+                pos = m.end()
+                continue
+            line_end = self._buf.find("\n", begin.start())
+            # header שלם שאינו private key (למשל CERTIFICATE) — לא מחכים לו
+            if line_end < 0 or _PEM_HEADER_RE.match(self._buf, begin.start()):
+                return begin.start()
+            pos = begin.end()
+        return cut
+
+    def flush(self) -> str:
+        out, self._buf, self._skip_value = self._buf, "", False
+        return self.redactor.redact(out) if out else ""
@@ -0,0 +1,34 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import orchestrator
+from ..db import get_session
+from ..models import RunStatus, Task as TaskORM
+from ..security import require_api_key
+
+router = APIRouter(
+    prefix="/tasks",
+    tags=["tasks"],
+    dependencies=[Depends(require_api_key)],
+)
+
+
+@router.post("/{task_id}/run", status_code=202)
+async def run_task(task_id: str, session: Annotated[AsyncSession, Depends(get_session)]):
+    """מתחיל את המשימה ברקע; הסטטוס והפלט מגיעים ב-DB (steps, event_logs)."""
+    if await session.get(TaskORM, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if orchestrator.is_running(task_id):
+        raise HTTPException(status_code=409, detail="Task is already running")
+    orchestrator.start_task(task_id)
+    return {"task_id": task_id, "status": RunStatus.running.value}
+
+
+@router.post("/{task_id}/cancel", status_code=202)
+async def cancel_task(task_id: str):
+    """הצעדים הפעילים נהרגים והמשימה נסגרת ב-CANCELED (ברקע)."""
+    if not orchestrator.cancel_task(task_id):
+        raise HTTPException(status_code=409, detail="Task is not running")
+    return {"task_id": task_id, "status": RunStatus.canceled.value}
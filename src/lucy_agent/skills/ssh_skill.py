@@ -1,37 +1,28 @@
 from __future__ import annotations
 
-import io
+import asyncio
+import os
+import threading
+from collections.abc import Coroutine
+from typing import Any
 
-import paramiko
+from ...services.ssh_pool import SshConnectionPool, pool as shared_pool, ssh_target
+from ...services.ssh_runner import run_remote_to_files
 
+# מכל stream נשמר רק הסוף שלו (job ארוך לא ממלא את הזיכרון)
+_TAIL_BYTES = int(os.getenv("LUCY_SSH_OUTPUT_TAIL_BYTES", "16384"))
 
-def _load_pkey(private_key: str, passphrase: str | None = None) -> paramiko.PKey:
+
+class AsyncSSHSkill:
     """
-    מנסה לטעון מפתח פרטי מכל הסוגים הנפוצים לפי סדר:
-    Ed25519 -> RSA -> ECDSA -> DSS
+    SSH אסינכרוני: חיבורים מה-pool (handshake אחד לכמה פקודות), מפתחות פרטיים
+    מפוענחים פעם אחת (cache לפי hash של ה-PEM) ו-known_hosts מפוענח מה-cache.
     """
-    buf = io.StringIO(private_key)
-    try:
-        buf.seek(0)
-        return paramiko.Ed25519Key.from_private_key(buf, password=passphrase)
-    except Exception:
-        pass
-    try:
-        buf.seek(0)
-        return paramiko.RSAKey.from_private_key(buf, password=passphrase)
-    except Exception:
-        pass
-    try:
-        buf.seek(0)
-        return paramiko.ECDSAKey.from_private_key(buf, password=passphrase)
-    except Exception:
-        pass
-    buf.seek(0)
-    return paramiko.DSSKey.from_private_key(buf, password=passphrase)
 
+    def __init__(self, pool: SshConnectionPool | None = None) -> None:
+        self.pool = pool or shared_pool
 
-class SSHSkill:
-    def run(
+    async def run(
         self,
         host: str,
         user: str,
@@ -41,26 +32,84 @@ class SSHSkill:
         private_key: str | None = None,
         passphrase: str | None = None,
         timeout: int = 600,
+        known_hosts: str | None = None,
     ) -> tuple[int, str, str]:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        pkey = _load_pkey(private_key, passphrase) if private_key else None
-
-        client.connect(
-            hostname=host,
-            port=port,
-            username=user,
+        """
+        known_hosts: נתיב לקובץ; בלי — כל host key מתקבל (כמו AutoAddPolicy עד כה).
+        מחזיר (exit code, stdout, stderr) — מכל stream רק ה-_TAIL_BYTES האחרונים.
+        """
+        key, options = ssh_target(
+            host,
+            port,
+            user,
             password=password,
-            pkey=pkey,
+            private_key=private_key,
+            passphrase=passphrase,
+            known_hosts=known_hosts,
             timeout=timeout,
-            look_for_keys=False,
-            allow_agent=False,
         )
+        async with self.pool.connection(key, options, timeout=timeout) as conn:
+            res = await run_remote_to_files(
+                conn, cmd, None, None, timeout=timeout, tail_bytes=_TAIL_BYTES
+            )
+        rc = res.exit_status if res.exit_status is not None else -1
+        return rc, res.stdout.text(), res.stderr.text()
+
+
+class _LoopThread:
+    """event loop ב-thread ייעודי: ה-executor של ה-facade הסינכרוני ובעלי ה-pool שלו."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def submit(self, coro: Coroutine[Any, Any, Any], timeout: float | None = None) -> Any:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="lucy-ssh", daemon=True
+                ).start()
+        fut = asyncio.run_coroutine_threadsafe(coro, self._loop)
         try:
-            stdin, stdout, stderr = client.exec_command(cmd, timeout=timeout)
-            rc = stdout.channel.recv_exit_status()
-            out = stdout.read().decode(errors="ignore")
-            err = stderr.read().decode(errors="ignore")
-            return rc, out, err
-        finally:
-            client.close()
+            return fut.result(timeout)
+        except BaseException:
+            fut.cancel()
+            raise
+
+
+_executor = _LoopThread()
+
+
+class SSHSkill:
+    """
+    Facade סינכרוני ל-AsyncSSHSkill, באותה חתימה כמו קודם. הפקודה רצה על event
+    loop ב-thread ייעודי (עם pool חיבורים משלו), כך שהקורא לא פותח חיבור חדש
+    בכל קריאה. מתוך קוד async יש לקרוא ל-AsyncSSHSkill ישירות.
+    """
+
+    _skill: AsyncSSHSkill | None = None
+
+    @classmethod
+    def _async_skill(cls) -> AsyncSSHSkill:
+        if cls._skill is None:
+            cls._skill = AsyncSSHSkill(SshConnectionPool())
+        return cls._skill
+
+    def run(
+        self,
+        host: str,
+        user: str,
+        cmd: str,
+        port: int = 22,
+        password: str | None = None,
+        private_key: str | None = None,
+        passphrase: str | None = None,
+        timeout: int = 600,
+        known_hosts: str | None = None,
+    ) -> tuple[int, str, str]:
+        coro = self._async_skill().run(
+            host, user, cmd, port, password, private_key, passphrase, timeout, known_hosts
+        )
+        # מרווח קטן מעבר ל-timeout של הפקודה, ל-handshake ולסגירת ה-channel
+        return _executor.submit(coro, timeout + 5)
@@ -1,10 +1,41 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 
-from .routers.tasks import router as tasks_router
+from .actions import router as actions_router
+from .db import close_action_log, start_action_log
+from .events import router as stream_router
+from .routers.tasks import router as tasks_router, runs_router
+from .services.engine import engine
+from .services.event_log import event_log
+from .services.http_pool import pool as http_pool
+from .services.job_queue import WORKERS as QUEUE_WORKERS, start_workers, stop_workers
+from .services.ssh_pool import pool as ssh_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    http_pool.start()
+    # task_log של ה-actions: חיבור אחד וכתיבה ב-batch; ב-shutdown נכתב מה שנשאר בתור
+    await start_action_log()
+    # workers של התור העמיד (mode=queue) כתהליכים נפרדים — ההרצות לא על ה-loop של ה-API
+    workers = start_workers(QUEUE_WORKERS) if QUEUE_WORKERS > 0 else []
+    yield
+    if workers:
+        await asyncio.to_thread(stop_workers, workers)
+    # הרצות ברקע שעדיין פתוחות — מבוטלות ומסומנות CANCELED
+    await engine.shutdown()
+    # מה שנשאר ב-rings של לוג האירועים נכתב ל-DB (חידוש streams אחרי restart)
+    await event_log.close()
+    await close_action_log()
+    await http_pool.close()
+    await ssh_pool.close()
+
 
 # === בריאות בסיסית ===
-app = FastAPI(title="Lucy Agent API", version="0.1.0")
+app = FastAPI(title="Lucy Agent API", version="0.1.0", lifespan=lifespan)
 
 
 @app.get("/health", summary="Health")
@@ -16,3 +47,6 @@ def health():
 # חשוב: זה ה־router שמגדיר /tasks עם actions (לא steps)
 
 app.include_router(tasks_router)
+app.include_router(runs_router)
+app.include_router(actions_router)
+app.include_router(stream_router)
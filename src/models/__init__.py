@@ -8,7 +8,9 @@ We try common module names and fall back gracefully.
 
 from importlib import import_module
 
-__all__ = ["Task", "Run", "Action", "AuditLog"]
+from .actions import ActionRequest, ActionResult, EchoRequest
+
+__all__ = ["Task", "Run", "Action", "AuditLog", "ActionRequest", "ActionResult", "EchoRequest"]
 
 
 def _try(paths):
@@ -0,0 +1,22 @@
+"""request/response של ה-actions (/http, /ssh, /shell ...)."""
+
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+
+class ActionRequest(BaseModel):
+    action: str | None = None
+    params: dict[str, Any] = Field(default_factory=dict)
+
+
+class EchoRequest(BaseModel):
+    text: str = ""
+
+
+class ActionResult(BaseModel):
+    # ssh מחזיר bool; http/shell/waha/gads מחזירים "ok"/"error" (כמו שהיה מההתחלה)
+    status: bool | str
+    output: str = ""
+    error: str | None = None
+    details: dict[str, Any] | None = None
@@ -68,6 +68,9 @@ class Task(Base):
         "Action", back_populates="task", cascade="all, delete-orphan"
     )
     audits: Mapped[list[AuditLog]] = relationship("AuditLog", back_populates="task")
+    approvals: Mapped[list[Approval]] = relationship(
+        "Approval", back_populates="task", order_by="Approval.created_at"
+    )
 
     __table_args__ = (
         CheckConstraint(
@@ -142,7 +145,7 @@ class Approval(Base):
     created_at: Mapped[str] = mapped_column(String, nullable=False, default=now_iso)
     expires_at: Mapped[str | None] = mapped_column(String)
 
-    task: Mapped[Task] = relationship("Task")
+    task: Mapped[Task] = relationship("Task", back_populates="approvals")
 
     __table_args__ = (
         CheckConstraint(
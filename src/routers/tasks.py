@@ -1,29 +1,41 @@
 from __future__ import annotations
 
+import base64
+import heapq
 import json
 import os
-import subprocess
 import time
+from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
-from typing import Any, Literal
+from typing import Annotated, Any, Literal
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel, Field
-from sqlalchemy import func, select
+from sqlalchemy import case, func, literal_column, select, tuple_, update
 from sqlalchemy.inspection import inspect as sa_inspect
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.concurrency import run_in_threadpool
 
 from ..db.session import get_session
+from ..events import publish_done
 from ..models.tasks import (
     Action,
     Approval,
     AuditLog,
     Run,
+    RunStatus,
     Task,
     TaskStatus,
     now_iso,
 )
-from ..services.audit import write_audit
+from ..services.audit import build_audit, write_audit
+from ..services.engine import _DEP_FAILED, BatchRecorder, RunJob, engine
+from ..services.job_queue import queue_meta, request_cancel
+from ..services.runner import tail_bytes as _tail_bytes
+from ..services.scheduler import build_graph
 
 
 def _fix_timeout_semantics(result):
@@ -90,12 +102,16 @@ def _fix_timeout_semantics(result):
 
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
+runs_router = APIRouter(prefix="/runs", tags=["runs"])
 
 
 # ===== Schemas =====
 class ActionIn(BaseModel):
     type: Literal["shell"] = "shell"
     params: dict[str, Any] = Field(default_factory=dict)
+    # מיקומים (0-based) של actions באותה בקשה שצריכים להצליח לפני שזה ירוץ.
+    # אם אף action לא מגדיר depends_on — ההרצה רציפה לפי הסדר.
+    depends_on: list[int] | None = None
 
 
 class TaskCreate(BaseModel):
@@ -128,6 +144,8 @@ class AuditOut(BaseModel):
     task_id: str
     event: str
     data: dict[str, Any] = Field(default_factory=dict)
+    # רק כש-decode=false: data_json כמו שהוא ב-DB, בלי json.loads
+    data_json: str | None = None
     created_at: str
 
 
@@ -144,43 +162,101 @@ class TaskOut(BaseModel):
     approvals: list[dict[str, Any]] = Field(default_factory=list)
 
 
+class TaskSummary(BaseModel):
+    """TaskOut בלי description ו-approvals — להצגת רשימות."""
+
+    id: str
+    title: str
+    status: str
+    require_approval: int
+    created_at: str
+    updated_at: str
+    started_at: str | None
+    ended_at: str | None
+
+
 # ===== Helpers =====
 RUNS_BASE = Path.home() / ".local" / "share" / "lucy-agent" / "runs"
 RUNS_BASE.mkdir(parents=True, exist_ok=True)
 
 
-def _task_to_out(s, task: Task) -> TaskOut:
-    approvals: list[dict[str, Any]] = []
+def _dependency_idx(actions: list[ActionIn], base: int) -> list[list[int] | None]:
+    """מאמת depends_on (מיקומים ברשימה) ומתרגם ל-idx של ה-actions כפי שיישמרו ב-DB."""
     try:
-        aps = s.execute(select(Approval).where(Approval.task_id == task.id)).scalars().all()
-        for a in aps:
-            approvals.append(
-                {
-                    "id": a.id,
-                    "task_id": a.task_id,
-                    "token": a.token,
-                    "decision": a.decision,
-                    "decided_by": a.decided_by,
-                    "decided_at": a.decided_at,
-                    "created_at": a.created_at,
-                    "expires_at": a.expires_at,
-                }
-            )
+        build_graph([(i, a.depends_on) for i, a in enumerate(actions)])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return [None if a.depends_on is None else [base + d for d in a.depends_on] for a in actions]
+
+
+def _encode_cursor(*key: Any) -> str:
+    """cursor אטום ל-keyset pagination: המפתח של השורה האחרונה בעמוד."""
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, size: int) -> list[Any]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
     except Exception:
-        approvals = []
-
-    return TaskOut(
-        id=task.id,
-        title=task.title,
-        description=task.description,
-        status=task.status,
-        require_approval=task.require_approval,
-        created_at=task.created_at,
-        updated_at=task.updated_at,
-        started_at=task.started_at,
-        ended_at=task.ended_at,
-        approvals=approvals,
-    )
+        key = None
+    if not isinstance(key, list) or len(key) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+def _approval_to_dict(a: Approval) -> dict[str, Any]:
+    return {
+        "id": a.id,
+        "task_id": a.task_id,
+        "token": a.token,
+        "decision": a.decision,
+        "decided_by": a.decided_by,
+        "decided_at": a.decided_at,
+        "created_at": a.created_at,
+        "expires_at": a.expires_at,
+    }
+
+
+def _tasks_to_out(s, tasks: list[Task]) -> list[TaskOut]:
+    """
+    TaskOut לכמה משימות. approvals שלא נטענו מראש (selectinload(Task.approvals))
+    נטענים לכל המשימות יחד בשאילתת IN אחת — לא שאילתה לכל משימה.
+    """
+    missing = [t for t in tasks if "approvals" in sa_inspect(t).unloaded]
+    if missing:
+        by_task: dict[str, list[Approval]] = {t.id: [] for t in missing}
+        try:
+            for a in s.scalars(
+                select(Approval)
+                .where(Approval.task_id.in_(list(by_task)))
+                .order_by(Approval.created_at)
+            ):
+                by_task[a.task_id].append(a)
+        except Exception:
+            pass
+        for t in missing:
+            set_committed_value(t, "approvals", by_task[t.id])
+
+    return [
+        TaskOut(
+            id=t.id,
+            title=t.title,
+            description=t.description,
+            status=t.status,
+            require_approval=t.require_approval,
+            created_at=t.created_at,
+            updated_at=t.updated_at,
+            started_at=t.started_at,
+            ended_at=t.ended_at,
+            approvals=[_approval_to_dict(a) for a in t.approvals],
+        )
+        for t in tasks
+    ]
+
+
+def _task_to_out(s, task: Task) -> TaskOut:
+    return _tasks_to_out(s, [task])[0]
 
 
 # ===== Endpoints =====
@@ -222,8 +298,12 @@ def create_task(payload: TaskCreate):
             s.add(ap)
 
         # Actions עם idx (פותר NOT NULL על actions.idx)
+        deps = _dependency_idx(payload.actions or [], base=0)
         for i, a in enumerate(payload.actions or []):
-            params_json = json.dumps(a.params or {})
+            params = dict(a.params or {})
+            if deps[i] is not None:
+                params["depends_on"] = deps[i]
+            params_json = json.dumps(params)
             act = Action(
                 id=str(uuid4()),
                 task_id=task.id,
@@ -252,10 +332,102 @@ def create_task(payload: TaskCreate):
         return _task_to_out(s, task)
 
 
+# keyset על (created_at, rowid) — אותו נימוק כמו ב-audit (ראו _AUDIT_ROWID)
+_TASK_ROWID = literal_column("tasks.rowid")
+TASKS_PAGE_MAX = int(os.environ.get("LUCY_TASKS_PAGE_MAX", "500"))
+
+
+def _task_range(q, created_after: str | None, created_before: str | None):
+    if created_after:
+        q = q.where(Task.created_at >= created_after)
+    if created_before:
+        q = q.where(Task.created_at < created_before)
+    return q
+
+
+@router.get("/", response_model=list[TaskSummary] | list[TaskOut])
+def list_tasks(
+    response: Response,
+    status: Annotated[list[TaskStatus] | None, Query()] = None,
+    created_after: str | None = Query(None, description="created_at >= (ISO, UTC)"),
+    created_before: str | None = Query(None, description="created_at < (ISO, UTC)"),
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=TASKS_PAGE_MAX),
+    order: Literal["desc", "asc"] = "desc",
+    view: Literal["summary", "full"] = "summary",
+):
+    """
+    רשימת משימות, החדשות ראשונות (order=asc — הישנות ראשונות); ה-cursor לעמוד
+    הבא ב-header X-Next-Cursor. כל סטטוס נקרא כסריקת טווח אחת ב-
+    idx_tasks_status_created עם LIMIT, והתוצאות ממוזגות — גם בלי סינון סטטוס
+    לא נסרקת ולא ממוינת הטבלה כולה. view=full מחזיר TaskOut מלא (כולל approvals).
+    """
+    desc = order == "desc"
+    key = tuple_(Task.created_at, _TASK_ROWID)
+    after = tuple_(*_decode_cursor(cursor, 2)) if cursor else None
+    statuses = dict.fromkeys(st.value for st in (status or TaskStatus))
+
+    with get_session() as s:
+        parts = []
+        for st in statuses:
+            q = select(
+                Task.id,
+                Task.title,
+                Task.status,
+                Task.require_approval,
+                Task.created_at,
+                Task.updated_at,
+                Task.started_at,
+                Task.ended_at,
+                _TASK_ROWID.label("rowid"),
+            ).where(Task.status == st)
+            q = _task_range(q, created_after, created_before)
+            if after is not None:
+                q = q.where(key < after if desc else key > after)
+            if desc:
+                q = q.order_by(Task.created_at.desc(), _TASK_ROWID.desc())
+            else:
+                q = q.order_by(Task.created_at, _TASK_ROWID)
+            parts.append(s.execute(q.limit(limit + 1)).all())
+
+        rows = list(heapq.merge(*parts, key=lambda r: (r.created_at, r.rowid), reverse=desc))
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].rowid)
+
+        if view == "summary":
+            return [TaskSummary.model_validate(r, from_attributes=True) for r in rows]
+        by_id = {
+            t.id: t
+            for t in s.execute(
+                select(Task)
+                .options(selectinload(Task.approvals))
+                .where(Task.id.in_([r.id for r in rows]))
+            ).scalars()
+        }
+        return _tasks_to_out(s, [by_id[r.id] for r in rows if r.id in by_id])
+
+
+@router.get("/count")
+def count_tasks(
+    status: Annotated[list[TaskStatus] | None, Query()] = None,
+    created_after: str | None = Query(None, description="created_at >= (ISO, UTC)"),
+    created_before: str | None = Query(None, description="created_at < (ISO, UTC)"),
+) -> dict[str, Any]:
+    """מספר המשימות לפי סטטוס (GROUP BY על idx_tasks_status_created, בלי לגעת בטבלה)."""
+    q = select(Task.status, func.count()).group_by(Task.status)
+    if status:
+        q = q.where(Task.status.in_([st.value for st in status]))
+    q = _task_range(q, created_after, created_before)
+    with get_session() as s:
+        by_status = {st: n for st, n in s.execute(q).all()}
+    return {"total": sum(by_status.values()), "by_status": by_status}
+
+
 @router.get("/{task_id}", response_model=TaskOut)
 def get_task(task_id: str):
     with get_session() as s:
-        t = s.execute(select(Task).where(Task.id == task_id)).scalars().first()
+        t = s.scalar(select(Task).options(selectinload(Task.approvals)).where(Task.id == task_id))
         if not t:
             raise HTTPException(status_code=404, detail="Task not found")
         return _task_to_out(s, t)
@@ -264,11 +436,11 @@ def get_task(task_id: str):
 @router.post("/{task_id}/approve", response_model=TaskOut)
 def approve_task(task_id: str, body: ApprovalIn):
     with get_session() as s:
-        t = s.execute(select(Task).where(Task.id == task_id)).scalars().first()
+        t = s.scalar(select(Task).options(selectinload(Task.approvals)).where(Task.id == task_id))
         if not t:
             raise HTTPException(status_code=404, detail="Task not found")
 
-        ap = s.execute(select(Approval).where(Approval.task_id == task_id)).scalars().first()
+        ap = t.approvals[0] if t.approvals else None
         if not ap or ap.token != body.token:
             raise HTTPException(status_code=400, detail="Invalid approval token")
 
@@ -290,158 +462,448 @@ def approve_task(task_id: str, body: ApprovalIn):
         return _task_to_out(s, t)
 
 
-@router.post("/{task_id}/run", response_model=list[RunOut])
-def run_task(task_id: str):
-    with get_session() as s:
-        t = s.execute(select(Task).where(Task.id == task_id)).scalars().first()
-        if not t:
-            raise HTTPException(status_code=404, detail="Task not found")
+def _load_shell_actions(s, task_id: str) -> tuple[Task, list[tuple[Action, dict[str, Any]]]]:
+    """טוען משימה + actions לפי idx ומוודא שאפשר להריץ אותם (shell עם cmd)."""
+    t = s.execute(select(Task).where(Task.id == task_id)).scalars().first()
+    if not t:
+        raise HTTPException(status_code=404, detail="Task not found")
 
-        if t.require_approval and t.status != "APPROVED":
-            raise HTTPException(status_code=400, detail="Task requires approval")
+    if t.require_approval and t.status != "APPROVED":
+        raise HTTPException(status_code=400, detail="Task requires approval")
 
-        acts = s.execute(select(Action).where(Action.task_id == task_id)).scalars().all()
-        if not acts:
-            raise HTTPException(status_code=400, detail="No actions to run")
+    acts = (
+        s.execute(select(Action).where(Action.task_id == task_id).order_by(Action.idx))
+        .scalars()
+        .all()
+    )
+    if not acts:
+        raise HTTPException(status_code=400, detail="No actions to run")
+
+    plan: list[tuple[Action, dict[str, Any]]] = []
+    for a in acts:
+        if a.type != "shell":
+            raise HTTPException(status_code=400, detail=f"Unsupported action type: {a.type}")
+        params = json.loads(a.params_json or "{}")
+        if not params.get("cmd"):
+            raise HTTPException(status_code=400, detail="shell action missing 'cmd'")
+        plan.append((a, params))
+    try:
+        build_graph([(a.idx, p.get("depends_on")) for a, p in plan])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return t, plan
+
+
+def _run_to_out(task_id: str, r: Run) -> RunOut:
+    return RunOut(
+        id=r.id,
+        task_id=task_id,
+        action_id=r.action_id,
+        status=r.status,
+        started_at=r.started_at,
+        ended_at=r.ended_at,
+        stdout_path=r.stdout_path,
+        stderr_path=r.stderr_path,
+        exit_code=r.exit_code,
+    )
 
-        results: list[RunOut] = []
 
-        for a in acts:
-            if a.type != "shell":
-                raise HTTPException(status_code=400, detail=f"Unsupported action type: {a.type}")
+def _has_queued_runs(s, task_id: str) -> bool:
+    return (
+        s.scalar(
+            select(func.count())
+            .select_from(Run)
+            .join(Action, Run.action_id == Action.id)
+            .where(
+                Action.task_id == task_id,
+                Run.status.in_(("PENDING", "RUNNING")),
+                func.json_extract(Run.meta_json, "$.queue.queued_at").is_not(None),
+            )
+        )
+        > 0
+    )
+
 
-            params = json.loads(a.params_json or "{}")
-            cmd = params.get("cmd")
-            if not cmd:
-                raise HTTPException(status_code=400, detail="shell action missing 'cmd'")
+def _enqueue_runs(
+    task_id: str, *, queued: bool = False, limit: int | None = None
+) -> tuple[list[RunJob], list[RunOut]]:
+    """
+    יוצר Run-ים במצב PENDING בקומיט אחד; ההרצה עצמה עוברת למנוע ברקע.
+    queued: ה-Run-ים מסומנים לתור העמיד (services/job_queue) וה-workers מריצים אותם.
+    """
+    with get_session() as s:
+        t, plan = _load_shell_actions(s, task_id)
+        if queued and _has_queued_runs(s, task_id):
+            raise HTTPException(status_code=409, detail="Task is already queued")
 
+        jobs: list[RunJob] = []
+        results: list[RunOut] = []
+        for a, params in plan:
             run_id = str(uuid4())
             run_dir = RUNS_BASE / run_id
             run_dir.mkdir(parents=True, exist_ok=True)
-            stdout_p = run_dir / "stdout.log"
-            stderr_p = run_dir / "stderr.log"
-
             r = Run(
                 id=run_id,
                 action_id=a.id,
-                status="RUNNING",
-                started_at=now_iso(),
-                ended_at=None,
-                exit_code=None,
-                stdout_path=str(stdout_p),
-                stderr_path=str(stderr_p),
+                status="PENDING",
+                stdout_path=str(run_dir / "stdout.log"),
+                stderr_path=str(run_dir / "stderr.log"),
+                meta_json=queue_meta(limit) if queued else None,
             )
             s.add(r)
-            safe_commit(s)
+            jobs.append(
+                RunJob(
+                    run_id,
+                    a.id,
+                    params["cmd"],
+                    r.stdout_path,
+                    r.stderr_path,
+                    idx=a.idx,
+                    depends_on=params.get("depends_on"),
+                )
+            )
+            results.append(_run_to_out(task_id, r))
 
-            write_audit(
-                s,
-                task_id=task_id,
-                event="action_start",
-                data={"action_id": a.id, "type": a.type, "cmd": cmd},
-                run_id=run_id,
-                action_id=a.id,
-                message="action started",
+        write_audit(
+            s,
+            task_id=task_id,
+            event="task_queued",
+            data={"run_ids": [j.run_id for j in jobs], "durable": queued},
+            message="task queued for background execution",
+        )
+        t.status = "RUNNING"
+        t.started_at = now_iso()
+        t.updated_at = now_iso()
+        safe_commit(s)
+        return jobs, results
+
+
+@router.post("/{task_id}/run", response_model=list[RunOut])
+async def run_task(
+    task_id: str,
+    response: Response,
+    mode: Literal["sync", "async", "queue"] = "sync",
+    max_parallel: int | None = Query(default=None, ge=1),
+):
+    """
+    mode=sync (ברירת מחדל): מריץ את כל ה-actions ומחזיר בסיום.
+    mode=async: מחזיר 202 עם ה-Run-ים (PENDING) מיד; מעקב דרך GET /tasks/{id}/runs
+    או /stream/tasks/{id}.
+    mode=queue: כמו async, אבל ה-Run-ים נכתבים לתור העמיד ותהליכי ה-worker
+    (services/job_queue) מריצים אותם — ההרצה שורדת restart של ה-API.
+    max_parallel: מגבלת מקביליות למשימה הזו (ברירת מחדל: LUCY_TASK_CONCURRENCY).
+    """
+    if not engine.reserve(task_id):
+        raise HTTPException(status_code=409, detail="Task is already running")
+    try:
+        if mode == "queue":
+            _, results = await run_in_threadpool(
+                _enqueue_runs, task_id, queued=True, limit=max_parallel
             )
+            response.status_code = 202
+            return results
 
-            try:
-                with open(stdout_p, "wb") as out, open(stderr_p, "wb") as err:
-                    proc = subprocess.run(
-                        cmd,
-                        shell=True,
-                        stdout=out,
-                        stderr=err,
-                        cwd=os.path.expanduser("~"),
-                    )
-                exit_code = int(proc.returncode)
-                r.exit_code = exit_code
-                r.status = "SUCCEEDED" if r.exit_code == 0 else "FAILED"
-                r.ended_at = now_iso()
-                safe_commit(s)
+        jobs, results = await run_in_threadpool(_enqueue_runs, task_id)
 
-                write_audit(
-                    s,
-                    task_id=task_id,
-                    event="action_end",
-                    data={"action_id": a.id, "exit_code": exit_code},
-                    run_id=run_id,
-                    action_id=a.id,
-                    message="action ended",
-                )
+        if mode == "async":
+            engine.submit(task_id, jobs, limit=max_parallel)
+            response.status_code = 202
+            return results
 
-            except Exception as e:
-                r.status = "FAILED"
-                r.ended_at = now_iso()
-                r.exit_code = -1
-                safe_commit(s)
+        await engine.execute(task_id, jobs, limit=max_parallel)
+        return await run_in_threadpool(_runs_out, task_id, [j.run_id for j in jobs])
+    finally:
+        engine.release(task_id)
 
-                write_audit(
-                    s,
-                    task_id=task_id,
-                    event="action_error",
-                    data={"action_id": a.id, "error": repr(e)},
-                    run_id=run_id,
-                    action_id=a.id,
-                    message=f"action error: {e!r}",
-                )
 
-            results.append(
-                RunOut(
-                    id=r.id,
-                    task_id=task_id,
-                    action_id=r.action_id,
-                    status=r.status,
-                    started_at=r.started_at,
-                    ended_at=r.ended_at,
-                    stdout_path=r.stdout_path,
-                    stderr_path=r.stderr_path,
-                    exit_code=r.exit_code,
-                )
-            )
+def _runs_out(task_id: str, run_ids: list[str]) -> list[RunOut]:
+    """ה-Run-ים של הרצה אחת (לא כל ההיסטוריה של המשימה), לפי סדר ה-actions."""
+    with get_session() as s:
+        rows = s.execute(
+            select(Run)
+            .join(Action, Run.action_id == Action.id)
+            .where(Run.id.in_(run_ids))
+            .order_by(Action.idx)
+        ).scalars()
+        return [_run_to_out(task_id, r) for r in rows]
 
-        t.status = "FAILED" if any(ro.status == "FAILED" for ro in results) else "SUCCEEDED"
-        t.updated_at = now_iso()
-        safe_commit(s)
 
-        return results
+@router.get("/{task_id}/runs", response_model=list[RunOut])
+def list_runs(task_id: str):
+    with get_session() as s:
+        rows = s.execute(
+            select(Run)
+            .join(Action, Run.action_id == Action.id)
+            .where(Action.task_id == task_id)
+            .order_by(Action.idx, Run.started_at)
+        ).scalars()
+        return [_run_to_out(task_id, r) for r in rows]
+
+
+_TASK_TERMINAL = (
+    TaskStatus.SUCCEEDED.value,
+    TaskStatus.FAILED.value,
+    TaskStatus.CANCELED.value,
+    TaskStatus.REJECTED.value,
+)
+_RUN_ACTIVE = (RunStatus.PENDING.value, RunStatus.RUNNING.value)
 
 
-@router.get("/{task_id}/audit", response_model=list[AuditOut])
-def get_audit(task_id: str):
+def _task_status(task_id: str) -> str:
     with get_session() as s:
-        rows = (
-            s.execute(
-                select(AuditLog)
-                .where(AuditLog.task_id == task_id)
-                .order_by(AuditLog.created_at.asc())
+        status = s.scalar(select(Task.status).where(Task.id == task_id))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return status
+
+
+# Run שלא שייך לתור (meta_json ריק / בלי $.queue)
+_NOT_QUEUED = case(
+    (func.json_valid(Run.meta_json) == 1, func.json_extract(Run.meta_json, "$.queue.queued_at"))
+).is_(None)
+
+
+def _cancel_orphans(s, run_ids: list[str]) -> list[str]:
+    """
+    Run-ים פעילים שלא בתור ולא רצים בתהליך הזה — נשארו RUNNING/PENDING מ-API
+    שהופעל מחדש באמצע (mode=sync/async). אין מה לעצור: מסומנים CANCELED.
+    """
+    stmt = (
+        update(Run)
+        .where(Run.id.in_(run_ids), Run.status.in_(_RUN_ACTIVE), _NOT_QUEUED)
+        .values(status=RunStatus.CANCELED.value, ended_at=now_iso())
+        .returning(Run.id)
+        .execution_options(synchronize_session=False)
+    )
+    return list(s.scalars(stmt))
+
+
+def _cancel_queued_task(task_id: str, status: str) -> list[str]:
+    """
+    ביטול משימה שלא רצה בתהליך הזה: ב-mode=queue Run-ים שלא נתפסו מבוטלים ואלה
+    שנתפסו מסומנים ל-worker; Run-ים יתומים (restart של ה-API) מבוטלים ישירות.
+    המשימה עצמה מסומנת CANCELED מיד. מחזיר את ה-Run-ים שה-worker עוד צריך לעצור;
+    409 אם אין מה לבטל (ומשימה שלא RUNNING).
+    """
+    with get_session() as s:
+        ids = list(
+            s.scalars(
+                select(Run.id)
+                .join(Action, Run.action_id == Action.id)
+                .where(Action.task_id == task_id, Run.status.in_(_RUN_ACTIVE))
             )
-            .scalars()
-            .all()
         )
+    canceled, signaled = request_cancel(ids, "task") if ids else ([], [])
+    with get_session() as s:
+        orphaned = _cancel_orphans(s, ids) if ids else []
+        if not (canceled or signaled or orphaned) and status != TaskStatus.RUNNING.value:
+            raise HTTPException(status_code=409, detail="Task is not running")
+        t = s.scalar(select(Task).where(Task.id == task_id))
+        t.status = TaskStatus.CANCELED.value
+        t.ended_at = t.updated_at = now_iso()
+        write_audit(
+            s,
+            task_id=task_id,
+            event="task_canceled",
+            data={"canceled": canceled, "signaled": signaled, "orphaned": orphaned},
+            message="task canceled",
+        )
+        safe_commit(s)
+    return signaled
+
+
+@router.post("/{task_id}/cancel", response_model=list[RunOut])
+async def cancel_task(task_id: str, response: Response):
+    """
+    מבטל משימה שרצה: ה-actions הפעילים מקבלים SIGTERM (כל קבוצת התהליכים) ואחרי
+    LUCY_CANCEL_GRACE_SECONDS SIGKILL, מסומנים CANCELED, וה-actions שנשארו מדולגים.
+    ב-/stream/tasks/{id} נשלח done עם status=CANCELED.
+    202 אם ה-Run-ים רצים אצל worker של התור והוא עוד עוצר אותם.
+    """
+    status = await run_in_threadpool(_task_status, task_id)
+    if not await engine.cancel_task(task_id):
+        if status in _TASK_TERMINAL:
+            raise HTTPException(status_code=409, detail=f"Task already {status}")
+        if await run_in_threadpool(_cancel_queued_task, task_id, status):
+            response.status_code = 202
+        await publish_done(task_id, {"status": TaskStatus.CANCELED.value})
+    return await run_in_threadpool(list_runs, task_id)
+
+
+def _load_run(run_id: str) -> RunOut:
+    with get_session() as s:
+        row = s.execute(
+            select(Run, Action.task_id)
+            .join(Action, Run.action_id == Action.id)
+            .where(Run.id == run_id)
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Run not found")
+        return _run_to_out(row[1], row[0])
+
+
+@runs_router.post("/{run_id}/cancel", response_model=RunOut)
+async def cancel_run(run_id: str, response: Response):
+    """
+    מבטל Run אחד (SIGTERM ואז SIGKILL, כמו ביטול משימה). actions שתלויים בו
+    (depends_on) מדולגים; שאר המשימה ממשיכה. 202 אם ה-Run רץ אצל worker של התור.
+    """
+    run = await run_in_threadpool(_load_run, run_id)
+    if run.status not in _RUN_ACTIVE:
+        raise HTTPException(status_code=409, detail=f"Run already {run.status}")
+    if not await engine.cancel_run(run_id):
+        canceled, signaled = await run_in_threadpool(request_cancel, [run_id], "run")
+        if signaled:
+            response.status_code = 202
+        elif not (canceled or await run_in_threadpool(_cancel_orphan_run, run_id)):
+            raise HTTPException(status_code=409, detail="Run is not running")
+        elif final := await run_in_threadpool(_settle_canceled_run, run.task_id, run.action_id):
+            await publish_done(run.task_id, {"status": final})
+    return await run_in_threadpool(_load_run, run_id)
+
+
+def _cancel_orphan_run(run_id: str) -> bool:
+    with get_session() as s:
+        orphaned = _cancel_orphans(s, [run_id])
+        safe_commit(s)
+    return bool(orphaned)
 
-        out: list[AuditOut] = []
-        for r in rows:
-            event = (
-                getattr(r, "event_type", None)
-                or getattr(r, "event", None)
-                or getattr(r, "type", None)
-                or "event"
+
+def _settle_canceled_run(task_id: str, action_id: str) -> str | None:
+    """
+    Run שבוטל מחוץ למנוע (בתור ולא נתפס, או יתום): כמו במנוע, ה-actions שתלויים
+    בו (depends_on, גם בעקיפין) ועוד ממתינים מדולגים, וכשלא נשאר Run פעיל המשימה
+    מקבלת סטטוס סופי. מחזיר אותו, או None אם המשימה עוד רצה.
+    """
+    with get_session() as s:
+        actions = s.execute(
+            select(Action.id, Action.idx, Action.params_json).where(Action.task_id == task_id)
+        ).all()
+        children: dict[int, list[int]] = {}
+        for _, idx, params_json in actions:
+            for d in json.loads(params_json or "{}").get("depends_on") or ():
+                children.setdefault(d, []).append(idx)
+        todo = [idx for a_id, idx, _ in actions if a_id == action_id]
+        blocked: set[int] = set()
+        while todo:
+            for c in children.get(todo.pop(), ()):
+                if c not in blocked:
+                    blocked.add(c)
+                    todo.append(c)
+        waiting = s.execute(
+            select(Run.id, Run.action_id)
+            .join(Action, Run.action_id == Action.id)
+            .where(
+                Action.task_id == task_id,
+                Action.idx.in_(blocked),
+                Run.status == RunStatus.PENDING.value,
             )
-            raw = getattr(r, "data_json", None) or getattr(r, "data", None)
+        ).all()
+    ids = [r for r, _ in waiting]
+    # בתור: מה שלא נתפס מבוטל מיד, ומה שנתפס מסומן ל-worker (הוא גם יסגור את המשימה)
+    canceled, _ = request_cancel(ids, "run") if ids else ([], [])
+    with get_session() as s:
+        canceled += _cancel_orphans(s, ids) if ids else []
+        for run_id, a_id in waiting:
+            if run_id in canceled:
+                write_audit(
+                    s,
+                    task_id=task_id,
+                    event="action_skipped",
+                    data={"action_id": a_id, "canceled_action_id": action_id},
+                    run_id=run_id,
+                    action_id=a_id,
+                    message=f"action skipped: {_DEP_FAILED}",
+                )
+        active = s.scalar(
+            select(func.count())
+            .select_from(Run)
+            .join(Action, Run.action_id == Action.id)
+            .where(Action.task_id == task_id, Run.status.in_(_RUN_ACTIVE))
+        )
+        t = s.scalar(select(Task).where(Task.id == task_id))
+        final = None
+        if not active and t is not None and t.status == TaskStatus.RUNNING.value:
+            # כמו במנוע: Run שבוטל (בלי ביטול המשימה) — המשימה לא הצליחה
+            final = t.status = TaskStatus.FAILED.value
+            t.ended_at = t.updated_at = now_iso()
+        safe_commit(s)
+    return final
+
+
+# rowid ולא id: ה-id הוא UUID אקראי, ו-created_at ברזולוציה של שנייה — מיון לפי id
+# היה מערבב אירועים מאותה שנייה. rowid שומר על סדר ההכנסה, והוא גם הזנב המובלע של
+# idx_audit_task_time, כך שכל עמוד הוא סריקת טווח אחת באינדקס בלי מיון.
+_AUDIT_ROWID = literal_column("audit_logs.rowid")
+AUDIT_PAGE_MAX = int(os.environ.get("LUCY_AUDIT_PAGE_MAX", "1000"))
+
+
+@router.get("/{task_id}/audit", response_model=list[AuditOut], response_model_exclude_none=True)
+def get_audit(
+    task_id: str,
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=AUDIT_PAGE_MAX),
+    cursor: str | None = None,
+    event_type: Annotated[list[str] | None, Query()] = None,
+    action_id: str | None = None,
+    run_id: str | None = None,
+    since: str | None = Query(None, description="created_at >= since (ISO, UTC)"),
+    decode: bool = True,
+):
+    """
+    בלי limit מוחזר כל ה-audit של המשימה (כמו קודם). עם limit מוחזר עמוד לפי
+    keyset על (created_at, rowid); ה-cursor לעמוד הבא ב-header X-Next-Cursor
+    (חסר = אין עוד). decode=false מחזיר את data_json כמחרוזת בלי לפענח.
+    """
+    q = select(
+        AuditLog.id,
+        AuditLog.event_type,
+        AuditLog.data_json,
+        AuditLog.created_at,
+        _AUDIT_ROWID.label("rowid"),
+    ).where(AuditLog.task_id == task_id)
+    if event_type:
+        q = q.where(AuditLog.event_type.in_(event_type))
+    if action_id:
+        q = q.where(AuditLog.action_id == action_id)
+    if run_id:
+        q = q.where(AuditLog.run_id == run_id)
+    if since:
+        q = q.where(AuditLog.created_at >= since)
+    if cursor:
+        q = q.where(tuple_(AuditLog.created_at, _AUDIT_ROWID) > tuple_(*_decode_cursor(cursor, 2)))
+    q = q.order_by(AuditLog.created_at, _AUDIT_ROWID)
+    if limit:
+        q = q.limit(limit + 1)
+
+    with get_session() as s:
+        rows = s.execute(q).all()
+
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].rowid)
+
+    out: list[AuditOut] = []
+    for r in rows:
+        if decode:
             try:
-                data = json.loads(raw) if isinstance(raw, str) else (raw or {})
+                data = json.loads(r.data_json) if r.data_json else {}
             except Exception:
                 data = {}
-            out.append(
-                AuditOut(
-                    id=r.id,
-                    task_id=task_id,
-                    event=event,
-                    data=data,
-                    created_at=r.created_at,
-                )
+            raw = None
+        else:
+            data, raw = {}, r.data_json or "{}"
+        out.append(
+            AuditOut(
+                id=r.id,
+                task_id=task_id,
+                event=r.event_type or "event",
+                data=data,
+                data_json=raw,
+                created_at=r.created_at,
             )
-        return out
+        )
+    return out
 
 
 # --- local commit helper ---
@@ -462,11 +924,42 @@ def safe_commit(s) -> None:
 
 
 # ------------------ Helpers קיימים (השארנו כפי שהיו) ------------------
-def _cols(cls):
+@lru_cache
+def _cols(cls) -> frozenset[str]:
     try:
-        return {c.key for c in sa_inspect(cls).columns}
+        return frozenset(c.key for c in sa_inspect(cls).columns)
     except Exception:
-        return set()
+        return frozenset()
+
+
+class _Shape:
+    """
+    תבנית בנייה למודל: אילו מהשדות שה-quick_run ממלא קיימים בפועל כעמודות.
+    מחושב פעם אחת ב-import, במקום sa_inspect + בדיקת "x in cols" לכל שורה.
+    """
+
+    __slots__ = ("cls", "keys")
+
+    def __init__(self, cls, fields: tuple[str, ...]) -> None:
+        cols = _cols(cls)
+        self.cls = cls
+        self.keys = tuple(f for f in fields if f in cols)
+
+    def build(self, **values):
+        return self.cls(**{k: values[k] for k in self.keys})
+
+
+_TASK_SHAPE = _Shape(
+    Task,
+    ("id", "title", "description", "status", "require_approval", "created_at", "updated_at"),
+)
+_ACTION_SHAPE = _Shape(
+    Action, ("id", "task_id", "idx", "type", "created_at", "updated_at", "params_json")
+)
+_RUN_SHAPE = _Shape(Run, ("id", "action_id", "status", "stdout_path", "stderr_path"))
+# AuditLog: שם עמודת האירוע/הנתונים נקבע פעם אחת
+_AUDIT_EVENT = attrgetter("event" if "event" in _cols(AuditLog) else "event_type")
+_AUDIT_DATA = attrgetter("data" if "data" in _cols(AuditLog) else "data_json")
 
 
 def _json_parse(val):
@@ -485,26 +978,6 @@ def _json_parse(val):
     return None
 
 
-def _tail_bytes(path: str | None, limit: int = 400) -> str | None:
-    if not path:
-        return None
-    try:
-        p = Path(path)
-        if not p.exists() or not p.is_file():
-            return None
-        size = p.stat().st_size
-        with open(p, "rb") as f:
-            if size > limit:
-                f.seek(-limit, os.SEEK_END)
-            data = f.read()
-        try:
-            return data.decode("utf-8", "ignore")
-        except Exception:
-            return data.decode("latin-1", "ignore")
-    except Exception:
-        return None
-
-
 # ------------------ Guardrails הגדרות ------------------
 _AUTOPILOT_TOKEN = os.environ.get("LUCY_AUTOPILOT_TOKEN", "").strip()
 _TIMEOUT_SEC = int(os.environ.get("LUCY_AUTOPILOT_TIMEOUT_SECONDS", "30"))
@@ -555,6 +1028,13 @@ def _auth_check(req: Request):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
+def _require_token(req: Request):
+    """כמו _auth_check, אבל בלי טוקן בהגדרות — חוסם (ל-endpoints שמריצים פקודות/חושפים לוגים)."""
+    if not _AUTOPILOT_TOKEN:
+        raise HTTPException(status_code=503, detail="LUCY_AUTOPILOT_TOKEN is not configured")
+    _auth_check(req)
+
+
 def _rate_limit():
     try:
         now = time.time()
@@ -616,6 +1096,7 @@ def _resource_limiter():
 class QuickRunIn(BaseModel):
     title: str = "autopilot"
     actions: list[ActionIn]
+    max_parallel: int | None = Field(default=None, ge=1)
 
 
 class QuickRunOut(BaseModel):
@@ -625,300 +1106,128 @@ class QuickRunOut(BaseModel):
 
 
 # ------------------ Quick Run ------------------
-@router.post("/quick-run", response_model=QuickRunOut)
-def quick_run(payload: QuickRunIn, request: Request):
-    _auth_check(request)
-    _rate_limit()
+def _quick_run_rows(payload: QuickRunIn) -> tuple[str, list[Any], list[RunJob]]:
+    """
+    בונה בזיכרון את Task + Actions + Runs (PENDING) + audit של quick_run.
+    idx נקבע בזיכרון (משימה חדשה — אין צורך ב-SELECT max(idx)).
+    """
+    now = now_iso()
+    # Allow/Deny עוד לפני שמכניסים ל-DB
+    cmds: list[str | None] = []
+    for a in payload.actions:
+        cmd = (a.params or {}).get("cmd")
+        if cmd:
+            _allow_deny_check(cmd)
+        cmds.append(cmd)
+    deps = _dependency_idx(payload.actions, base=1)
 
     # 1) Task חדש (Auto-approve)
-    T = _cols(Task)
-    t_kwargs = {}
-    if "id" in T:
-        t_kwargs["id"] = str(uuid4())
-    if "title" in T:
-        t_kwargs["title"] = payload.title
-    if "description" in T:
-        t_kwargs["description"] = None
-    if "status" in T:
-        t_kwargs["status"] = (
-            TaskStatus.PENDING.value if hasattr(TaskStatus, "PENDING") else "PENDING"
+    task_id = str(uuid4())
+    rows: list[Any] = [
+        _TASK_SHAPE.build(
+            id=task_id,
+            title=payload.title,
+            description=None,
+            status=TaskStatus.PENDING.value if payload.actions else TaskStatus.SUCCEEDED.value,
+            require_approval=False,
+            created_at=now,
+            updated_at=now,
+        ),
+        build_audit(task_id, "task_created", {"title": payload.title, "require_approval": False}),
+    ]
+
+    # 2) פעולות (idx/params_json) + 3) Run-ים במצב PENDING; ההרצה עצמה — במנוע
+    runs_dir = Path(
+        os.environ.get("LUCY_RUNS_DIR", str(Path.home() / ".local/share/lucy-agent/runs"))
+    )
+    jobs: list[RunJob] = []
+    for pos, a in enumerate(payload.actions):
+        idx = pos + 1
+        params = {"cmd": cmds[pos]} if cmds[pos] is not None else {}
+        if deps[pos] is not None:
+            params["depends_on"] = deps[pos]
+
+        action_id, run_id = str(uuid4()), str(uuid4())
+        stdout_path = str(runs_dir / run_id / "stdout.log")
+        stderr_path = str(runs_dir / run_id / "stderr.log")
+        rows.append(
+            _ACTION_SHAPE.build(
+                id=action_id,
+                task_id=task_id,
+                idx=idx,
+                type=a.type,
+                created_at=now,
+                updated_at=now,
+                params_json=json.dumps(params),
+            )
         )
-    if "require_approval" in T:
-        t_kwargs["require_approval"] = False
-    if "created_at" in T:
-        t_kwargs["created_at"] = now_iso()
-    if "updated_at" in T:
-        t_kwargs["updated_at"] = now_iso()
-
-    t = Task(**t_kwargs)
-    with get_session() as s:
-        s.add(t)
-        safe_commit(s)
-        write_audit(
-            s,
-            getattr(t, "id", None),
-            "task_created",
-            {
-                "title": getattr(t, "title", None),
-                "require_approval": getattr(t, "require_approval", False),
-            },
+        rows.append(
+            _RUN_SHAPE.build(
+                id=run_id,
+                action_id=action_id,
+                status="PENDING",
+                stdout_path=stdout_path,
+                stderr_path=stderr_path,
+            )
         )
+        jobs.append(
+            RunJob(
+                run_id=run_id,
+                action_id=action_id,
+                cmd=cmds[pos] or "",
+                stdout_path=stdout_path,
+                stderr_path=stderr_path,
+                idx=idx,
+                depends_on=deps[pos],
+            )
+        )
+    return task_id, rows, jobs
 
-    # 2) פעולות (idx/params_json)
-    with get_session() as s:
-        t_db = s.scalar(select(Task).where(Task.id == getattr(t, "id", None)))
-        if not t_db:
-            raise HTTPException(status_code=404, detail="Task not found")
-
-        A = _cols(Action)
-        for a in payload.actions:
-            next_idx = 1
-            if "idx" in A:
-                max_idx = s.scalar(
-                    select(func.max(Action.idx)).where(Action.task_id == getattr(t_db, "id", None))
-                )
-                next_idx = (max_idx or 0) + 1
-
-            cmd = None
-            try:
-                if getattr(a, "params", None):
-                    cmd = (a.params or {}).get("cmd")
-            except Exception:
-                cmd = None
-
-            # Allow/Deny עוד לפני שמכניסים ל-DB
-            if cmd:
-                _allow_deny_check(cmd)
-
-            a_kwargs = {}
-            if "id" in A:
-                a_kwargs["id"] = str(uuid4())
-            if "task_id" in A:
-                a_kwargs["task_id"] = getattr(t_db, "id", None)
-            if "idx" in A:
-                a_kwargs["idx"] = next_idx
-            if "type" in A:
-                a_kwargs["type"] = a.type
-            if "created_at" in A:
-                a_kwargs["created_at"] = now_iso()
-            if "updated_at" in A:
-                a_kwargs["updated_at"] = now_iso()
-            if "params_json" in A:
-                a_kwargs["params_json"] = json.dumps({"cmd": cmd} if cmd is not None else {})
-
-            s.add(Action(**a_kwargs))
-        safe_commit(s)
 
-    # 3) ריצה לפי idx/id + resource/timeout
-    run_results: list[RunOut] = []
+def _quick_run_prepare(payload: QuickRunIn) -> tuple[str, list[RunJob]]:
+    """כל השורות של quick_run נכתבות בטרנזקציה אחת (add_all + commit)."""
+    task_id, rows, jobs = _quick_run_rows(payload)
     with get_session() as s:
-        A = _cols(Action)
-        order_clause = Action.idx if "idx" in A else Action.id
-        acts = s.scalars(
-            select(Action).where(Action.task_id == getattr(t, "id", None)).order_by(order_clause)
-        ).all()
-
-        if not acts:
-            if hasattr(t, "status"):
-                t.status = "SUCCEEDED"
-            if hasattr(t, "updated_at"):
-                t.updated_at = now_iso()
-            safe_commit(s)
-        else:
-            preexec = _resource_limiter()
-            for act in acts:
-                R = _cols(Run)
-                r_kwargs = {}
-                if "id" in R:
-                    r_kwargs["id"] = str(uuid4())
-                if "action_id" in R:
-                    r_kwargs["action_id"] = getattr(act, "id", None)
-                if "status" in R:
-                    r_kwargs["status"] = "RUNNING"
-                if "started_at" in R:
-                    r_kwargs["started_at"] = now_iso()
-
-                r = Run(**r_kwargs)
-                s.add(r)
-                safe_commit(s)
-
-                # שליפת cmd
-                cmd_val = None
-                if "params_json" in A:
-                    try:
-                        raw = getattr(act, "params_json", None)
-                        if isinstance(raw, bytes | bytearray):
-                            raw = raw.decode("utf-8", "ignore")
-                        obj = json.loads(raw or "{}") if isinstance(raw, str) else (raw or {})
-                        if isinstance(obj, dict):
-                            cmd_val = obj.get("cmd")
-                    except Exception:
-                        cmd_val = None
-
-                write_audit(
-                    s,
-                    getattr(t, "id", None),
-                    "action_start",
-                    {
-                        "action_id": getattr(act, "id", None),
-                        "type": getattr(act, "type", None),
-                        "cmd": cmd_val,
-                    },
-                )
-
-                try:
-                    if getattr(act, "type", None) != "shell":
-                        raise RuntimeError(f"Unsupported action type: {getattr(act, 'type', None)}")
-                    if not cmd_val:
-                        raise RuntimeError("Missing shell cmd")
-
-                    # בדיקת allow/deny בשלב הריצה (שוב, למקרה של שינוי)
-                    _allow_deny_check(cmd_val)
-
-                    run_dir = Path(
-                        os.environ.get(
-                            "LUCY_RUNS_DIR",
-                            str(Path.home() / ".local/share/lucy-agent/runs"),
-                        )
-                    ) / (getattr(r, "id", "run"))
-                    run_dir.mkdir(parents=True, exist_ok=True)
-                    stdout_path = run_dir / "stdout.log"
-                    stderr_path = run_dir / "stderr.log"
-
-                    with open(stdout_path, "wb") as out, open(stderr_path, "wb") as err:
-                        subprocess.run(
-                            cmd_val,
-                            shell=True,
-                            stdout=out,
-                            stderr=err,
-                            timeout=_TIMEOUT_SEC,
-                            preexec_fn=preexec,
-                        )
-
-                    # עדכון סטטוס לפי קוד חזרה מתוך stderr/stdout? נשתמש בקובץ ה-exit_code אם קיים או ב-0/חריג.
-                    # כאן, אם subprocess.run לא זרק — הקוד 0; אחרת ב-except.
-                    if hasattr(r, "stdout_path"):
-                        r.stdout_path = str(stdout_path)
-                    if hasattr(r, "stderr_path"):
-                        r.stderr_path = str(stderr_path)
-                    if hasattr(r, "exit_code"):
-                        r.exit_code = 0
-                    if hasattr(r, "status"):
-                        r.status = "SUCCEEDED"
-                    if hasattr(r, "ended_at"):
-                        r.ended_at = now_iso()
-                    safe_commit(s)
-
-                    tail_out = _tail_bytes(getattr(r, "stdout_path", None), 400)
-                    tail_err = _tail_bytes(getattr(r, "stderr_path", None), 400)
-                    write_audit(
-                        s,
-                        getattr(t, "id", None),
-                        "action_end",
-                        {
-                            "action_id": getattr(act, "id", None),
-                            "exit_code": getattr(r, "exit_code", None),
-                            "stdout_tail": tail_out,
-                            "stderr_tail": tail_err,
-                        },
-                    )
-
-                except subprocess.TimeoutExpired:
-                    if hasattr(r, "exit_code"):
-                        r.exit_code = -1
-                    if hasattr(r, "status"):
-                        r.status = "FAILED"
-                    if hasattr(r, "ended_at"):
-                        r.ended_at = now_iso()
-                    safe_commit(s)
-                    write_audit(
-                        s,
-                        getattr(t, "id", None),
-                        "action_end",
-                        {
-                            "action_id": getattr(act, "id", None),
-                            "exit_code": -1,
-                            "error": f"timeout({_TIMEOUT_SEC}s)",
-                            "stdout_tail": _tail_bytes(getattr(r, "stdout_path", None), 400),
-                            "stderr_tail": _tail_bytes(getattr(r, "stderr_path", None), 400),
-                        },
-                    )
-
-                except Exception as e:
-                    # במצב זה אין לנו exit_code סיסטמי; ננסה לדגום דרך קובץ/ניתוח — ל-MVP נשים -2 כברירת מחדל.
-                    if hasattr(r, "exit_code"):
-                        r.exit_code = -2
-                    if hasattr(r, "status"):
-                        r.status = "FAILED"
-                    if hasattr(r, "ended_at"):
-                        r.ended_at = now_iso()
-                    safe_commit(s)
-                    write_audit(
-                        s,
-                        getattr(t, "id", None),
-                        "action_end",
-                        {
-                            "action_id": getattr(act, "id", None),
-                            "exit_code": getattr(r, "exit_code", None),
-                            "error": str(e),
-                            "stdout_tail": _tail_bytes(getattr(r, "stdout_path", None), 400),
-                            "stderr_tail": _tail_bytes(getattr(r, "stderr_path", None), 400),
-                        },
-                    )
+        s.add_all(rows)
+        safe_commit(s)
+    return task_id, jobs
 
-                run_results.append(
-                    RunOut(
-                        id=getattr(r, "id", ""),
-                        task_id=str(getattr(t, "id", "")),
-                        action_id=getattr(r, "action_id", None),
-                        status=getattr(r, "status", None),
-                        started_at=getattr(r, "started_at", None),
-                        ended_at=getattr(r, "ended_at", None),
-                        stdout_path=getattr(r, "stdout_path", None),
-                        stderr_path=getattr(r, "stderr_path", None),
-                        exit_code=getattr(r, "exit_code", None),
-                    )
-                )
 
-            # סטטוס task מסיכום הריצות
-            with get_session() as s2:
-                t_db2 = s2.scalar(select(Task).where(Task.id == getattr(t, "id", None)))
-                if t_db2 and hasattr(t_db2, "status"):
-                    t_db2.status = (
-                        "FAILED"
-                        if any(getattr(ro, "status", None) == "FAILED" for ro in run_results)
-                        else "SUCCEEDED"
-                    )
-                if t_db2 and hasattr(t_db2, "updated_at"):
-                    t_db2.updated_at = now_iso()
-                safe_commit(s2)
-
-    # 4) Audit לפי created_at + המרת data ל-dict (ונשמר ה-fallback הסינתטי אם חסר end)
+def _quick_run_collect(task_id: str) -> QuickRunOut:
+    """4) + 5) — runs, audit ו-TaskOut נקראים ב-session אחד."""
     with get_session() as s:
+        run_results = [
+            _run_to_out(task_id, r)
+            for r in s.execute(
+                select(Run)
+                .join(Action, Run.action_id == Action.id)
+                .where(Action.task_id == task_id)
+                .order_by(Action.idx)
+            ).scalars()
+        ]
+
+        # Audit לפי created_at + המרת data ל-dict (ונשמר ה-fallback הסינתטי אם חסר end)
         try:
             aud_q = (
-                select(AuditLog)
-                .where(AuditLog.task_id == getattr(t, "id", None))
-                .order_by(AuditLog.created_at)
+                select(AuditLog).where(AuditLog.task_id == task_id).order_by(AuditLog.created_at)
             )
         except Exception:
-            aud_q = select(AuditLog).where(AuditLog.task_id == getattr(t, "id", None))
+            aud_q = select(AuditLog).where(AuditLog.task_id == task_id)
         auds = s.scalars(aud_q).all()
 
         audit_out = []
         for a in auds:
-            data_raw = getattr(a, "data", None) or getattr(a, "data_json", None)
             audit_out.append(
                 AuditOut(
-                    id=getattr(a, "id", None),
-                    task_id=getattr(a, "task_id", None),
-                    event=getattr(a, "event", getattr(a, "event_type", None)),
-                    data=_json_parse(data_raw),
-                    created_at=getattr(a, "created_at", None),
+                    id=a.id,
+                    task_id=a.task_id,
+                    event=_AUDIT_EVENT(a),
+                    data=_json_parse(_AUDIT_DATA(a)),
+                    created_at=a.created_at,
                 )
             )
 
-        have_end = any(getattr(x, "event", None) == "action_end" for x in audit_out)
+        have_end = any(x.event == "action_end" for x in audit_out)
         if not have_end and run_results:
             for ro in run_results:
                 audit_out.append(
@@ -929,20 +1238,40 @@ def quick_run(payload: QuickRunIn, request: Request):
                         data={
                             "action_id": ro.action_id,
                             "exit_code": ro.exit_code,
-                            "stdout_tail": _tail_bytes(getattr(ro, "stdout_path", None), 400),
-                            "stderr_tail": _tail_bytes(getattr(ro, "stderr_path", None), 400),
+                            "stdout_tail": _tail_bytes(ro.stdout_path, 400),
+                            "stderr_tail": _tail_bytes(ro.stderr_path, 400),
                             "synthetic": True,
                         },
                         created_at=now_iso(),
                     )
                 )
 
-    # 5) TaskOut עדכני
-    with get_session() as s:
-        t_final = s.scalar(select(Task).where(Task.id == getattr(t, "id", None)))
+        # TaskOut עדכני
+        t_final = s.scalar(
+            select(Task).options(selectinload(Task.approvals)).where(Task.id == task_id)
+        )
         task_out = _task_to_out(s, t_final)
 
-    return _fix_timeout_semantics(QuickRunOut(task=task_out, runs=run_results, audit=audit_out))
+    return QuickRunOut(task=task_out, runs=run_results, audit=audit_out)
+
+
+@router.post("/quick-run", response_model=QuickRunOut)
+async def quick_run(payload: QuickRunIn, request: Request):
+    _auth_check(request)
+    _rate_limit()
+
+    task_id, jobs = await run_in_threadpool(_quick_run_prepare, payload)
+    if jobs:
+        await engine.execute(
+            task_id,
+            jobs,
+            timeout=_TIMEOUT_SEC,
+            preexec_fn=_resource_limiter(),
+            limit=payload.max_parallel,
+            recorder=BatchRecorder(),
+        )
+    result = await run_in_threadpool(_quick_run_collect, task_id)
+    return _fix_timeout_semantics(result)
 
 
 # ------------------ Agent Shell ------------------
@@ -952,9 +1281,9 @@ class AgentShellIn(BaseModel):
 
 
 @router.post("/agent/shell", response_model=QuickRunOut)
-def agent_shell(payload: AgentShellIn, request: Request):
+async def agent_shell(payload: AgentShellIn, request: Request):
     _auth_check(request)
-    return quick_run(
+    return await quick_run(
         QuickRunIn(
             title=payload.title or "agent-shell",
             actions=[ActionIn(type="shell", params={"cmd": payload.cmd})],
@@ -4,16 +4,15 @@ from uuid import uuid4
 from ..models.tasks import AuditLog, now_iso
 
 
-def write_audit(
-    session,
+def build_audit(
     task_id: str,
     event: str,
     data: dict | None = None,
     action_id: str | None = None,
     run_id: str | None = None,
     message: str | None = None,
-):
-    rec = AuditLog(
+) -> AuditLog:
+    return AuditLog(
         id=str(uuid4()),
         task_id=task_id,
         action_id=action_id,
@@ -23,4 +22,15 @@ def write_audit(
         data_json=json.dumps(data or {}),
         created_at=now_iso(),
     )
-    session.add(rec)
+
+
+def write_audit(
+    session,
+    task_id: str,
+    event: str,
+    data: dict | None = None,
+    action_id: str | None = None,
+    run_id: str | None = None,
+    message: str | None = None,
+):
+    session.add(build_audit(task_id, event, data, action_id, run_id, message))
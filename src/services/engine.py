@@ -0,0 +1,480 @@
+"""
+מנוע הרצה של actions עבור /tasks/{id}/run ו-/tasks/quick-run.
+
+ה-router מכין Run-ים במצב PENDING; המנוע מריץ את ה-actions כ-asyncio
+subprocesses לפי גרף התלויות (scheduler), מעדכן סטטוסים ב-DB (ב-thread נפרד
+כדי לא לחסום את ה-loop) ומפרסם אירועים ל-/stream/tasks/{task_id}.
+execute() ממתין לסיום; submit() מריץ ברקע (mode=async). cancel_task()/cancel_run()
+עוצרים הרצה פעילה: קבוצת התהליכים מקבלת SIGTERM ואחרי LUCY_CANCEL_GRACE_SECONDS
+SIGKILL, ה-Run מסומן CANCELED וה-actions שעוד לא התחילו מדולגים.
+
+הכתיבה ל-DB עוברת דרך recorder: DbRecorder מקמט כל מעבר סטטוס מיד (מי שעושה
+polling רואה אותו), BatchRecorder צובר הכול בזיכרון ומקמט פעם אחת בסוף.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from dataclasses import dataclass, field
+
+from sqlalchemy import select, update
+
+from ..db.session import get_session, safe_commit
+from ..events import OutputPublisher, publish_done, publish_update
+from ..models.tasks import Run, RunStatus, Task, TaskStatus, now_iso
+from .audit import build_audit, write_audit
+from .runner import CANCEL_GRACE_SEC, run_shell_to_files, tail_bytes
+from .scheduler import build_graph, run_graph
+
+
+@dataclass
+class RunJob:
+    run_id: str
+    action_id: str
+    cmd: str
+    stdout_path: str
+    stderr_path: str
+    idx: int = 0
+    depends_on: list[int] | None = None
+    # תלות שכבר הסתיימה בלי הצלחה לפני ההרצה הזו (Run שחזר לתור) — מדלגים
+    dep_failed: bool = False
+
+
+# ------------------ עדכוני DB (רצים ב-to_thread) ------------------
+def _end_audit(task_id: str, job: RunJob, exit_code: int, error: str | None):
+    data = {
+        "action_id": job.action_id,
+        "exit_code": exit_code,
+        "stdout_tail": tail_bytes(job.stdout_path, 400),
+        "stderr_tail": tail_bytes(job.stderr_path, 400),
+    }
+    if error:
+        data["error"] = error
+    return build_audit(
+        task_id,
+        "action_end",
+        data,
+        action_id=job.action_id,
+        run_id=job.run_id,
+        message=f"action error: {error}" if error else "action ended",
+    )
+
+
+def _mark_run_started(task_id: str, job: RunJob) -> None:
+    with get_session() as s:
+        r = s.get(Run, job.run_id)
+        if r is not None:
+            r.status = RunStatus.RUNNING.value
+            r.started_at = now_iso()
+        write_audit(
+            s,
+            task_id=task_id,
+            event="action_start",
+            data={"action_id": job.action_id, "type": "shell", "cmd": job.cmd},
+            run_id=job.run_id,
+            action_id=job.action_id,
+            message="action started",
+        )
+        safe_commit(s)
+
+
+def _mark_run_ended(
+    task_id: str, job: RunJob, status: str, exit_code: int, error: str | None
+) -> None:
+    with get_session() as s:
+        r = s.get(Run, job.run_id)
+        if r is not None:
+            r.status = status
+            r.exit_code = exit_code
+            r.ended_at = now_iso()
+        s.add(_end_audit(task_id, job, exit_code, error))
+        safe_commit(s)
+
+
+_DEP_FAILED = "a dependency did not succeed"
+
+
+def _mark_run_skipped(task_id: str, job: RunJob, reason: str = _DEP_FAILED) -> None:
+    with get_session() as s:
+        r = s.get(Run, job.run_id)
+        if r is not None:
+            r.status = RunStatus.CANCELED.value
+            r.ended_at = now_iso()
+        write_audit(
+            s,
+            task_id=task_id,
+            event="action_skipped",
+            data={"action_id": job.action_id, "depends_on": job.depends_on or []},
+            run_id=job.run_id,
+            action_id=job.action_id,
+            message=f"action skipped: {reason}",
+        )
+        safe_commit(s)
+
+
+def _mark_task_ended(task_id: str, status: str) -> None:
+    with get_session() as s:
+        t = s.scalar(select(Task).where(Task.id == task_id))
+        if t is not None:
+            t.status = status
+            t.ended_at = now_iso()
+            t.updated_at = now_iso()
+        safe_commit(s)
+
+
+# ------------------ Recorders ------------------
+class DbRecorder:
+    """כל מעבר סטטוס נכתב מיד בקומיט משלו (mode=async — הלקוח עושה polling)."""
+
+    async def started(self, task_id: str, job: RunJob) -> None:
+        await asyncio.to_thread(_mark_run_started, task_id, job)
+
+    async def ended(
+        self, task_id: str, job: RunJob, status: str, exit_code: int, error: str | None
+    ) -> None:
+        await asyncio.to_thread(_mark_run_ended, task_id, job, status, exit_code, error)
+
+    async def skipped(self, task_id: str, job: RunJob, reason: str = _DEP_FAILED) -> None:
+        await asyncio.to_thread(_mark_run_skipped, task_id, job, reason)
+
+    async def finished(self, task_id: str, status: str) -> None:
+        await asyncio.to_thread(_mark_task_ended, task_id, status)
+
+
+class BatchRecorder(DbRecorder):
+    """
+    צובר מעברי סטטוס ו-audit בזיכרון וכותב את כולם בקומיט אחד בסיום המשימה.
+    מתאים ל-quick_run, שמחזיר תשובה רק אחרי שהכול הסתיים.
+    """
+
+    def __init__(self) -> None:
+        self.runs: dict[str, dict] = {}
+        self.audits: list = []
+
+    async def started(self, task_id: str, job: RunJob) -> None:
+        self.runs[job.run_id] = {
+            "id": job.run_id,
+            "status": RunStatus.RUNNING.value,
+            "started_at": now_iso(),
+        }
+        self.audits.append(
+            build_audit(
+                task_id,
+                "action_start",
+                {"action_id": job.action_id, "type": "shell", "cmd": job.cmd},
+                action_id=job.action_id,
+                run_id=job.run_id,
+                message="action started",
+            )
+        )
+
+    async def ended(
+        self, task_id: str, job: RunJob, status: str, exit_code: int, error: str | None
+    ) -> None:
+        row = self.runs.setdefault(job.run_id, {"id": job.run_id})
+        row.update(status=status, exit_code=exit_code, ended_at=now_iso())
+        self.audits.append(_end_audit(task_id, job, exit_code, error))
+
+    async def skipped(self, task_id: str, job: RunJob, reason: str = _DEP_FAILED) -> None:
+        self.runs[job.run_id] = {
+            "id": job.run_id,
+            "status": RunStatus.CANCELED.value,
+            "ended_at": now_iso(),
+        }
+        self.audits.append(
+            build_audit(
+                task_id,
+                "action_skipped",
+                {"action_id": job.action_id, "depends_on": job.depends_on or []},
+                action_id=job.action_id,
+                run_id=job.run_id,
+                message=f"action skipped: {reason}",
+            )
+        )
+
+    async def finished(self, task_id: str, status: str) -> None:
+        # shield: ביטול נוסף (הלקוח התנתק בזמן ה-flush) לא מאבד את ה-batch
+        await asyncio.shield(asyncio.to_thread(self._flush, task_id, status))
+
+    def _flush(self, task_id: str, status: str) -> None:
+        now = now_iso()
+        with get_session() as s:
+            if self.runs:
+                # bulk UPDATE לפי primary key — statement אחד לכל צורת שורה
+                s.execute(update(Run), list(self.runs.values()))
+            s.add_all(self.audits)
+            s.execute(
+                update(Task)
+                .where(Task.id == task_id)
+                .values(status=status, ended_at=now, updated_at=now)
+            )
+            safe_commit(s)
+        self.runs.clear()
+        self.audits.clear()
+
+
+# ------------------ המנוע ------------------
+@dataclass
+class _Execution:
+    """מצב הרצה אחת של משימה בתהליך הזה — מה שצריך כדי לבטל אותה."""
+
+    run_ids: set[str]
+    canceled: bool = False
+    canceled_runs: set[str] = field(default_factory=set)
+    started: set[str] = field(default_factory=set)
+    shells: dict[str, asyncio.Task] = field(default_factory=dict)
+    settled: dict[str, asyncio.Event] = field(default_factory=dict)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def is_canceled(self, run_id: str) -> bool:
+        return self.canceled or run_id in self.canceled_runs
+
+    def settle(self, run_id: str) -> None:
+        self.settled.setdefault(run_id, asyncio.Event()).set()
+
+
+async def _wait(event: asyncio.Event, timeout: float | None) -> bool:
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except TimeoutError:
+        return False
+    return True
+
+
+class ExecutionEngine:
+    def __init__(self) -> None:
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._executions: dict[str, _Execution] = {}
+        self._reserved: set[str] = set()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def is_running(self, task_id: str) -> bool:
+        return task_id in self._reserved or task_id in self._inflight or task_id in self._executions
+
+    def reserve(self, task_id: str) -> bool:
+        """
+        תופס את task_id לפני ה-await הראשון (יצירת ה-Run-ים), כך ששתי בקשות
+        מקבילות לא מריצות את אותה משימה. False אם היא כבר תפוסה/רצה.
+        """
+        if self.is_running(task_id):
+            return False
+        self._reserved.add(task_id)
+        return True
+
+    def release(self, task_id: str) -> None:
+        self._reserved.discard(task_id)
+
+    def submit(self, task_id: str, jobs: list[RunJob], **opts) -> None:
+        """מתזמן הרצה ברקע; חייב להיקרא מתוך ה-event loop."""
+        t = asyncio.get_running_loop().create_task(self.execute(task_id, jobs, **opts))
+        self._inflight[task_id] = t
+        t.add_done_callback(lambda _t: self._inflight.pop(task_id, None))
+
+    async def execute(
+        self,
+        task_id: str,
+        jobs: list[RunJob],
+        *,
+        timeout: float | None = None,
+        preexec_fn=None,
+        limit: int | None = None,
+        recorder: DbRecorder | None = None,
+    ) -> str:
+        """מריץ את כל ה-jobs לפי depends_on ומחזיר את סטטוס המשימה הסופי."""
+        rec = recorder or DbRecorder()
+        by_idx = {j.idx: j for j in jobs}
+        deps, explicit = build_graph([(j.idx, j.depends_on) for j in jobs])
+        ex = _Execution({j.run_id for j in jobs})
+
+        async def worker(idx: int) -> bool:
+            job = by_idx[idx]
+            if ex.is_canceled(job.run_id) or job.dep_failed:
+                await skip(idx)
+                return False
+            return await self._run_job(task_id, job, rec, timeout, preexec_fn, ex)
+
+        async def skip(idx: int) -> None:
+            job = by_idx[idx]
+            reason = "task canceled" if ex.canceled else _DEP_FAILED
+            if job.run_id in ex.canceled_runs:
+                reason = "run canceled"
+            await rec.skipped(task_id, job, reason)
+            ex.settle(job.run_id)
+
+        self._executions[task_id] = ex
+        final, error = TaskStatus.FAILED.value, None
+        try:
+            await publish_update(task_id, {"status": TaskStatus.RUNNING.value, "runs": len(jobs)})
+            results = await run_graph(
+                deps, worker, on_skip=skip, propagate_failure=explicit, limit=limit
+            )
+            if ex.canceled:
+                final = TaskStatus.CANCELED.value
+            elif all(v is True for v in results.values()):
+                final = TaskStatus.SUCCEEDED.value
+        except asyncio.CancelledError:
+            final = TaskStatus.CANCELED.value
+            raise
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self._executions.pop(task_id, None)
+            try:
+                await self._finish(task_id, jobs, rec, ex, final, error)
+            finally:
+                ex.done.set()
+        return final
+
+    async def _finish(
+        self,
+        task_id: str,
+        jobs: list[RunJob],
+        rec: DbRecorder,
+        ex: _Execution,
+        final: str,
+        error: str | None,
+    ) -> None:
+        """
+        סוף ההרצה, גם אחרי חריגה או ביטול: Run-ים שלא נסגרו נסגרים, המשימה מקבלת
+        סטטוס סופי (BatchRecorder כותב כאן את כל ה-batch) ונשלח done.
+        """
+        reason = "task canceled" if final == TaskStatus.CANCELED.value else f"task failed: {error}"
+        for job in jobs:
+            if job.run_id in ex.settled and ex.settled[job.run_id].is_set():
+                continue
+            if job.run_id in ex.started:
+                status = (
+                    RunStatus.CANCELED.value
+                    if final == TaskStatus.CANCELED.value
+                    else RunStatus.FAILED.value
+                )
+                await rec.ended(task_id, job, status, -1, error or "canceled")
+            else:
+                await rec.skipped(task_id, job, reason)
+            ex.settle(job.run_id)
+        await rec.finished(task_id, final)
+        done = {"status": final}
+        if error:
+            done["error"] = error
+        await publish_done(task_id, done)
+
+    async def _run_job(
+        self, task_id: str, job: RunJob, rec: DbRecorder, timeout, preexec_fn, ex: _Execution
+    ) -> bool:
+        await rec.started(task_id, job)
+        ex.started.add(job.run_id)
+        await publish_update(
+            task_id,
+            {"event": "action_start", "run_id": job.run_id, "action_id": job.action_id},
+        )
+        return await self._run_shell(task_id, job, rec, timeout, preexec_fn, ex)
+
+    async def _run_shell(
+        self, task_id: str, job: RunJob, rec: DbRecorder, timeout, preexec_fn, ex: _Execution
+    ) -> bool:
+        error: str | None = None
+        status: str | None = None
+        try:
+            if not job.cmd:
+                raise RuntimeError("Missing shell cmd")
+            # ה-shell רץ כ-task נפרד: ביטול שלו (cancel_run/cancel_task) לא מבטל את המשימה
+            shell = asyncio.get_running_loop().create_task(
+                run_shell_to_files(
+                    job.cmd,
+                    job.stdout_path,
+                    job.stderr_path,
+                    cwd=os.path.expanduser("~"),
+                    timeout=timeout,
+                    preexec_fn=preexec_fn,
+                    on_output=OutputPublisher(task_id, job.run_id, job.action_id),
+                )
+            )
+            ex.shells[job.run_id] = shell
+            if ex.is_canceled(job.run_id):
+                shell.cancel()
+            try:
+                exit_code = await shell
+            finally:
+                ex.shells.pop(job.run_id, None)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # ההרצה כולה מבוטלת (shutdown)
+                await rec.ended(task_id, job, RunStatus.CANCELED.value, -1, "canceled")
+                ex.settle(job.run_id)
+                raise
+            exit_code, error, status = -1, "canceled", RunStatus.CANCELED.value
+        except TimeoutError:
+            exit_code, error = -1, f"timeout({timeout}s)"
+        except Exception as e:
+            exit_code, error = -2, str(e)
+
+        if status is None:
+            status = RunStatus.SUCCEEDED.value if exit_code == 0 else RunStatus.FAILED.value
+        await rec.ended(task_id, job, status, exit_code, error)
+        ex.settle(job.run_id)
+        # "run_status" ולא "status" — אחרת ה-SSE יפרש סיום של action כסיום המשימה
+        await publish_update(
+            task_id,
+            {
+                "event": "action_end",
+                "run_id": job.run_id,
+                "action_id": job.action_id,
+                "run_status": status,
+                "exit_code": exit_code,
+            },
+        )
+        return status == RunStatus.SUCCEEDED.value
+
+    def find_task(self, run_id: str) -> str | None:
+        """ה-task_id של Run שרץ (או ממתין להרצה) בתהליך הזה."""
+        for task_id, ex in self._executions.items():
+            if run_id in ex.run_ids:
+                return task_id
+        return None
+
+    async def cancel_task(self, task_id: str, *, wait: float | None = CANCEL_GRACE_SEC + 2) -> bool:
+        """
+        מבטל משימה שרצה כאן: ה-actions הפעילים נעצרים, השאר מדולגים, והמשימה
+        נגמרת ב-CANCELED (עם אירוע done). ממתין עד wait שניות לסיום.
+        False אם המשימה לא רצה בתהליך הזה.
+        """
+        ex = self._executions.get(task_id)
+        if ex is None:
+            return False
+        ex.canceled = True
+        for shell in list(ex.shells.values()):
+            shell.cancel()
+        await _wait(ex.done, wait)
+        return True
+
+    async def cancel_run(self, run_id: str, *, wait: float | None = CANCEL_GRACE_SEC + 2) -> bool:
+        """
+        מבטל Run אחד: אם רץ — נעצר ומסומן CANCELED; אם עוד לא התחיל — מדולג.
+        כמו כישלון: actions שתלויים בו (depends_on) מדולגים, ובשרשרת הרציפה
+        ההמשך רץ. False אם ה-Run לא שייך להרצה בתהליך הזה.
+        """
+        task_id = self.find_task(run_id)
+        if task_id is None:
+            return False
+        ex = self._executions[task_id]
+        ex.canceled_runs.add(run_id)
+        shell = ex.shells.get(run_id)
+        if shell is not None:
+            shell.cancel()
+        await _wait(ex.settled.setdefault(run_id, asyncio.Event()), wait)
+        return True
+
+    async def shutdown(self) -> None:
+        """מבטל את כל ההרצות הפתוחות (נקרא ב-shutdown של האפליקציה)."""
+        tasks = list(self._inflight.values())
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+engine = ExecutionEngine()
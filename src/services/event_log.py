@@ -0,0 +1,259 @@
+"""
+לוג אירועים לכל משימה, עבור SSE שאפשר לחדש (Last-Event-ID).
+
+כל אירוע שמתפרסם ל-/stream/tasks/{task_id} מקבל seq רץ בתוך המשימה (ה-id: של
+ה-SSE) ונשמר ב-ring חסום בזיכרון. אירועים שנדחקים מה-ring, וכל ה-ring כשהמשימה
+מסתיימת, נכתבים ל-event_logs (ה-DB האסינכרוני של lucy_agent) ב-batch ברקע.
+replay קורא מה-ring כשהוא מכסה את הטווח המבוקש ומשלים מה-DB כשלא.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+from typing import Any
+
+from sqlalchemy import func, inspect, select
+
+from ..lucy_agent.db import SessionLocal, engine
+from ..lucy_agent.models import EventLog
+
+_RING_SIZE = int(os.environ.get("LUCY_STREAM_REPLAY_RING", "512"))
+# כמה משימות נשמרות בזיכרון (LRU); משימה שהסתיימה שומרת רק seq ואירוע סופי
+_MAX_TASKS = int(os.environ.get("LUCY_STREAM_REPLAY_TASKS", "4096"))
+_SPILL_DELAY_SEC = float(os.environ.get("LUCY_STREAM_SPILL_DELAY_SECONDS", "0.5"))
+_REPLAY_PAGE = int(os.environ.get("LUCY_STREAM_REPLAY_PAGE", "500"))
+
+
+def _migrate(conn) -> None:
+    """יוצר את event_logs, ומוסיף את seq (והאינדקס שלו) לטבלה שנוצרה לפני שהיה."""
+    EventLog.__table__.create(conn, checkfirst=True)
+    if "seq" not in {c["name"] for c in inspect(conn).get_columns("event_logs")}:
+        conn.exec_driver_sql("ALTER TABLE event_logs ADD COLUMN seq INTEGER")
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_event_logs_task_seq ON event_logs (task_id, seq)"
+        )
+
+
+class _TaskLog:
+    __slots__ = ("seq", "ring", "spilled", "terminal", "watched", "ready")
+
+    def __init__(self) -> None:
+        self.seq = 0
+        self.ring: deque[dict[str, Any]] = deque()
+        self.spilled = 0  # ה-seq האחרון שכבר נמסר לכתיבה ל-DB
+        self.terminal: dict[str, Any] | None = None
+        self.watched = False
+        self.ready = asyncio.Event()
+
+
+class EventLogStore:
+    def __init__(
+        self,
+        ring_size: int = _RING_SIZE,
+        max_tasks: int = _MAX_TASKS,
+        *,
+        session_factory=SessionLocal,
+        db_engine=engine,
+    ) -> None:
+        self.ring_size = max(1, ring_size)
+        self.max_tasks = max(1, max_tasks)
+        self._session_factory = session_factory
+        self._engine = db_engine
+        self._logs: OrderedDict[str, _TaskLog] = OrderedDict()
+        self._pending: list[EventLog] = []
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._table_ready = False
+        self.spilled = 0
+        self.spill_errors = 0
+
+    # ---------- כתיבה ----------
+    def watch(self, task_id: str) -> None:
+        """
+        מסמן שמישהו מאזין למשימה; רק אירועים של משימות מסומנות נרשמים, כך שמשימה
+        שאף אחד לא צופה בה לא עולה כלום (הפלט שלה ממילא בקובץ הלוג של ה-run).
+        """
+        log = self._logs.get(task_id)
+        if log is None:
+            log = self._logs[task_id] = _TaskLog()
+            self._evict()
+            self._start_loading(task_id, log)
+        log.watched = True
+
+    def is_watched(self, task_id: str) -> bool:
+        log = self._logs.get(task_id)
+        return log is not None and log.watched
+
+    async def record(
+        self, task_id: str, evt: dict[str, Any], *, terminal: bool = False
+    ) -> dict[str, Any]:
+        """מוסיף את evt ללוג ומחזיר עותק שלו עם "id" (ה-seq)."""
+        log = await self._open(task_id)
+        log.seq += 1
+        evt = {**evt, "id": log.seq}
+        log.ring.append(evt)
+        if len(log.ring) > self.ring_size:
+            old = log.ring.popleft()
+            if old["id"] > log.spilled:
+                self._spill(task_id, [old])
+                log.spilled = old["id"]
+        if terminal:
+            # המשימה הסתיימה: הכול עובר ל-DB ובזיכרון נשאר רק ה-seq והאירוע הסופי
+            log.terminal = evt
+            self._spill(task_id, [e for e in log.ring if e["id"] > log.spilled])
+            log.spilled = log.seq
+            log.ring.clear()
+        return evt
+
+    async def _open(self, task_id: str) -> _TaskLog:
+        log = self._logs.get(task_id)
+        if log is None:
+            log = self._logs[task_id] = _TaskLog()
+            self._evict()
+            self._start_loading(task_id, log)
+        else:
+            self._logs.move_to_end(task_id)
+        await log.ready.wait()
+        return log
+
+    def _start_loading(self, task_id: str, log: _TaskLog) -> None:
+        """ממשיך את ה-seq מה-DB (המשימה כבר רצה בעבר, או שנדחקה מה-LRU)."""
+
+        async def load() -> None:
+            try:
+                log.seq = log.spilled = await self._max_seq(task_id)
+            except Exception:
+                self.spill_errors += 1
+            finally:
+                log.ready.set()
+
+        asyncio.get_running_loop().create_task(load())
+
+    def _evict(self) -> None:
+        while len(self._logs) > self.max_tasks:
+            task_id, log = self._logs.popitem(last=False)
+            self._spill(task_id, [e for e in log.ring if e["id"] > log.spilled])
+
+    def _spill(self, task_id: str, events: list[dict[str, Any]]) -> None:
+        for evt in events:
+            self._pending.append(
+                EventLog(
+                    task_id=task_id,
+                    seq=evt["id"],
+                    ts=datetime.fromtimestamp(evt.get("ts", 0), UTC),
+                    event_type=evt["type"],
+                    payload=evt.get("data"),
+                )
+            )
+        if self._pending and self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(_SPILL_DELAY_SEC)
+            await self.flush()
+        finally:
+            self._flusher = None
+
+    async def flush(self) -> None:
+        """כותב את כל מה שממתין ל-DB בקומיט אחד."""
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                await self._ensure_table()
+                async with self._session_factory() as s:
+                    s.add_all(rows)
+                    await s.commit()
+                self.spilled += len(rows)
+            except Exception:
+                # הלוג הוא best-effort: כשל כתיבה לא מפיל את ה-stream
+                self.spill_errors += 1
+
+    async def close(self) -> None:
+        """כותב ל-DB את כל ה-rings (shutdown), כדי שה-seq ימשיך נכון אחרי הפעלה מחדש."""
+        for task_id, log in self._logs.items():
+            self._spill(task_id, [e for e in log.ring if e["id"] > log.spilled])
+            log.spilled = log.seq
+        await self.flush()
+
+    async def _ensure_table(self) -> None:
+        if not self._table_ready:
+            async with self._engine.begin() as conn:
+                await conn.run_sync(_migrate)
+            self._table_ready = True
+
+    # ---------- קריאה ----------
+    async def _max_seq(self, task_id: str) -> int:
+        await self.flush()
+        await self._ensure_table()
+        async with self._session_factory() as s:
+            return await s.scalar(
+                select(func.coalesce(func.max(EventLog.seq), 0)).where(EventLog.task_id == task_id)
+            )
+
+    async def _fetch(
+        self, task_id: str, after: int, limit: int, *, desc: bool = False
+    ) -> list[dict[str, Any]]:
+        await self.flush()
+        await self._ensure_table()
+        q = select(EventLog).where(EventLog.task_id == task_id, EventLog.seq > after)
+        q = q.order_by(EventLog.seq.desc() if desc else EventLog.seq).limit(limit)
+        async with self._session_factory() as s:
+            rows = (await s.scalars(q)).all()
+        return [
+            {
+                "type": r.event_type,
+                "data": r.payload,
+                "ts": r.ts.replace(tzinfo=UTC).timestamp(),
+                "id": r.seq,
+            }
+            for r in rows
+        ]
+
+    async def last(self, task_id: str) -> dict[str, Any] | None:
+        """האירוע האחרון של המשימה (מהזיכרון אם אפשר)."""
+        log = self._logs.get(task_id)
+        if log is not None:
+            await log.ready.wait()
+            if log.ring:
+                return log.ring[-1]
+            if log.terminal is not None:
+                return log.terminal
+        rows = await self._fetch(task_id, 0, 1, desc=True)
+        return rows[0] if rows else None
+
+    async def replay(self, task_id: str, after: int) -> AsyncIterator[dict[str, Any]]:
+        """כל האירועים עם seq > after, לפי הסדר; עמודים מה-DB ואז ה-ring."""
+        while True:
+            log = self._logs.get(task_id)
+            ring = list(log.ring) if log is not None else []
+            if not ring or ring[0]["id"] > after + 1:
+                page = await self._fetch(task_id, after, _REPLAY_PAGE)
+                if page:
+                    for evt in page:
+                        yield evt
+                        after = evt["id"]
+                    continue
+            for evt in ring:
+                if evt["id"] > after:
+                    yield evt
+                    after = evt["id"]
+            return
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "tasks": len(self._logs),
+            "ring_events": sum(len(log.ring) for log in self._logs.values()),
+            "pending_spill": len(self._pending),
+            "spilled": self.spilled,
+            "spill_errors": self.spill_errors,
+        }
+
+
+event_log = EventLogStore()
@@ -0,0 +1,150 @@
+"""
+httpx.AsyncClient משותפים לכל התהליך, עבור action ה-/http.
+
+לכל origin (scheme://host:port) ולכל צירוף הגדרות TLS יש client אחד עם pool
+חיבורים (keep-alive), כך שבקשות חוזרות לאותו שירות לא משלמות שוב על DNS,
+TCP ו-TLS. HTTP/2 נבחר ב-ALPN כשהשרת תומך (דורש את החבילה h2 —
+`pip install httpx[http2]`; בלעדיה נשארים ב-HTTP/1.1). clients שלא היו בשימוש
+_CLIENT_IDLE_SEC נסגרים ברקע.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import os
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any
+
+import httpx
+
+_MAX_CONNECTIONS = int(os.environ.get("LUCY_HTTP_MAX_CONNECTIONS", "100"))
+_MAX_KEEPALIVE = int(os.environ.get("LUCY_HTTP_MAX_KEEPALIVE", "20"))
+_KEEPALIVE_EXPIRY_SEC = float(os.environ.get("LUCY_HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+_CLIENT_IDLE_SEC = float(os.environ.get("LUCY_HTTP_CLIENT_IDLE_SECONDS", "300"))
+_HTTP2 = os.environ.get("LUCY_HTTP2", "auto")  # auto | 1 | 0
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+@dataclass(frozen=True)
+class ClientKey:
+    origin: str
+    verify: bool | str = True
+    cert: str | None = None
+
+
+@dataclass
+class _Entry:
+    client: httpx.AsyncClient
+    last_used: float
+    inflight: int = 0
+
+
+def _origin(url: str) -> str:
+    u = httpx.URL(url)
+    if not u.scheme or not u.host:
+        raise ValueError(f"Invalid URL: {url!r}")
+    return f"{u.scheme}://{u.host}:{u.port or (443 if u.scheme == 'https' else 80)}"
+
+
+class HttpClientPool:
+    def __init__(
+        self,
+        *,
+        max_connections: int = _MAX_CONNECTIONS,
+        max_keepalive: int = _MAX_KEEPALIVE,
+        keepalive_expiry: float = _KEEPALIVE_EXPIRY_SEC,
+        idle_timeout: float = _CLIENT_IDLE_SEC,
+        http2: str = _HTTP2,
+    ) -> None:
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.idle_timeout = idle_timeout
+        self.http2 = http2_available() if http2 == "auto" else http2 == "1"
+        self._clients: dict[ClientKey, _Entry] = {}
+        self._janitor: asyncio.Task | None = None
+        self.created = 0
+        self.evicted = 0
+
+    def _new_client(self, key: ClientKey) -> httpx.AsyncClient:
+        self.created += 1
+        return httpx.AsyncClient(
+            limits=self.limits,
+            http2=self.http2,
+            verify=key.verify,
+            cert=key.cert,
+            # client משותף לכל הקוראים — cookies של בקשה אחת לא נשמרים לבאות
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        )
+
+    @asynccontextmanager
+    async def client(
+        self, url: str, *, verify: bool | str = True, cert: str | None = None
+    ) -> AsyncIterator[httpx.AsyncClient]:
+        """ה-client המשותף ל-origin של url (נוצר בפעם הראשונה)."""
+        self.start()
+        key = ClientKey(_origin(url), verify, cert)
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = self._clients[key] = _Entry(self._new_client(key), time.monotonic())
+        entry.inflight += 1
+        try:
+            yield entry.client
+        finally:
+            entry.inflight -= 1
+            entry.last_used = time.monotonic()
+
+    async def evict_idle(self, now: float | None = None) -> int:
+        now = time.monotonic() if now is None else now
+        idle = [
+            k
+            for k, e in self._clients.items()
+            if not e.inflight and now - e.last_used >= self.idle_timeout
+        ]
+        for k in idle:
+            await self._clients.pop(k).client.aclose()
+        self.evicted += len(idle)
+        return len(idle)
+
+    async def _evict_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 2))
+            try:
+                await self.evict_idle()
+            except Exception:
+                pass
+
+    def start(self) -> None:
+        """מפעיל את ניקוי ה-clients הלא-פעילים (startup; נקרא גם בשימוש הראשון)."""
+        if self._janitor is None or self._janitor.done():
+            self._janitor = asyncio.get_running_loop().create_task(self._evict_loop())
+
+    async def close(self) -> None:
+        """סוגר את כל ה-clients (shutdown)."""
+        if self._janitor is not None:
+            self._janitor.cancel()
+            self._janitor = None
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(e.client.aclose() for e in clients), return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "inflight": sum(e.inflight for e in self._clients.values()),
+            "created": self.created,
+            "evicted": self.evicted,
+            "http2": self.http2,
+        }
+
+
+pool = HttpClientPool()
@@ -0,0 +1,536 @@
+"""
+תור הרצות עמיד על טבלת runs, עבור POST /tasks/{id}/run?mode=queue.
+
+ה-router יוצר Run-ים במצב PENDING ומסמן אותם ב-meta_json ($.queue.queued_at);
+רק Run-ים מסומנים שייכים לתור (mode=sync/async לא נוגעים בו). worker — בתהליך
+נפרד, כמה במקביל על אותו host — תופס משימה שלמה (כל ה-Run-ים הממתינים שלה,
+כדי שה-depends_on יישמר) ב-UPDATE אחד תחת BEGIN IMMEDIATE, עם lease
+($.queue.worker, $.queue.lease). בזמן הריצה heartbeat מאריך את ה-lease;
+worker שמת מפסיק להאריך, וה-Run-ים שלו (RUNNING עם lease שפג) חוזרים ל-PENDING
+ב-recover_expired — בהפעלה של כל worker ומדי LUCY_QUEUE_RECOVER_SECONDS.
+
+ההרצה היא at-least-once: Run שה-worker שלו מת באמצע רץ מההתחלה (קבצי הלוג נכתבים
+מחדש). SIGTERM ל-worker: מפסיק לתפוס ומחכה להרצות שלו; SIGTERM שני עוצר אותן
+ומחזיר את ה-Run-ים שלא הסתיימו לתור (PENDING) במקום לבטל אותם.
+
+ביטול (POST /tasks/{id}/cancel, /runs/{id}/cancel): Run שעוד לא נתפס עובר ישר
+ל-CANCELED; Run שנתפס מסומן ($.queue.cancel = "task"/"run"), וה-worker שמחזיק
+אותו רואה את הסימון תוך LUCY_QUEUE_CANCEL_POLL_SECONDS ועוצר אותו דרך המנוע.
+
+הפעלה: python -m src.services.job_queue --workers 4 (או LUCY_QUEUE_WORKERS
+תהליכים שה-API מרים ב-startup).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from dataclasses import dataclass
+from typing import Any
+from uuid import uuid4
+
+from sqlalchemy import literal_column, select, text
+
+from ..db.session import _engine, get_session
+from ..models.tasks import Action, Run, RunStatus, TaskStatus, now_iso
+from .engine import _DEP_FAILED, DbRecorder, RunJob, engine
+
+_LEASE_SEC = float(os.environ.get("LUCY_QUEUE_LEASE_SECONDS", "60"))
+_HEARTBEAT_SEC = float(os.environ.get("LUCY_QUEUE_HEARTBEAT_SECONDS", "15"))
+_POLL_SEC = float(os.environ.get("LUCY_QUEUE_POLL_SECONDS", "0.5"))
+_RECOVER_SEC = float(os.environ.get("LUCY_QUEUE_RECOVER_SECONDS", "30"))
+_CANCEL_POLL_SEC = float(os.environ.get("LUCY_QUEUE_CANCEL_POLL_SECONDS", "1"))
+# כמה משימות כל תהליך worker מריץ במקביל
+_WORKER_TASKS = int(os.environ.get("LUCY_QUEUE_WORKER_TASKS", "4"))
+# כמה תהליכי worker ה-API מרים בעצמו (0 = מריצים אותם בנפרד)
+WORKERS = int(os.environ.get("LUCY_QUEUE_WORKERS", "0"))
+# שגיאת DB ב-loop (database is locked וכו'): המתנה שמוכפלת בכל כשל רצוף, עד התקרה
+_ERROR_BACKOFF_MAX_SEC = float(os.environ.get("LUCY_QUEUE_ERROR_BACKOFF_MAX_SECONDS", "30"))
+
+log = logging.getLogger(__name__)
+
+
+def _queued(t: str) -> str:
+    """Run בתור: PENDING, מסומן, לא מבוטל ובלי lease בתוקף (t = שם הטבלה או ה-alias)."""
+    return f"""
+        {t}.status = 'PENDING'
+        AND json_valid({t}.meta_json)
+        AND json_extract({t}.meta_json, '$.queue.queued_at') IS NOT NULL
+        AND json_extract({t}.meta_json, '$.queue.cancel') IS NULL
+        AND coalesce(json_extract({t}.meta_json, '$.queue.lease'), 0) < :now
+    """
+
+
+# התור לפי queued_at (FIFO); כל ה-Run-ים הממתינים של המשימה הראשונה נתפסים יחד
+_CLAIM = text(
+    f"""
+    UPDATE runs SET meta_json = json_set(
+        meta_json,
+        '$.queue.worker', :worker,
+        '$.queue.lease', :lease,
+        '$.queue.attempts', coalesce(json_extract(meta_json, '$.queue.attempts'), 0) + 1
+    )
+    WHERE {_queued("runs")}
+      AND action_id IN (
+        SELECT a.id FROM actions a WHERE a.task_id = (
+          SELECT qa.task_id FROM runs q JOIN actions qa ON qa.id = q.action_id
+          WHERE {_queued("q")}
+          ORDER BY json_extract(q.meta_json, '$.queue.queued_at')
+          LIMIT 1
+        )
+      )
+    RETURNING id
+    """
+)
+
+_HEARTBEAT = text(
+    """
+    UPDATE runs SET meta_json = json_set(meta_json, '$.queue.lease', :lease)
+    WHERE id IN (SELECT value FROM json_each(:ids))
+      AND json_valid(meta_json)
+      AND json_extract(meta_json, '$.queue.worker') = :worker
+    """
+)
+
+# worker שמת: ה-Run-ים שלו חוזרים לתור (PENDING בלי lease), ומה שבוטל — CANCELED
+_RECOVER = text(
+    """
+    UPDATE runs SET
+        status = CASE WHEN json_extract(meta_json, '$.queue.cancel') IS NULL
+                      THEN 'PENDING' ELSE 'CANCELED' END,
+        started_at = CASE WHEN json_extract(meta_json, '$.queue.cancel') IS NULL
+                          THEN NULL ELSE started_at END,
+        meta_json = json_remove(meta_json, '$.queue.lease', '$.queue.worker')
+    WHERE status IN ('PENDING', 'RUNNING')
+      AND json_valid(meta_json)
+      AND json_extract(meta_json, '$.queue.queued_at') IS NOT NULL
+      AND json_extract(meta_json, '$.queue.lease') < :now
+    """
+)
+
+_RELEASE = text(
+    """
+    UPDATE runs SET status = 'PENDING', started_at = NULL, meta_json = json_remove(
+        meta_json, '$.queue.lease', '$.queue.worker'
+    )
+    WHERE id = :run_id AND json_extract(meta_json, '$.queue.worker') = :worker
+    """
+)
+
+
+# Run שלא נתפס (אין lease בתוקף) מבוטל מיד; Run שנתפס רק מסומן ל-worker
+_CANCEL = text(
+    """
+    UPDATE runs SET
+        meta_json = json_set(meta_json, '$.queue.cancel', :scope),
+        status = CASE WHEN status = 'PENDING'
+                       AND coalesce(json_extract(meta_json, '$.queue.lease'), 0) < :now
+                      THEN 'CANCELED' ELSE status END,
+        ended_at = CASE WHEN status = 'PENDING'
+                         AND coalesce(json_extract(meta_json, '$.queue.lease'), 0) < :now
+                        THEN :ended_at ELSE ended_at END
+    WHERE id IN (SELECT value FROM json_each(:ids))
+      AND status IN ('PENDING', 'RUNNING')
+      AND json_valid(meta_json)
+      AND json_extract(meta_json, '$.queue.queued_at') IS NOT NULL
+    RETURNING id, status
+    """
+)
+
+_CANCEL_FLAGS = text(
+    """
+    SELECT id, json_extract(meta_json, '$.queue.cancel') FROM runs
+    WHERE id IN (SELECT value FROM json_each(:ids))
+      AND json_valid(meta_json)
+      AND json_extract(meta_json, '$.queue.cancel') IS NOT NULL
+    """
+)
+
+
+def queue_meta(limit: int | None = None) -> str:
+    """meta_json ל-Run חדש בתור; limit = max_parallel של המשימה."""
+    return json.dumps({"queue": {"queued_at": time.time(), "limit": limit}})
+
+
+def _write(stmt, params: dict[str, Any]) -> list[Any]:
+    """statement כתיבה אחד בטרנזקציה עם נעילת כתיבה מההתחלה (BEGIN IMMEDIATE)."""
+    with _engine.connect() as conn:
+        # בלי IMMEDIATE, שני workers שקראו את אותו מצב נכשלים בשדרוג הנעילה
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            res = conn.execute(stmt, params)
+            rows = res.all() if res.returns_rows else [res.rowcount]
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return rows
+
+
+def claim(worker: str, *, lease: float = _LEASE_SEC, now: float | None = None) -> list[str]:
+    """תופס את המשימה הבאה בתור; מחזיר את ה-run ids שנתפסו (ריק = התור ריק)."""
+    now = time.time() if now is None else now
+    rows = _write(_CLAIM, {"worker": worker, "lease": now + lease, "now": now})
+    return [r[0] for r in rows]
+
+
+def heartbeat(worker: str, run_ids: list[str], *, lease: float = _LEASE_SEC) -> int:
+    """מאריך את ה-lease; מחזיר כמה Run-ים עדיין שייכים ל-worker."""
+    params = {"worker": worker, "ids": json.dumps(run_ids), "lease": time.time() + lease}
+    return _write(_HEARTBEAT, params)[0]
+
+
+def recover_expired(now: float | None = None) -> int:
+    """Run-ים בתור שה-lease שלהם פג (ה-worker מת) חוזרים ל-PENDING."""
+    return _write(_RECOVER, {"now": time.time() if now is None else now})[0]
+
+
+def release(worker: str, run_id: str) -> None:
+    _write(_RELEASE, {"worker": worker, "run_id": run_id})
+
+
+def request_cancel(run_ids: list[str], scope: str = "task") -> tuple[list[str], list[str]]:
+    """
+    מבטל Run-ים בתור (scope: "task" / "run"). מחזיר (canceled, signaled): אלה
+    שבוטלו מיד, ואלה שנתפסו ע"י worker וממתינים שהוא יעצור אותם.
+    """
+    params = {
+        "ids": json.dumps(run_ids),
+        "scope": scope,
+        "now": time.time(),
+        "ended_at": now_iso(),
+    }
+    rows = _write(_CANCEL, params)
+    canceled = [r[0] for r in rows if r[1] == RunStatus.CANCELED.value]
+    return canceled, [r[0] for r in rows if r[1] != RunStatus.CANCELED.value]
+
+
+def cancel_flags(run_ids: list[str]) -> dict[str, str]:
+    """run_id -> scope לכל Run מהרשימה שסומן לביטול."""
+    with _engine.connect() as conn:
+        return dict(conn.execute(_CANCEL_FLAGS, {"ids": json.dumps(run_ids)}).all())
+
+
+@dataclass
+class Claim:
+    task_id: str
+    run_ids: list[str]
+    jobs: list[RunJob]
+    limit: int | None
+
+
+_RUN_ROWID = literal_column("runs.rowid")
+
+
+def _last_run_status(s, task_id: str, idxs: set[int]) -> dict[int, str]:
+    """הסטטוס של ה-Run האחרון של כל action (לפי idx) — לתלויות שלא נתפסו עכשיו."""
+    rows = s.execute(
+        select(Action.idx, Run.status)
+        .join(Run, Run.action_id == Action.id)
+        .where(Action.task_id == task_id, Action.idx.in_(idxs))
+        .order_by(_RUN_ROWID)
+    ).all()
+    return {idx: status for idx, status in rows}
+
+
+def load_claim(run_ids: list[str]) -> Claim | None:
+    """RunJob-ים ל-Run-ים שנתפסו (cmd ו-depends_on מה-action); None אם הם כבר לא קיימים."""
+    with get_session() as s:
+        rows = s.execute(
+            select(Run, Action)
+            .join(Action, Run.action_id == Action.id)
+            .where(Run.id.in_(run_ids))
+            .order_by(Action.idx)
+        ).all()
+        if not rows:
+            # המשימה נמחקה בין ה-claim לטעינה
+            return None
+        params_of = {a.idx: json.loads(a.params_json or "{}") for _, a in rows}
+        claimed = set(params_of)
+        deps = {d for p in params_of.values() for d in p.get("depends_on") or ()}
+        outside = deps - claimed
+        ended = _last_run_status(s, rows[0][1].task_id, outside) if outside else {}
+    jobs: list[RunJob] = []
+    limit = None
+    for r, a in rows:
+        params = params_of[a.idx]
+        depends_on = params.get("depends_on")
+        dep_failed = False
+        if depends_on is not None:
+            # תלות ב-Run שכבר הסתיים לפני שהמשימה חזרה לתור — כבר לא ממתינים לה, אבל
+            # רק הצלחה משחררת; כל מצב אחר (FAILED, CANCELED...) — ה-Run מדולג
+            dep_failed = any(
+                ended.get(d) != RunStatus.SUCCEEDED.value for d in depends_on if d not in claimed
+            )
+            depends_on = [d for d in depends_on if d in claimed]
+        jobs.append(
+            RunJob(
+                r.id,
+                a.id,
+                params.get("cmd", ""),
+                r.stdout_path,
+                r.stderr_path,
+                idx=a.idx,
+                depends_on=depends_on,
+                dep_failed=dep_failed,
+            )
+        )
+        limit = json.loads(r.meta_json)["queue"].get("limit") or limit
+    return Claim(rows[0][1].task_id, run_ids, jobs, limit)
+
+
+class _QueueRecorder(DbRecorder):
+    """
+    DbRecorder שיודע לשחרר: בעצירה מסודרת Run שבוטל חוזר לתור (PENDING) והמשימה
+    נשארת RUNNING; אחרי שה-lease אבד (worker אחר תפס) לא נכתב כלום.
+    """
+
+    def __init__(self, worker: str) -> None:
+        self.worker = worker
+        self.releasing = False
+        self.detached = False
+
+    async def started(self, task_id, job) -> None:
+        if not self.detached:
+            await super().started(task_id, job)
+
+    async def ended(self, task_id, job, status, exit_code, error) -> None:
+        if self.detached:
+            return
+        if self.releasing and status == RunStatus.CANCELED.value:
+            await asyncio.to_thread(release, self.worker, job.run_id)
+            return
+        await super().ended(task_id, job, status, exit_code, error)
+
+    async def skipped(self, task_id, job, reason=_DEP_FAILED) -> None:
+        if self.detached:
+            return
+        if self.releasing:
+            # Run שלא התחיל בעצירה מסודרת — חוזר לתור ולא מבוטל
+            await asyncio.to_thread(release, self.worker, job.run_id)
+            return
+        await super().skipped(task_id, job, reason)
+
+    async def finished(self, task_id, status) -> None:
+        if self.detached or (self.releasing and status == TaskStatus.CANCELED.value):
+            return
+        await super().finished(task_id, status)
+
+
+class QueueWorker:
+    def __init__(
+        self,
+        worker_id: str | None = None,
+        *,
+        tasks: int = _WORKER_TASKS,
+        lease: float = _LEASE_SEC,
+        heartbeat_every: float = _HEARTBEAT_SEC,
+        poll: float = _POLL_SEC,
+    ) -> None:
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.tasks = max(1, tasks)
+        self.lease = lease
+        self.heartbeat_every = min(heartbeat_every, lease / 3)
+        self.poll = poll
+        self._inflight: dict[asyncio.Task, _QueueRecorder] = {}
+        self._claims: dict[str, Claim] = {}
+        self._cancels: set[asyncio.Task] = set()
+        self._canceled: set[str] = set()
+        self._stopping = asyncio.Event()
+        self.completed = 0
+        self.lost_leases = 0
+
+    def stop(self) -> None:
+        """מפסיק לתפוס משימות חדשות; run() מחכה לאלה שרצות."""
+        self._stopping.set()
+
+    async def run(self) -> None:
+        last_recover = last_cancel = 0.0
+        errors = 0
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            delay = min(self.poll, _CANCEL_POLL_SEC)
+            try:
+                if now - last_recover >= _RECOVER_SEC:
+                    # גם כשנכשל — הסבב הבא בעוד _RECOVER_SEC, בלי לעכב את ה-claim
+                    last_recover = now
+                    await asyncio.to_thread(recover_expired)
+                if self._claims and now - last_cancel >= _CANCEL_POLL_SEC:
+                    await self._check_cancels()
+                    last_cancel = now
+                claimed = len(self._inflight) < self.tasks and await self._claim_next()
+                errors = 0
+            except Exception:
+                # ה-worker לא מת על DB עסוק/שגיאה — ההרצות שלו ממשיכות, וה-loop מנסה שוב
+                errors += 1
+                claimed = False
+                delay = min(_ERROR_BACKOFF_MAX_SEC, self.poll * 2**errors)
+                log.exception("queue worker %s: loop error (retry in %.1fs)", self.worker_id, delay)
+            if claimed:
+                continue
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+            except TimeoutError:
+                pass
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _claim_next(self) -> bool:
+        """תופס משימה ומתחיל אותה ברקע; False אם התור ריק."""
+        run_ids = await asyncio.to_thread(claim, self.worker_id, lease=self.lease)
+        if not run_ids:
+            return False
+        try:
+            c = await asyncio.to_thread(load_claim, run_ids)
+        except Exception:
+            # חוזרים לתור מיד, לא רק כשה-lease יפוג (אם גם זה נכשל — recover_expired)
+            with contextlib.suppress(Exception):
+                await asyncio.to_thread(self._release_all, run_ids)
+            raise
+        if c is None:
+            return True
+        rec = _QueueRecorder(self.worker_id)
+        t = asyncio.get_running_loop().create_task(self._execute(c, rec))
+        self._inflight[t] = rec
+        t.add_done_callback(self._inflight.pop)
+        return True
+
+    def _release_all(self, run_ids: list[str]) -> None:
+        for run_id in run_ids:
+            release(self.worker_id, run_id)
+
+    async def shutdown(self) -> None:
+        """עצירה מיידית: ההרצות נעצרות וה-Run-ים שלא הסתיימו חוזרים לתור."""
+        self.stop()
+        for t, rec in list(self._inflight.items()):
+            rec.releasing = True
+            t.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _check_cancels(self) -> None:
+        """Run-ים שסומנו לביטול ב-DB נעצרים דרך המנוע (ברקע — הביטול ממתין ל-grace)."""
+        owner = {r: c.task_id for c in self._claims.values() for r in c.run_ids}
+        ids = [r for r in owner if r not in self._canceled]
+        if not ids:
+            return
+        try:
+            flags = await asyncio.to_thread(cancel_flags, ids)
+        except Exception:
+            return  # DB עסוק — בסבב הבא
+        for run_id, scope in flags.items():
+            self._canceled.add(run_id)
+            if scope == "task":
+                coro = engine.cancel_task(owner[run_id], wait=None)
+            else:
+                coro = engine.cancel_run(run_id, wait=None)
+            t = asyncio.get_running_loop().create_task(coro)
+            self._cancels.add(t)
+            t.add_done_callback(self._cancels.discard)
+
+    async def _execute(self, c: Claim, rec: _QueueRecorder) -> None:
+        run = asyncio.current_task()
+        beat = asyncio.get_running_loop().create_task(self._heartbeat(c, rec, run))
+        self._claims[c.task_id] = c
+        try:
+            await engine.execute(c.task_id, c.jobs, limit=c.limit, recorder=rec)
+            self.completed += 1
+        finally:
+            beat.cancel()
+            self._claims.pop(c.task_id, None)
+            self._canceled.difference_update(c.run_ids)
+
+    async def _heartbeat(self, c: Claim, rec: _QueueRecorder, run: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_every)
+            try:
+                owned = await asyncio.to_thread(
+                    heartbeat, self.worker_id, c.run_ids, lease=self.lease
+                )
+            except Exception:
+                continue  # DB עסוק — ננסה שוב לפני שה-lease פג
+            if not owned:
+                # ה-lease פג (ה-loop נתקע) ו-worker אחר כבר הריץ/תפס — עוצרים בלי לכתוב
+                self.lost_leases += 1
+                rec.detached = True
+                run.cancel()
+                return
+
+
+# ------------------ תהליכי worker ------------------
+def worker_main(tasks: int = _WORKER_TASKS) -> None:
+    """נקודת הכניסה של תהליך worker: SIGTERM/SIGINT — סיום מסודר, פעם שנייה — מיידי."""
+
+    async def main() -> None:
+        w = QueueWorker(tasks=tasks)
+        loop = asyncio.get_running_loop()
+        signals = 0
+
+        def on_signal() -> None:
+            nonlocal signals
+            signals += 1
+            if signals == 1:
+                w.stop()
+            else:
+                loop.create_task(w.shutdown())
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, on_signal)
+        await w.run()
+
+    asyncio.run(main())
+
+
+def start_workers(n: int, tasks: int = _WORKER_TASKS) -> list[multiprocessing.Process]:
+    # spawn: תהליך נקי, בלי ה-event loop וה-threads של ה-API
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=worker_main, args=(tasks,), name=f"lucy-queue-{i}", daemon=True)
+        for i in range(n)
+    ]
+    for p in procs:
+        p.start()
+    return procs
+
+
+def stop_workers(procs: list[multiprocessing.Process], timeout: float = 10) -> None:
+    """SIGTERM (מסיימים את מה שרץ); אחרי timeout — SIGTERM שני (ה-Run-ים חוזרים לתור)."""
+    for p in procs:
+        p.terminate()
+    for grace in (timeout, 5.0):
+        deadline = time.monotonic() + grace
+        for p in procs:
+            p.join(max(0.0, deadline - time.monotonic()))
+        alive = [p for p in procs if p.is_alive()]
+        if not alive:
+            return
+        for p in alive:
+            p.terminate()
+    for p in procs:
+        if p.is_alive():
+            p.kill()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="lucy-agent queue workers")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--tasks", type=int, default=_WORKER_TASKS, help="tasks per worker")
+    args = ap.parse_args()
+    procs = start_workers(args.workers, args.tasks)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        stop_workers(procs)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,19 @@
+import asyncio
+import os
+import signal
 import subprocess
+from collections.abc import Awaitable, Callable
 from pathlib import Path
 
+# גודל קריאה מה-pipe (ולכן גודל מקסימלי של chunk פלט חי)
+_CHUNK_BYTES = int(os.environ.get("LUCY_STREAM_CHUNK_BYTES", "4096"))
+# אחרי שה-shell יצא: כמה זמן לחכות ל-EOF מצאצאים שעדיין מחזיקים את ה-pipe
+_PIPE_DRAIN_GRACE_SEC = float(os.environ.get("LUCY_PIPE_DRAIN_GRACE_SECONDS", "2"))
+# ביטול: SIGTERM לקבוצת התהליכים, ומי שלא יצא תוך _CANCEL_GRACE_SEC מקבל SIGKILL
+CANCEL_GRACE_SEC = float(os.environ.get("LUCY_CANCEL_GRACE_SECONDS", "3"))
+
+OutputCallback = Callable[[str, bytes], Awaitable[None]]
+
 
 def ensure_run_dir(run_id: str) -> Path:
     base = Path.home() / ".local" / "share" / "lucy-agent" / "runs" / run_id
@@ -16,3 +29,223 @@ def run_shell_command(run_id: str, cmd: str) -> tuple[int, str, str]:
         p = subprocess.Popen(["/bin/bash", "-lc", cmd], stdout=out, stderr=err)
         ret = p.wait()
     return ret, str(stdout_file), str(stderr_file)
+
+
+def tail_bytes(path: str | None, limit: int = 400) -> str | None:
+    if not path:
+        return None
+    try:
+        p = Path(path)
+        if not p.exists() or not p.is_file():
+            return None
+        size = p.stat().st_size
+        with open(p, "rb") as f:
+            if size > limit:
+                f.seek(-limit, os.SEEK_END)
+            data = f.read()
+        try:
+            return data.decode("utf-8", "ignore")
+        except Exception:
+            return data.decode("latin-1", "ignore")
+    except Exception:
+        return None
+
+
+def kill_process_group(proc, sig: int = signal.SIGKILL) -> None:
+    """שולח signal לכל קבוצת התהליכים (התהליך נפתח עם start_new_session=True)."""
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def terminate_process_group(proc, grace: float = CANCEL_GRACE_SEC) -> None:
+    """
+    SIGTERM לכל הקבוצה ו-grace שניות לתהליך הראשי לצאת; אחר כך (או אם ההמתנה
+    עצמה בוטלה) SIGKILL למי שנשאר בקבוצה. חוזר כשהתהליך הראשי כבר נאסף.
+    """
+    kill_process_group(proc, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(asyncio.shield(proc.wait()), grace)
+    except TimeoutError:
+        pass
+    finally:
+        kill_process_group(proc)
+        await proc.wait()
+
+
+async def run_shell_to_files(
+    cmd: str,
+    stdout_path: str | Path,
+    stderr_path: str | Path,
+    *,
+    cwd: str | None = None,
+    timeout: float | None = None,
+    preexec_fn=None,
+    on_output: OutputCallback | None = None,
+) -> int:
+    """
+    מריץ פקודת shell כ-asyncio subprocess וכותב stdout/stderr לקבצים.
+    לא חוסם את ה-event loop; ב-timeout/ביטול הורג את כל קבוצת התהליכים ומעלה את החריג.
+    עם on_output: הפלט נקרא מ-pipes בחלקים, נכתב לקבצים (tee) ו-on_output(stream, chunk)
+    נקרא לכל chunk; await על ה-callback מאט את הקריאה (backpressure).
+    """
+    Path(stdout_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(stderr_path).parent.mkdir(parents=True, exist_ok=True)
+    if on_output is not None:
+        return await _run_piped(cmd, stdout_path, stderr_path, on_output, cwd, timeout, preexec_fn)
+    with open(stdout_path, "wb") as out, open(stderr_path, "wb") as err:
+        proc = await asyncio.create_subprocess_shell(
+            cmd,
+            stdout=out,
+            stderr=err,
+            cwd=cwd,
+            start_new_session=True,
+            preexec_fn=preexec_fn,
+        )
+        try:
+            return await asyncio.wait_for(proc.wait(), timeout=timeout)
+        except asyncio.CancelledError:
+            await terminate_process_group(proc)
+            raise
+        except BaseException:
+            kill_process_group(proc)
+            await proc.wait()
+            raise
+
+
+async def _pump(stream, path, name: str, on_output: OutputCallback) -> None:
+    with open(path, "wb") as f:
+        while True:
+            data = await stream.read(_CHUNK_BYTES)
+            if not data:
+                break
+            f.write(data)
+            try:
+                await on_output(name, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # כשל בפרסום לא עוצר את הכתיבה ללוג
+                pass
+
+
+async def _run_piped(cmd, stdout_path, stderr_path, on_output, cwd, timeout, preexec_fn) -> int:
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,
+        preexec_fn=preexec_fn,
+    )
+    pumps = asyncio.gather(
+        _pump(proc.stdout, stdout_path, "stdout", on_output),
+        _pump(proc.stderr, stderr_path, "stderr", on_output),
+    )
+    try:
+        async with asyncio.timeout(timeout):
+            # כמו ב-run_shell_capture: proc.wait() ממתין גם לסגירת ה-pipes, ואז צאצא
+            # ברקע ("cmd &", daemon) היה משאיר את ההרצה פתוחה עד שיסתיים
+            while proc.returncode is None and not pumps.done():
+                await asyncio.wait({pumps}, timeout=0.05)
+            rc = await proc.wait() if pumps.done() else proc.returncode
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            await terminate_process_group(proc)
+        else:
+            kill_process_group(proc)
+            await proc.wait()
+        pumps.cancel()
+        await asyncio.gather(pumps, return_exceptions=True)
+        raise
+    try:
+        # מה שכבר ב-pipe נקרא עד _PIPE_DRAIN_GRACE_SEC; הצאצא עצמו ממשיך לרוץ
+        await asyncio.wait_for(pumps, timeout=_PIPE_DRAIN_GRACE_SEC)
+    except TimeoutError:
+        await asyncio.gather(pumps, return_exceptions=True)
+    return rc
+
+
+# ------------------ פקודה קצרה עם פלט בזיכרון (action ה-/shell) ------------------
+class HeadTailBuffer:
+    """שומר את ה-head הבתים הראשונים ואת ה-tail האחרונים; מה שבאמצע רק נספר."""
+
+    def __init__(self, head: int, tail: int) -> None:
+        self.head_limit = head
+        self.tail_limit = tail
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data and self.tail_limit > 0:
+            self.tail += data
+            if len(self.tail) > self.tail_limit:
+                del self.tail[: len(self.tail) - self.tail_limit]
+
+    @property
+    def omitted(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def text(self) -> str:
+        out = self.head.decode("utf-8", "replace")
+        if self.omitted > 0:
+            out += f"\n... [{self.omitted} bytes truncated] ...\n"
+        return out + self.tail.decode("utf-8", "replace")
+
+
+async def run_shell_capture(
+    cmd: str,
+    *,
+    timeout: float | None = None,
+    head_bytes: int = 65536,
+    tail_bytes: int = 65536,
+    cwd: str | None = None,
+    preexec_fn=None,
+) -> tuple[int, HeadTailBuffer]:
+    """
+    מריץ פקודת shell כ-asyncio subprocess (stderr מאוחד ל-stdout) ומחזיר
+    (exit code, buffer) — בזיכרון נשמרים רק head/tail של הפלט. לא חוסם את ה-event
+    loop; ב-timeout/ביטול הורג את כל קבוצת התהליכים ומעלה את החריג.
+    """
+    buf = HeadTailBuffer(head_bytes, tail_bytes)
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        stdin=asyncio.subprocess.DEVNULL,
+        cwd=cwd,
+        start_new_session=True,
+        preexec_fn=preexec_fn,
+    )
+
+    async def pump() -> None:
+        while data := await proc.stdout.read(_CHUNK_BYTES):
+            buf.write(data)
+
+    reader = asyncio.ensure_future(pump())
+    try:
+        async with asyncio.timeout(timeout):
+            # proc.wait() ממתין גם לסגירת ה-pipe, ואז צאצא ברקע (למשל "cmd &") היה
+            # מעכב את התשובה עד שיסתיים; לכן בלי EOF בודקים גם את returncode
+            while proc.returncode is None and not reader.done():
+                await asyncio.wait({reader}, timeout=0.05)
+            rc = await proc.wait() if reader.done() else proc.returncode
+    except BaseException:
+        kill_process_group(proc)
+        await proc.wait()
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        raise
+    try:
+        # מה שכבר ב-pipe נקרא עד _PIPE_DRAIN_GRACE_SEC; הצאצא עצמו ממשיך לרוץ
+        await asyncio.wait_for(reader, timeout=_PIPE_DRAIN_GRACE_SEC)
+    except TimeoutError:
+        pass
+    return rc, buf
@@ -0,0 +1,129 @@
+"""
+תזמון actions לפי גרף תלויות (depends_on) על worker pool חסום.
+
+- אם אף action לא הגדיר depends_on — שרשרת רציפה לפי idx (ההתנהגות הקיימת:
+  כל ה-actions רצים גם אם קודם נכשל).
+- אם הוגדרו depends_on — actions בלתי תלויים רצים במקביל, ו-action שאחת
+  התלויות שלו לא הצליחה מדולג.
+- מגבלות: LUCY_MAX_CONCURRENCY לכל התהליך, LUCY_TASK_CONCURRENCY לכל משימה.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from collections.abc import Awaitable, Callable, Hashable
+from contextlib import asynccontextmanager
+from typing import TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+MAX_CONCURRENCY = int(os.environ.get("LUCY_MAX_CONCURRENCY", "32"))
+TASK_CONCURRENCY = int(os.environ.get("LUCY_TASK_CONCURRENCY", "4"))
+
+
+def build_graph(nodes: list[tuple[K, list[K] | None]]) -> tuple[dict[K, list[K]], bool]:
+    """
+    nodes: (key, depends_on) לפי סדר ההרצה הרציף.
+    מחזיר (deps, explicit) — explicit=True אם הוגדרו תלויות במפורש.
+    מעלה ValueError על תלות לא מוכרת, תלות עצמית או מעגל.
+    """
+    keys = [k for k, _ in nodes]
+    if not any(d is not None for _, d in nodes):
+        return {k: ([keys[i - 1]] if i else []) for i, k in enumerate(keys)}, False
+
+    known = set(keys)
+    deps: dict[K, list[K]] = {}
+    for k, d in nodes:
+        parents = list(dict.fromkeys(d or []))
+        for p in parents:
+            if p not in known:
+                raise ValueError(f"action {k!r} depends on unknown action {p!r}")
+            if p == k:
+                raise ValueError(f"action {k!r} depends on itself")
+        deps[k] = parents
+
+    # Kahn — כל צומת שלא שוחרר נמצא על מעגל
+    pending = {k: len(v) for k, v in deps.items()}
+    children: dict[K, list[K]] = {k: [] for k in deps}
+    for k, parents in deps.items():
+        for p in parents:
+            children[p].append(k)
+    ready = [k for k, n in pending.items() if n == 0]
+    seen = 0
+    while ready:
+        k = ready.pop()
+        seen += 1
+        for c in children[k]:
+            pending[c] -= 1
+            if pending[c] == 0:
+                ready.append(c)
+    if seen != len(deps):
+        raise ValueError("depends_on contains a cycle")
+    return deps, True
+
+
+class WorkerPool:
+    """Semaphore גלובלי לכל ההרצות בתהליך; נוצר בעצלות בתוך ה-event loop."""
+
+    def __init__(self, size: int) -> None:
+        self.size = max(1, size)
+        self.active = 0
+        self._sem: asyncio.Semaphore | None = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.size)
+        async with self._sem:
+            self.active += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+
+
+pool = WorkerPool(MAX_CONCURRENCY)
+
+
+async def run_graph(
+    deps: dict[K, list[K]],
+    worker: Callable[[K], Awaitable[bool]],
+    *,
+    on_skip: Callable[[K], Awaitable[None]] | None = None,
+    propagate_failure: bool = True,
+    limit: int | None = None,
+) -> dict[K, bool | None]:
+    """
+    מריץ worker(key) לכל צומת אחרי שכל התלויות שלו הסתיימו.
+    מחזיר key -> True (הצליח) / False (נכשל) / None (דולג). חריגה מ-worker
+    מבטלת את שאר הצמתים ועולה הלאה.
+    """
+    task_sem = asyncio.Semaphore(max(1, limit or TASK_CONCURRENCY))
+    done = {k: asyncio.Event() for k in deps}
+    results: dict[K, bool | None] = {}
+
+    async def node(k: K) -> None:
+        try:
+            for p in deps[k]:
+                await done[p].wait()
+            if propagate_failure and any(results.get(p) is not True for p in deps[k]):
+                results[k] = None
+                if on_skip is not None:
+                    await on_skip(k)
+                return
+            async with task_sem, pool.slot():
+                results[k] = bool(await worker(k))
+        finally:
+            done[k].set()
+
+    tasks = [asyncio.ensure_future(node(k)) for k in deps]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # worker שנכשל (או ביטול) עוצר את כל הגרף — לא משאירים צמתים רצים ברקע
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return results
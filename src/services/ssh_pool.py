@@ -0,0 +1,321 @@
+"""
+חיבורי SSH משותפים לכל התהליך, עבור action ה-/ssh.
+
+לכל (host, port, user, טביעת האצבע של פרטי ההזדהות) נשמרים חיבורים חיים;
+פקודות במקביל רצות כ-channels על אותו חיבור (עד _MAX_CHANNELS לחיבור, כמו
+MaxSessions של OpenSSH), ולכל host יש לכל היותר _MAX_PER_HOST חיבורים. כך 50
+פקודות קצרות לאותו host עולות handshake אחד ולא 50.
+
+בריאות: keepalive של asyncssh סוגר חיבור שהשרת הפסיק לענות לו, וחיבור סגור
+יוצא מה-pool. כשהשרת מסרב ל-channel (MaxSessions נמוך מ-_MAX_CHANNELS) החיבור
+נשאר, ורק מספר ה-channels המותר עליו יורד. חיבורים שלא היו בשימוש _IDLE_SEC
+נסגרים ברקע.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import Counter
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+import asyncssh
+
+_MAX_PER_HOST = int(os.environ.get("LUCY_SSH_MAX_CONNECTIONS_PER_HOST", "4"))
+_MAX_CHANNELS = int(os.environ.get("LUCY_SSH_MAX_CHANNELS", "10"))
+_IDLE_SEC = float(os.environ.get("LUCY_SSH_IDLE_SECONDS", "300"))
+_KEEPALIVE_SEC = float(os.environ.get("LUCY_SSH_KEEPALIVE_SECONDS", "30"))
+_KEEPALIVE_COUNT_MAX = int(os.environ.get("LUCY_SSH_KEEPALIVE_COUNT_MAX", "3"))
+
+# שגיאות שאחריהן החיבור לא שמיש יותר (נסגר ויוצא מה-pool). ChannelOpenError לא ביניהן:
+# הוא נוגע ל-channel אחד, וסגירה הייתה מפילה גם את שאר הפקודות שרצות על החיבור
+CONNECTION_ERRORS = (asyncssh.ConnectionLost, asyncssh.DisconnectError)
+
+
+@lru_cache(maxsize=64)
+def _key_from_file(path: str, mtime_ns: int, passphrase: str | None) -> asyncssh.SSHKey:
+    return asyncssh.read_private_key(path, passphrase)
+
+
+# מפתחות inline לפי sha256 של ה-PEM (וה-passphrase) — ה-PEM עצמו לא נשמר ב-cache
+_pem_keys: dict[str, asyncssh.SSHKey] = {}
+_PEM_CACHE_MAX = 64
+
+
+def _key_from_pem(pem: str, passphrase: str | None) -> asyncssh.SSHKey:
+    digest = hashlib.sha256(f"{pem}\0{passphrase or ''}".encode()).hexdigest()
+    key = _pem_keys.get(digest)
+    if key is None:
+        key = asyncssh.import_private_key(pem, passphrase)
+        if len(_pem_keys) >= _PEM_CACHE_MAX:
+            _pem_keys.pop(next(iter(_pem_keys)))
+        _pem_keys[digest] = key
+    return key
+
+
+def load_client_key(
+    path: str | None = None, pem: str | None = None, passphrase: str | None = None
+) -> asyncssh.SSHKey:
+    """מפתח פרטי מפוענח, מה-cache (קובץ שהשתנה נטען מחדש לפי mtime)."""
+    if pem:
+        return _key_from_pem(pem, passphrase)
+    path = os.path.expanduser(path or "")
+    return _key_from_file(path, os.stat(path).st_mtime_ns, passphrase)
+
+
+@lru_cache(maxsize=16)
+def _known_hosts_from_file(path: str, mtime_ns: int) -> asyncssh.SSHKnownHosts:
+    return asyncssh.read_known_hosts(path)
+
+
+def load_known_hosts(path: Any) -> Any:
+    """known_hosts מפוענח, מה-cache; None = בלי בדיקת host key (כמו AutoAddPolicy)."""
+    if not path or not isinstance(path, str):
+        # None, או ערך שכבר בפורמט ש-asyncssh מקבל (רשימת מפתחות וכו')
+        return path or None
+    path = os.path.expanduser(path)
+    return _known_hosts_from_file(path, os.stat(path).st_mtime_ns)
+
+
+@dataclass(frozen=True)
+class SshKey:
+    host: str
+    port: int
+    username: str
+    # טביעת האצבע של המפתח / hash של הסיסמה — חיבור לא משותף בין פרטי הזדהות שונים
+    credential: str
+    known_hosts: str | None = None
+
+
+def ssh_target(
+    host: str,
+    port: int,
+    username: str,
+    *,
+    password: str | None = None,
+    private_key_path: str | None = None,
+    private_key: str | None = None,
+    passphrase: str | None = None,
+    known_hosts: Any = None,
+    timeout: float | None = None,
+) -> tuple[SshKey, dict[str, Any]]:
+    """המפתח ב-pool ו-kwargs ל-asyncssh.connect עבור יעד אחד."""
+    options: dict[str, Any] = {
+        "host": host,
+        "port": port,
+        "username": username,
+        "known_hosts": load_known_hosts(known_hosts),
+        "login_timeout": timeout,
+        "connect_timeout": timeout,
+    }
+    credential = "default"
+    if private_key or private_key_path:
+        key = load_client_key(private_key_path, private_key, passphrase)
+        options["client_keys"] = [key]
+        credential = key.get_fingerprint()
+    if password:
+        options["password"] = password
+        credential += ":pw:" + hashlib.sha256(password.encode()).hexdigest()[:16]
+    kh = known_hosts if known_hosts is None or isinstance(known_hosts, str) else repr(known_hosts)
+    return SshKey(host, port, username, credential, kh), options
+
+
+@dataclass(eq=False)
+class _Conn:
+    key: SshKey
+    conn: asyncssh.SSHClientConnection
+    last_used: float
+    channels: int = 0
+    # נקבע כשהשרת סירב ל-channel: כמה channels הוא מקבל בפועל על החיבור הזה
+    max_channels: int | None = None
+
+
+class SshConnectionPool:
+    def __init__(
+        self,
+        *,
+        max_per_host: int = _MAX_PER_HOST,
+        max_channels: int = _MAX_CHANNELS,
+        idle_timeout: float = _IDLE_SEC,
+        keepalive: float = _KEEPALIVE_SEC,
+    ) -> None:
+        self.max_per_host = max(1, max_per_host)
+        self.max_channels = max(1, max_channels)
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self._conns: dict[SshKey, list[_Conn]] = {}
+        self._connecting: set[SshKey] = set()
+        self._per_host: Counter[tuple[str, int]] = Counter()
+        self._cond = asyncio.Condition()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._janitor: asyncio.Task | None = None
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @asynccontextmanager
+    async def connection(
+        self, key: SshKey, options: dict[str, Any], *, timeout: float | None = None
+    ) -> AsyncIterator[asyncssh.SSHClientConnection]:
+        """חיבור חי ל-key עם channel פנוי; timeout חל על ההמתנה ל-channel ועל ה-handshake."""
+        self._bind_loop()
+        self.start()
+        async with asyncio.timeout(timeout):
+            entry = await self._checkout(key, options)
+        try:
+            yield entry.conn
+        except CONNECTION_ERRORS:
+            entry.conn.close()
+            raise
+        except asyncssh.ChannelOpenError:
+            # החיבור מלא מבחינת השרת: ה-channels הפתוחים כרגע (בלי זה שנכשל) הם התקרה שלו
+            cap = max(1, entry.channels - 1)
+            entry.max_channels = min(cap, entry.max_channels or cap)
+            raise
+        finally:
+            async with self._cond:
+                entry.channels -= 1
+                entry.last_used = time.monotonic()
+                self._cond.notify_all()
+
+    def _bind_loop(self) -> None:
+        """חיבורים שייכים ל-event loop שבו נפתחו; ב-loop חדש (למשל בבדיקות) מתחילים מאפס."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._cond = asyncio.Condition()
+            self._conns.clear()
+            self._connecting.clear()
+            self._per_host.clear()
+            self._janitor = None
+
+    async def _checkout(self, key: SshKey, options: dict[str, Any]) -> _Conn:
+        host = (key.host, key.port)
+        async with self._cond:
+            while True:
+                self._prune(key)
+                free = [e for e in self._conns.get(key, ()) if e.channels < self._limit(e)]
+                if free:
+                    entry = min(free, key=lambda e: e.channels)
+                    entry.channels += 1
+                    self.reused += 1
+                    return entry
+                # חיבור אחד נפתח בכל פעם לכל key: השאר ממתינים ל-channels שלו
+                if key not in self._connecting:
+                    if self._per_host[host] >= self.max_per_host:
+                        self._close_idle_on(host)
+                    if self._per_host[host] < self.max_per_host:
+                        self._connecting.add(key)
+                        self._per_host[host] += 1
+                        break
+                await self._cond.wait()
+
+        try:
+            conn = await asyncssh.connect(
+                **options,
+                keepalive_interval=self.keepalive,
+                keepalive_count_max=_KEEPALIVE_COUNT_MAX,
+            )
+        except BaseException:
+            async with self._cond:
+                self._connecting.discard(key)
+                self._per_host[host] -= 1
+                self._cond.notify_all()
+            raise
+        entry = _Conn(key, conn, time.monotonic(), channels=1)
+        async with self._cond:
+            self._connecting.discard(key)
+            self._conns.setdefault(key, []).append(entry)
+            self.created += 1
+            self._cond.notify_all()
+        return entry
+
+    def _limit(self, entry: _Conn) -> int:
+        return min(self.max_channels, entry.max_channels or self.max_channels)
+
+    def _remove(self, entry: _Conn) -> None:
+        conns = self._conns.get(entry.key)
+        if conns and entry in conns:
+            conns.remove(entry)
+            self._per_host[(entry.key.host, entry.key.port)] -= 1
+            if not conns:
+                del self._conns[entry.key]
+
+    def _prune(self, key: SshKey) -> None:
+        """חיבורים שנסגרו (keepalive נכשל, השרת ניתק) יוצאים מה-pool."""
+        for e in [e for e in self._conns.get(key, ()) if e.conn.is_closed()]:
+            self._remove(e)
+
+    def _close_idle_on(self, host: tuple[str, int]) -> None:
+        """מפנה מקום ל-key אחר באותו host: סוגר חיבור אחד שאין עליו channels."""
+        for conns in self._conns.values():
+            for e in conns:
+                if (e.key.host, e.key.port) == host and (e.channels == 0 or e.conn.is_closed()):
+                    self._remove(e)
+                    e.conn.close()
+                    self.evicted += 1
+                    return
+
+    async def evict_idle(self, now: float | None = None) -> int:
+        now = time.monotonic() if now is None else now
+        async with self._cond:
+            idle = [
+                e
+                for conns in self._conns.values()
+                for e in conns
+                if e.conn.is_closed() or (not e.channels and now - e.last_used >= self.idle_timeout)
+            ]
+            for e in idle:
+                self._remove(e)
+            self._cond.notify_all()
+        for e in idle:
+            e.conn.close()
+        await asyncio.gather(*(e.conn.wait_closed() for e in idle), return_exceptions=True)
+        self.evicted += len(idle)
+        return len(idle)
+
+    async def _evict_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, min(self.idle_timeout, self.keepalive) / 2))
+            try:
+                await self.evict_idle()
+            except Exception:
+                pass
+
+    def start(self) -> None:
+        """מפעיל את ניקוי החיבורים הלא-פעילים (startup; נקרא גם בשימוש הראשון)."""
+        if self._janitor is None or self._janitor.done():
+            self._janitor = asyncio.get_running_loop().create_task(self._evict_loop())
+
+    async def close(self) -> None:
+        """סוגר את כל החיבורים (shutdown)."""
+        self._bind_loop()
+        if self._janitor is not None:
+            self._janitor.cancel()
+            self._janitor = None
+        conns = [e for conns in self._conns.values() for e in conns]
+        self._conns.clear()
+        self._per_host.clear()
+        for e in conns:
+            e.conn.close()
+        await asyncio.gather(*(e.conn.wait_closed() for e in conns), return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        conns = [e for conns in self._conns.values() for e in conns]
+        return {
+            "connections": len(conns),
+            "channels": sum(e.channels for e in conns),
+            "hosts": sum(1 for n in self._per_host.values() if n > 0),
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted,
+        }
+
+
+pool = SshConnectionPool()
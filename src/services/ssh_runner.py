@@ -0,0 +1,118 @@
+"""
+הרצת פקודה מרוחקת על חיבור asyncssh עם פלט ב-stream (המקבילה של runner.py ל-SSH).
+
+stdout/stderr נקראים בחלקים תוך כדי ריצה ונכתבים לקבצי הלוג של ה-run; לתוצאה
+נשמר רק tail חסום מכל stream, ו-on_output(stream, chunk) מקבל כל chunk (למשל
+לפרסום ב-SSE של המשימה). כך גם job ארוך (build, tail -f) נראה בזמן אמת ולא
+מחזיק את כל הפלט בזיכרון.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import asyncssh
+
+from .runner import OutputCallback
+
+_CHUNK_BYTES = int(os.environ.get("LUCY_STREAM_CHUNK_BYTES", "4096"))
+TAIL_BYTES = int(os.environ.get("LUCY_SSH_OUTPUT_TAIL_BYTES", "16384"))
+
+
+class TailBuffer:
+    """ה-limit הבתים האחרונים שנכתבו, וכמה נכתבו בסך הכול."""
+
+    def __init__(self, limit: int = TAIL_BYTES) -> None:
+        self.limit = limit
+        self.total = 0
+        self._buf = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.total += len(data)
+        self._buf += data
+        if len(self._buf) > self.limit:
+            del self._buf[: len(self._buf) - self.limit]
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self._buf)
+
+    def text(self) -> str:
+        return self._buf.decode("utf-8", "replace")
+
+
+@dataclass
+class RemoteResult:
+    exit_status: int | None
+    stdout: TailBuffer
+    stderr: TailBuffer
+    stdout_path: str | None
+    stderr_path: str | None
+
+    def output(self) -> str:
+        """tail של stdout ואחריו tail של stderr — כמו הפלט של /ssh עד כה."""
+        out, err = self.stdout.text(), self.stderr.text()
+        return out + (("\n" + err) if err else "")
+
+
+async def _pump(stream, path, name: str, tail: TailBuffer, on_output) -> None:
+    with open(path, "wb") if path is not None else contextlib.nullcontext() as f:
+        while True:
+            data = await stream.read(_CHUNK_BYTES)
+            if not data:
+                break
+            if f is not None:
+                f.write(data)
+            tail.write(data)
+            if on_output is not None:
+                try:
+                    await on_output(name, data)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # כשל בפרסום לא עוצר את הכתיבה ללוג
+                    pass
+
+
+async def run_remote_to_files(
+    conn: asyncssh.SSHClientConnection,
+    cmd: str,
+    stdout_path: str | Path | None,
+    stderr_path: str | Path | None,
+    *,
+    timeout: float | None = None,
+    on_output: OutputCallback | None = None,
+    tail_bytes: int = TAIL_BYTES,
+) -> RemoteResult:
+    """
+    מריץ cmd כ-channel על conn וקורא את הפלט בחלקים (tee לקבצים + tail + on_output).
+    await על on_output מאט את הקריאה, ו-flow control של SSH מאט את הצד המרוחק.
+    בלי נתיב (None) ה-stream נשמר רק ב-tail. ב-timeout/ביטול ה-channel נסגר והחריג עולה.
+    """
+    for path in (stdout_path, stderr_path):
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+    result = RemoteResult(
+        None,
+        TailBuffer(tail_bytes),
+        TailBuffer(tail_bytes),
+        str(stdout_path) if stdout_path is not None else None,
+        str(stderr_path) if stderr_path is not None else None,
+    )
+    process = await conn.create_process(cmd, encoding=None)
+    try:
+        async with asyncio.timeout(timeout):
+            await asyncio.gather(
+                _pump(process.stdout, stdout_path, "stdout", result.stdout, on_output),
+                _pump(process.stderr, stderr_path, "stderr", result.stderr, on_output),
+            )
+            completed = await process.wait()
+    except BaseException:
+        process.close()
+        raise
+    result.exit_status = completed.exit_status
+    return result
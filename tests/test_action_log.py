@@ -0,0 +1,20 @@
+import asyncio
+import sqlite3
+
+from src.db.action_log import LogWriter
+
+
+def test_close_flushes_queued_rows(tmp_path):
+    path = str(tmp_path / "log.db")
+
+    async def scenario():
+        w = LogWriter(path, mode="fast", batch_size=50, flush_ms=10_000)
+        for i in range(120):
+            await w.write("http", f"in {i}", "out", "ok")
+        # fast: write חוזר לפני שהשורות נכתבו; close (shutdown) כותב את מה שנשאר
+        await w.close()
+        return w.written
+
+    assert asyncio.run(scenario()) == 120
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT count(*) FROM task_log").fetchone() == (120,)
@@ -0,0 +1,196 @@
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from starlette.testclient import TestClient
+
+from src.actions import shell as shell_action, ssh as ssh_action
+from src.db import action_log
+from src.main import app
+from src.routers import tasks as tasks_router
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        body = b"x" * int(self.path.rsplit("/", 1)[-1] or 0)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{srv.server_address[1]}"
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    """task_log, קבצי הריצה וקובץ ה-rate limit ב-tmp (ולא ב-DB של lucy_agent); טוקן מוגדר."""
+    monkeypatch.setattr(action_log, "_writer", action_log.LogWriter(str(tmp_path / "log.db")))
+    monkeypatch.setenv("LUCY_RUNS_DIR", str(tmp_path / "runs"))
+    monkeypatch.setattr(tasks_router, "_AUTOPILOT_TOKEN", "secret")
+    monkeypatch.setattr(tasks_router, "_RATE_FILE", tmp_path / "rate")
+    monkeypatch.setattr(tasks_router, "_MIN_INTERVAL_SEC", 0.0)
+    return tmp_path
+
+
+def _client() -> TestClient:
+    return TestClient(app, headers={"x-api-key": "secret"})
+
+
+def _logged(tmp_path) -> list[tuple]:
+    with sqlite3.connect(tmp_path / "log.db") as db:
+        return db.execute("SELECT action, status FROM task_log ORDER BY id").fetchall()
+
+
+def test_http_reads_body_through_pool(env, server):
+    with _client() as c:
+        r = c.post("/http", json={"params": {"url": f"{server}/5000"}})
+        assert r.status_code == 200
+        res = r.json()
+        assert res["status"] == "ok"
+        assert res["details"]["bytes"] == 5000 and res["details"]["truncated"]
+
+        again = c.post("/http", json={"params": {"url": f"{server}/10"}}).json()
+        assert again["details"]["connection_reused"]
+        assert again["output"] == "HTTP 200\n" + "x" * 10
+    # shutdown: ה-writer כתב את מה שנשאר בתור
+    assert _logged(env) == [("http", "ok"), ("http", "ok")]
+
+
+def test_actions_require_autopilot_token(env):
+    with TestClient(app) as c:
+        assert c.post("/echo", json={"text": "hi"}).status_code == 401
+        assert c.post("/shell", json={"command": "true"}).status_code == 401
+        r = c.post("/echo", json={"text": "hi"}, headers={"x-api-key": "secret"})
+    assert r.json() == {"status": "ok", "output": "hi", "error": None, "details": None}
+
+
+def test_command_actions_are_closed_without_a_token(env, server, monkeypatch):
+    monkeypatch.setattr(tasks_router, "_AUTOPILOT_TOKEN", "")
+    ssh = {"params": {"host": "h1", "username": "u", "command": "uptime"}}
+    with TestClient(app) as c:
+        assert c.post("/shell", json={"command": "true"}).status_code == 503
+        assert c.post("/ssh", json=ssh).status_code == 503
+        assert c.post("/ssh/fanout", json={"params": {"hosts": ["u@h1"]}}).status_code == 503
+        assert c.get("/logs/recent").status_code == 503
+        # /http ו-/echo נשארים פתוחים כמו quick-run בלי טוקן
+        assert c.post("/http", json={"params": {"url": f"{server}/1"}}).json()["status"] == "ok"
+        assert c.post("/echo", json={"text": "hi"}).status_code == 200
+
+
+def test_shell_goes_through_quick_run_guardrails(env, monkeypatch):
+    monkeypatch.setattr(tasks_router, "_MIN_INTERVAL_SEC", 60.0)
+    monkeypatch.setenv("LUCY_AUTOPILOT_MAX_AS_MB", "1024")
+    with _client() as c:
+        blocked = c.post("/shell", json={"command": "sudo reboot"})
+        limits = c.post("/shell", json={"command": "ulimit -t; ulimit -v"}).json()
+        again = c.post("/shell", json={"command": "true"})
+    assert blocked.status_code == 400 and "denylist" in blocked.json()["detail"]
+    assert limits["status"] == "ok"
+    assert limits["output"].split() == [str(tasks_router._TIMEOUT_SEC), str(1024 * 1024)]
+    assert again.status_code == 429
+
+
+def test_http_save_body_rejects_run_id_outside_runs_dir(env, server):
+    with _client() as c:
+        for run_id in ("../escape", "/tmp/escape", "a/../../escape", ".."):
+            params = {"url": f"{server}/10", "save_body": True, "run_id": run_id}
+            res = c.post("/http", json={"params": params}).json()
+            assert res["status"] == "error" and "Invalid run_id" in res["error"]
+        ok = c.post("/http", json={"params": {"url": f"{server}/10", "save_body": True}}).json()
+    assert ok["status"] == "ok"
+    assert ok["details"]["body_path"].startswith(str((env / "runs").resolve()))
+    assert not (env / "escape").exists()
+
+
+def test_http_batch_streams_items_and_logs_once(env, server):
+    specs = [{"url": f"{server}/3"}, {"url": f"{server}/7"}, {"method": "GET"}]
+    with _client() as c:
+        r = c.post("/http/batch", json={"params": {"requests": specs, "concurrency": 2}})
+        assert r.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in r.text.splitlines()]
+    items = sorted(lines[:-1], key=lambda i: i["index"])
+    assert [i["status"] for i in items] == ["ok", "ok", "error"]
+    assert items[1]["output"] == "HTTP 200\n" + "x" * 7
+    assert items[2]["error"] == "Missing 'url'"
+    assert lines[-1]["summary"]["total"] == 3 and lines[-1]["summary"]["ok"] == 2
+    # רשומה אחת לכל ה-batch
+    assert _logged(env) == [("http_batch", "error")]
+
+
+def test_ssh_without_exec_is_a_dry_run(env):
+    params = {"host": "h1", "username": "u", "password": "pw", "command": "uptime"}
+    with _client() as c:
+        res = c.post("/ssh", json={"params": params}).json()
+        missing = c.post("/ssh", json={"params": {"host": "h1"}}).json()
+    assert res["status"] is True and res["output"] == "[DRY-RUN] u@h1:22 → uptime"
+    assert missing["status"] is False and "username" in missing["error"]
+    assert _logged(env) == [("ssh", "ok")]
+
+
+def test_ssh_fanout_logs_no_credentials(env):
+    params = {
+        "hosts": [
+            "u@h1:2222",
+            {"host": "h2", "username": "v", "password": "host-pw"},
+            {"host": "h3", "username": "w", "private_key": "-----BEGIN KEY-----"},
+        ],
+        "password": "shared-pw",
+        "command": "uptime",
+    }
+    with _client() as c:
+        r = c.post("/ssh/fanout", json={"params": params})
+        c.post("/ssh", json={"params": {"host": "h1", "username": "u", "password": "ssh-pw"}})
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert sorted(i["host"] for i in lines[:-1]) == ["h1", "h2", "h3"]
+    assert lines[-1]["summary"]["ok"] == 3
+    with sqlite3.connect(env / "log.db") as db:
+        logged = " ".join(row[0] for row in db.execute("SELECT input FROM task_log"))
+    for secret in ("host-pw", "shared-pw", "BEGIN KEY", "ssh-pw"):
+        assert secret not in logged
+
+
+def test_ssh_fanout_gives_each_host_its_own_run_dir(env, monkeypatch):
+    seen = []
+
+    async def fake_exec(hp, host, port, username, full_cmd, timeout):
+        seen.append(hp.get("run_id"))
+        raise ConnectionRefusedError(host)
+
+    monkeypatch.setattr(ssh_action, "_exec", fake_exec)
+    params = {
+        "hosts": ["u@h1", "u@h2", {"host": "h3", "username": "u", "run_id": "mine"}],
+        "run_id": "r1",
+        "exec": True,
+    }
+    with _client() as c:
+        r = c.post("/ssh/fanout", json={"params": params})
+    assert json.loads(r.text.splitlines()[-1])["summary"]["errors"] == 3
+    assert sorted(seen) == ["mine", "r1-0", "r1-1"]
+
+
+def test_shell_keeps_head_and_tail_and_times_out(env, monkeypatch):
+    monkeypatch.setattr(shell_action, "_HEAD_BYTES", 4)
+    monkeypatch.setattr(shell_action, "_TAIL_BYTES", 3)
+    monkeypatch.setattr(shell_action, "_TIMEOUT_SEC", 0.3)
+    with _client() as c:
+        res = c.post("/shell", json={"command": "printf 0123456789; exit 3"}).json()
+        slow = c.post("/shell", json={"command": "sleep 5"}).json()
+    assert res["status"] == "error"
+    assert res["output"] == "0123\n... [3 bytes truncated] ...\n789"
+    assert slow["status"] == "error" and "timed out after 0.3 seconds" in slow["output"]
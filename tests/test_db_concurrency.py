@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from src.db.session import create_db_engine
+
+
+def _engine(tmp_path, **kw):
+    eng = create_db_engine(tmp_path / "stress.db", **kw)
+    with eng.begin() as c:
+        c.execute(text("CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, v TEXT)"))
+    return eng
+
+
+def _write_while_reader_holds_snapshot(eng) -> None:
+    """קורא מחזיק טרנזקציה פתוחה בזמן שכותב מנסה לעשות commit."""
+    reader = eng.raw_connection()
+    try:
+        cur = reader.cursor()
+        cur.execute("BEGIN")
+        cur.execute("SELECT count(*) FROM t").fetchall()
+        with eng.begin() as w:
+            w.execute(text("INSERT INTO t (v) VALUES ('x')"))
+        cur.execute("COMMIT")
+    finally:
+        reader.close()
+
+
+def test_rollback_journal_reader_blocks_writer(tmp_path):
+    """
+    בסיס להשוואה: במצב journal ברירת המחדל (DELETE) קורא פתוח חוסם commit
+    של כותב — זו השגיאה "database is locked" שראינו תחת עומס.
+    """
+    eng = _engine(tmp_path, journal_mode="DELETE", busy_timeout_ms=100)
+    with pytest.raises(OperationalError, match="locked"):
+        _write_while_reader_holds_snapshot(eng)
+
+
+def test_wal_reader_does_not_block_writer(tmp_path):
+    eng = _engine(tmp_path, busy_timeout_ms=100)
+    with eng.connect() as c:
+        assert c.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert c.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+    _write_while_reader_holds_snapshot(eng)
+
+
+def test_concurrent_writers_and_readers_no_lock_errors(tmp_path):
+    """8 כותבים עם commit לכל שורה + 4 קוראים, במקביל — בלי אף "database is locked"."""
+    eng = _engine(tmp_path)
+    writers, readers, rows_each = 8, 4, 50
+    errors: list[Exception] = []
+    stop = threading.Event()
+
+    def write(n: int) -> None:
+        try:
+            for i in range(rows_each):
+                with eng.begin() as c:
+                    c.execute(text("INSERT INTO t (v) VALUES (:v)"), {"v": f"{n}-{i}"})
+        except Exception as e:
+            errors.append(e)
+
+    def read() -> None:
+        try:
+            while not stop.is_set():
+                with eng.connect() as c:
+                    c.execute(text("SELECT count(*), max(id) FROM t")).fetchall()
+        except Exception as e:
+            errors.append(e)
+
+    rs = [threading.Thread(target=read) for _ in range(readers)]
+    ws = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    for th in rs + ws:
+        th.start()
+    for th in ws:
+        th.join()
+    stop.set()
+    for th in rs:
+        th.join()
+
+    assert errors == []
+    with eng.connect() as c:
+        assert c.execute(text("SELECT count(*) FROM t")).scalar() == writers * rows_each
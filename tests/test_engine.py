@@ -0,0 +1,239 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from src.db import session as db_session
+from src.db.session import create_db_engine, get_session
+from src.main import app
+from src.models.tasks import AuditLog, Base, Run, Task
+from src.routers import tasks as tasks_router
+from src.services import job_queue, runner
+from src.services.engine import BatchRecorder, ExecutionEngine, engine
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """DB זמני שכל ה-sessions של האפליקציה עובדים מולו, וקבצי הריצה ב-tmp."""
+    eng = create_db_engine(tmp_path / "e.db")
+    Base.metadata.create_all(eng)
+    db_session.SessionLocal.configure(bind=eng)
+    monkeypatch.setattr(job_queue, "_engine", eng)
+    monkeypatch.setattr(tasks_router, "RUNS_BASE", tmp_path / "runs")
+    try:
+        yield eng
+    finally:
+        db_session.SessionLocal.configure(bind=db_session._engine)
+        eng.dispose()
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t")
+
+
+async def _create(c: httpx.AsyncClient, *cmds: str) -> str:
+    actions = [{"params": {"cmd": cmd}} for cmd in cmds]
+    r = await c.post("/tasks/", json={"title": "t", "actions": actions})
+    return r.json()["id"]
+
+
+def test_concurrent_runs_of_one_task_enqueue_once(db):
+    async def scenario():
+        async with _client() as c:
+            tid = await _create(c, "sleep 0.2")
+            r1, r2 = await asyncio.gather(c.post(f"/tasks/{tid}/run"), c.post(f"/tasks/{tid}/run"))
+            assert sorted((r1.status_code, r2.status_code)) == [200, 409]
+            assert len((await c.get(f"/tasks/{tid}/runs")).json()) == 1
+
+    asyncio.run(scenario())
+
+
+class _Broken(BatchRecorder):
+    """BatchRecorder שה-started שלו נכשל ב-action השני (כמו DB שנפל באמצע)."""
+
+    async def started(self, task_id, job):
+        if job.idx == 1:
+            raise RuntimeError("db is gone")
+        await super().started(task_id, job)
+
+
+def test_failed_execution_closes_runs_and_flushes_batch(db):
+    async def scenario():
+        async with _client() as c:
+            tid = await _create(c, "true", "true", "true")
+        jobs, _ = tasks_router._enqueue_runs(tid)
+        with pytest.raises(RuntimeError):
+            await ExecutionEngine().execute(tid, jobs, recorder=_Broken())
+        return tid
+
+    tid = asyncio.run(scenario())
+    with get_session() as s:
+        assert s.get(Task, tid).status == "FAILED"
+        statuses = sorted(r.status for r in s.scalars(select(Run)))
+    # action 0 הצליח, 1 נכשל לפני שהתחיל, 2 בוטל יחד עם שאר הגרף
+    assert statuses == ["CANCELED", "CANCELED", "SUCCEEDED"]
+
+
+def test_sync_run_returns_only_this_invocation(db):
+    async def scenario():
+        async with _client() as c:
+            tid = await _create(c, "true", "false")
+            first = (await c.post(f"/tasks/{tid}/run")).json()
+            second = (await c.post(f"/tasks/{tid}/run")).json()
+            assert [r["status"] for r in second] == ["SUCCEEDED", "FAILED"]
+            assert not {r["id"] for r in first} & {r["id"] for r in second}
+            assert len((await c.get(f"/tasks/{tid}/runs")).json()) == 4
+
+    asyncio.run(scenario())
+
+
+def test_canceled_batch_execution_is_flushed(db):
+    async def scenario():
+        async with _client() as c:
+            tid = await _create(c, "true", "sleep 30", "true")
+        jobs, _ = tasks_router._enqueue_runs(tid)
+        rec = BatchRecorder()
+        t = asyncio.ensure_future(ExecutionEngine().execute(tid, jobs, recorder=rec))
+        while len(rec.runs) < 2:
+            await asyncio.sleep(0.01)
+        t.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await t
+        return tid
+
+    tid = asyncio.run(scenario())
+    with get_session() as s:
+        assert s.get(Task, tid).status == "CANCELED"
+        statuses = [r.status for r in s.scalars(select(Run))]
+    assert sorted(statuses) == ["CANCELED", "CANCELED", "SUCCEEDED"]
+
+
+def _fast_grace(monkeypatch, grace: float = 0.3) -> None:
+    # ה-grace נקבע כ-default של terminate_process_group בזמן ה-import
+    monkeypatch.setattr(runner.terminate_process_group, "__defaults__", (grace,))
+
+
+async def _wait_status(c: httpx.AsyncClient, tid: str, idx: int, status: str) -> list[dict]:
+    while (runs := (await c.get(f"/tasks/{tid}/runs")).json())[idx]["status"] != status:
+        await asyncio.sleep(0.02)
+    return runs
+
+
+def test_cancel_task_escalates_to_sigkill_and_skips_the_rest(db, monkeypatch):
+    _fast_grace(monkeypatch)
+
+    async def scenario():
+        async with _client() as c:
+            tid = await _create(c, "trap '' TERM; sleep 30", "true")
+            assert (await c.post(f"/tasks/{tid}/run", params={"mode": "async"})).status_code == 202
+            await _wait_status(c, tid, 0, "RUNNING")
+            t0 = time.monotonic()
+            r = await c.post(f"/tasks/{tid}/cancel")
+            elapsed = time.monotonic() - t0
+            task = (await c.get(f"/tasks/{tid}")).json()
+            again = await c.post(f"/tasks/{tid}/cancel")
+            return r, elapsed, task, again
+
+    r, elapsed, task, again = asyncio.run(scenario())
+    assert r.status_code == 200
+    # SIGTERM נבלע (trap) — רק SIGKILL אחרי ה-grace עצר אותו
+    assert elapsed >= 0.3
+    assert [run["status"] for run in r.json()] == ["CANCELED", "CANCELED"]
+    assert task["status"] == "CANCELED"
+    assert again.status_code == 409
+
+
+def test_cancel_run_skips_only_its_dependents(db, monkeypatch):
+    _fast_grace(monkeypatch)
+
+    async def scenario():
+        async with _client() as c:
+            actions = [
+                {"params": {"cmd": "sleep 30"}, "depends_on": []},
+                {"params": {"cmd": "true"}, "depends_on": [0]},
+                {"params": {"cmd": "sleep 0.3"}, "depends_on": []},
+            ]
+            tid = (await c.post("/tasks/", json={"title": "t", "actions": actions})).json()["id"]
+            await c.post(f"/tasks/{tid}/run", params={"mode": "async"})
+            runs = await _wait_status(c, tid, 0, "RUNNING")
+            r = await c.post(f"/runs/{runs[0]['id']}/cancel")
+            assert r.status_code == 200 and r.json()["status"] == "CANCELED"
+            await _wait_status(c, tid, 2, "SUCCEEDED")
+            while engine.is_running(tid):
+                await asyncio.sleep(0.02)
+            return [run["status"] for run in (await c.get(f"/tasks/{tid}/runs")).json()]
+
+    assert asyncio.run(scenario()) == ["CANCELED", "CANCELED", "SUCCEEDED"]
+
+
+def test_cancel_marks_orphaned_runs_after_restart(db):
+    async def scenario():
+        async with _client() as c:
+            tid = await _create(c, "true", "true")
+            other = await _create(c, "true")
+        # Run-ים שנוצרו לפני restart של ה-API: RUNNING/PENDING בלי הרצה ובלי תור
+        _, runs = tasks_router._enqueue_runs(tid)
+        _, (orphan,) = tasks_router._enqueue_runs(other)
+        with get_session() as s:
+            s.get(Run, runs[0].id).status = "RUNNING"
+            s.commit()
+        async with _client() as c:
+            r = await c.post(f"/tasks/{tid}/cancel")
+            single = await c.post(f"/runs/{orphan.id}/cancel")
+            return tid, r, single
+
+    tid, r, single = asyncio.run(scenario())
+    assert r.status_code == 200
+    assert [run["status"] for run in r.json()] == ["CANCELED", "CANCELED"]
+    assert single.status_code == 200 and single.json()["status"] == "CANCELED"
+    with get_session() as s:
+        assert s.get(Task, tid).status == "CANCELED"
+
+
+@pytest.mark.parametrize("queued", [True, False])
+def test_canceling_a_waiting_run_skips_its_dependents_and_ends_the_task(db, queued):
+    async def scenario():
+        async with _client() as c:
+            actions = [
+                {"params": {"cmd": "true"}, "depends_on": []},
+                {"params": {"cmd": "true"}, "depends_on": [0]},
+                {"params": {"cmd": "true"}, "depends_on": [1]},
+                {"params": {"cmd": "true"}, "depends_on": []},
+            ]
+            return (await c.post("/tasks/", json={"title": "t", "actions": actions})).json()["id"]
+
+    tid = asyncio.run(scenario())
+    # בתור ועוד לא נתפס, או יתום (Run-ים של API שהופעל מחדש)
+    _, runs = tasks_router._enqueue_runs(tid, queued=queued)
+
+    async def cancel(run_id: str):
+        async with _client() as c:
+            r = await c.post(f"/runs/{run_id}/cancel")
+            return r, [run["status"] for run in (await c.get(f"/tasks/{tid}/runs")).json()]
+
+    def task_status() -> str:
+        with get_session() as s:
+            return s.get(Task, tid).status
+
+    r, statuses = asyncio.run(cancel(runs[0].id))
+    assert r.status_code == 200 and r.json()["status"] == "CANCELED"
+    # B ו-C (שתלוי ב-B) מדולגים; D הבלתי תלוי עוד ממתין, והמשימה עוד רצה
+    assert statuses == ["CANCELED", "CANCELED", "CANCELED", "PENDING"]
+    assert task_status() == "RUNNING"
+    with get_session() as s:
+        skipped = s.scalars(
+            select(AuditLog.run_id).where(AuditLog.event_type == "action_skipped")
+        ).all()
+    assert sorted(skipped) == sorted(run.id for run in runs[1:3])
+    if queued:
+        # שום worker לא יריץ את B בלי התלות שלו
+        assert job_queue.claim("w1") == [runs[3].id]
+        job_queue.release("w1", runs[3].id)
+
+    # ה-Run הפעיל האחרון בוטל — המשימה נסגרת
+    r, statuses = asyncio.run(cancel(runs[3].id))
+    assert statuses == ["CANCELED"] * 4
+    assert task_status() == "FAILED"
+    assert job_queue.claim("w2") == []
@@ -0,0 +1,54 @@
+import asyncio
+
+from src.events import EventBus
+
+
+def _out(i: int, run_id: str = "r") -> dict:
+    return {
+        "type": "output",
+        "data": {"run_id": run_id, "stream": "stdout", "text": str(i)},
+        "ts": 0,
+    }
+
+
+def test_every_subscriber_gets_every_event():
+    b = EventBus(maxlen=16)
+    s1, s2 = b.subscribe("t"), b.subscribe("t")
+    for i in range(3):
+        b.publish("t", {"type": "update", "data": {"i": i}, "ts": 0})
+    assert [e["data"]["i"] for e in s1.buf] == [0, 1, 2]
+    assert [e["data"]["i"] for e in s2.buf] == [0, 1, 2]
+
+
+def test_slow_subscriber_is_bounded():
+    b = EventBus(maxlen=4, policy="drop_oldest")
+    s = b.subscribe("t")
+    for i in range(10):
+        b.publish("t", {"type": "update", "data": {"i": i}, "ts": 0})
+    assert [e["data"]["i"] for e in s.buf] == [6, 7, 8, 9]
+    assert b.metrics()["dropped"] == 6
+
+    c = EventBus(maxlen=2, policy="coalesce")
+    s = c.subscribe("t")
+    for i in range(5):
+        c.publish("t", _out(i))
+    assert [e["data"]["text"] for e in s.buf] == ["0", "1234"]
+    assert s.dropped == 0 and s.coalesced == 3
+
+
+def test_topic_torn_down_after_done_and_last_unsubscribe():
+    async def scenario():
+        b = EventBus()
+        s1, s2 = b.subscribe("t"), b.subscribe("t")
+        b.publish("t", {"type": "done", "data": {"status": "SUCCEEDED"}, "ts": 0})
+        assert (await s1.get(timeout=1))["type"] == "done"
+        b.unsubscribe(s1)
+        # מי שמצטרף ל-topic שכבר הסתיים מקבל מיד את האירוע הסופי
+        late = b.subscribe("t")
+        assert (await late.get(timeout=1))["type"] == "done"
+        b.unsubscribe(late)
+        b.unsubscribe(s2)
+        assert b.topics == {}
+        assert b.publish("t", _out(0)) == 0
+
+    asyncio.run(scenario())
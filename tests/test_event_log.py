@@ -0,0 +1,100 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src import events
+from src.db import session as db_session
+from src.db.session import create_db_engine, get_session
+from src.models.tasks import Base, Task
+from src.services.event_log import EventLogStore
+
+
+def test_replay_spans_db_and_ring_and_survives_restart(tmp_path):
+    async def scenario():
+        eng = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'events.db'}")
+        sf = async_sessionmaker(bind=eng, expire_on_commit=False)
+        store = EventLogStore(ring_size=3, session_factory=sf, db_engine=eng)
+        for i in range(10):
+            await store.record("t", {"type": "output", "data": {"i": i}, "ts": 0})
+
+        assert [e["id"] for e in store._logs["t"].ring] == [8, 9, 10]
+        ids = [e["id"] async for e in store.replay("t", 2)]
+        assert ids == list(range(3, 11))
+
+        # תהליך חדש: ה-seq ממשיך מה-DB ולא מתחיל שוב מ-1
+        await store.close()
+        fresh = EventLogStore(session_factory=sf, db_engine=eng)
+        evt = await fresh.record("t", {"type": "done", "data": {}, "ts": 0}, terminal=True)
+        assert evt["id"] == 11
+        assert (await fresh.last("t"))["type"] == "done"
+        await eng.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_seq_column_added_to_old_table(tmp_path):
+    async def scenario():
+        eng = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+        async with eng.begin() as conn:
+            # הסכמה מלפני seq
+            await conn.exec_driver_sql(
+                "CREATE TABLE event_logs (id INTEGER PRIMARY KEY, task_id VARCHAR(64),"
+                " ts DATETIME, event_type VARCHAR(32), payload JSON)"
+            )
+        sf = async_sessionmaker(bind=eng, expire_on_commit=False)
+        store = EventLogStore(ring_size=2, session_factory=sf, db_engine=eng)
+        for i in range(5):
+            await store.record("t", {"type": "output", "data": {"i": i}, "ts": 0})
+        assert [e["id"] async for e in store.replay("t", 0)] == [1, 2, 3, 4, 5]
+        assert store.spill_errors == 0
+        await eng.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_stale_done_does_not_close_stream_of_rerun_task(tmp_path, monkeypatch):
+    main_db = create_db_engine(tmp_path / "main.db")
+    Base.metadata.create_all(main_db)
+    db_session.SessionLocal.configure(bind=main_db)
+    with get_session() as s:
+        s.add(Task(id="t", title="t", status="RUNNING"))
+        s.commit()
+
+    async def closes(stream) -> list[bytes] | None:
+        """האירועים עד סוף ה-stream; None אם הוא נשאר פתוח (ממתין לאירועים חיים)."""
+        out: list[bytes] = []
+
+        async def drain():
+            async for chunk in stream:
+                out.append(chunk)
+
+        t = asyncio.ensure_future(drain())
+        await asyncio.wait([t], timeout=0.3)
+        if not t.done():
+            t.cancel()
+            return None
+        return out
+
+    async def scenario():
+        eng = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'events.db'}")
+        sf = async_sessionmaker(bind=eng, expire_on_commit=False)
+        store = EventLogStore(session_factory=sf, db_engine=eng)
+        monkeypatch.setattr(events, "event_log", store)
+        # done מהריצה הקודמת; הריצה הנוכחית לא נרשמה (אף אחד לא צפה בה)
+        await store.record(
+            "t", {"type": "done", "data": {"status": "FAILED"}, "ts": 0}, terminal=True
+        )
+        assert await closes(events._event_stream("t")) is None
+
+        with get_session() as s:
+            s.get(Task, "t").status = "FAILED"
+            s.commit()
+        finished = await closes(events._event_stream("t"))
+        assert b"event: done" in finished[-1]
+        await eng.dispose()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        db_session.SessionLocal.configure(bind=db_session._engine)
+        main_db.dispose()
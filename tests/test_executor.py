@@ -0,0 +1,115 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from src.lucy_agent.executor import ShellStream, _Capture, run_shell
+
+# argv מפורש: bash -lc היה טוען את ה-profile של המכונה (ופלט שלו ב-stderr)
+_BG_SLEEP = ["sh", "-c", "sleep 30 & echo $!; wait"]
+
+
+def _alive(pid: int) -> bool:
+    """תהליך חי (zombie שעוד לא נאסף נחשב מת)."""
+    try:
+        return Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0] != "Z"
+    except (FileNotFoundError, IndexError):
+        return False
+
+
+def _gone(pid: int, within: float = 2.0) -> bool:
+    deadline = time.monotonic() + within
+    while _alive(pid):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_capture_spills_past_threshold_and_keeps_tail(tmp_path):
+    cap = _Capture("stdout", retain=4, spill_at=10, spill_dir=str(tmp_path))
+    assert cap.feed(b"abcd\n") == "abcd\n"
+    assert cap.spill_path is None and cap.text() == "abcd\n"
+
+    cap.feed(b"efgh\n")
+    cap.feed(b"ijkl\n", final=True)
+    cap.close()
+    assert cap.truncated and cap.total == 15
+    # בזיכרון רק ה-tail; בקובץ — הכול, כולל מה שנכתב לפני ה-spill
+    assert cap.text() == "jkl\n"
+    assert Path(cap.spill_path).read_text() == "abcd\nefgh\nijkl\n"
+
+
+def test_capture_counts_utf8_bytes(tmp_path):
+    cap = _Capture("stdout", retain=100, spill_at=100, spill_dir=str(tmp_path))
+    data = "שלום ✓\n".encode()
+    # chunk שחותך תו באמצע — נספר פעם אחת, אחרי הפענוח
+    cap.feed(data[:3])
+    cap.feed(data[3:], final=True)
+    cap.close()
+    assert cap.text() == "שלום ✓\n" and cap.total == len(data) == 13
+
+
+def test_stream_spills_full_output_and_retains_tail(tmp_path):
+    async def scenario():
+        s = ShellStream(
+            ["sh", "-c", "for i in $(seq 1 200); do echo line-$i; done; echo err >&2"],
+            retain_bytes=30,
+            spill_bytes=100,
+            spill_dir=str(tmp_path),
+        )
+        chunks = [c async for c in s]
+        return s, chunks
+
+    s, chunks = asyncio.run(scenario())
+    full = "".join(f"line-{i}\n" for i in range(1, 201))
+    assert s.returncode == 0
+    assert "".join(c.text for c in chunks if c.stream == "stdout") == full
+    assert s.stdout == full[-30:] and s.stderr == "err\n"
+    assert Path(s.spill_paths["stdout"]).read_text() == full
+    assert "stderr" not in s.spill_paths
+    assert s.output_bytes == {"stdout": len(full), "stderr": 4}
+
+
+def test_timeout_kills_the_whole_process_group():
+    async def scenario():
+        s = ShellStream(_BG_SLEEP, timeout=0.5)
+        pids = []
+        with pytest.raises(TimeoutError):
+            async for c in s:
+                pids.append(int(c.text))
+        return pids[0]
+
+    child = asyncio.run(scenario())
+    # ה-sleep הוא צאצא של ה-shell — נהרג יחד עם כל ה-session
+    assert _gone(child)
+
+
+def test_early_loop_exit_kills_the_process():
+    async def scenario():
+        async for c in ShellStream(_BG_SLEEP, timeout=30):
+            pid = int(c.text)
+            break
+        # ה-generator נסגר ברקע (asyncgen finalizer) — נותנים ל-loop לרוץ
+        for _ in range(100):
+            if not _alive(pid):
+                break
+            await asyncio.sleep(0.02)
+        # עוד בתוך ה-loop — לא רק ב-shutdown_asyncgens של asyncio.run
+        assert not _alive(pid)
+
+    asyncio.run(scenario())
+
+
+def test_run_shell_returns_spill_paths(tmp_path):
+    assert asyncio.run(run_shell(["sh", "-c", "echo hi"])) == (0, "hi\n", "", {})
+
+    limits = {"retain_bytes": 4, "spill_bytes": 10, "spill_dir": str(tmp_path)}
+    rc, out, _, paths = asyncio.run(run_shell(["sh", "-c", "seq 1 10"], **limits))
+    full = "".join(f"{i}\n" for i in range(1, 11))
+    # רק ה-tail בזיכרון; הפלט המלא בקובץ שהקורא מקבל (ולא יתום ב-/tmp)
+    assert rc == 0 and out == full[-4:]
+    assert paths == {"stdout": paths["stdout"]}
+    assert Path(paths["stdout"]).read_text() == full
+    assert Path(paths["stdout"]).parent == tmp_path
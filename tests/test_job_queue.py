@@ -0,0 +1,170 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from src.db import session as db_session
+from src.db.session import create_db_engine, get_session
+from src.main import app
+from src.models.tasks import Base, Run, Task
+from src.routers import tasks as tasks_router
+from src.services import job_queue
+from src.services.job_queue import QueueWorker, claim, heartbeat, load_claim, recover_expired
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """DB זמני ל-sessions של האפליקציה ולתור (שעובד ישר מול ה-engine)."""
+    eng = create_db_engine(tmp_path / "q.db")
+    Base.metadata.create_all(eng)
+    db_session.SessionLocal.configure(bind=eng)
+    monkeypatch.setattr(job_queue, "_engine", eng)
+    monkeypatch.setattr(tasks_router, "RUNS_BASE", tmp_path / "runs")
+    try:
+        yield eng
+    finally:
+        db_session.SessionLocal.configure(bind=db_session._engine)
+        eng.dispose()
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t")
+
+
+def _enqueue(*cmds: str | dict) -> tuple[str, list[str]]:
+    async def scenario():
+        async with _client() as c:
+            actions = [c if isinstance(c, dict) else {"params": {"cmd": c}} for c in cmds]
+            tid = (await c.post("/tasks/", json={"title": "q", "actions": actions})).json()["id"]
+            r = await c.post(f"/tasks/{tid}/run", params={"mode": "queue"})
+            assert r.status_code == 202
+            return tid, [run["id"] for run in r.json()]
+
+    return asyncio.run(scenario())
+
+
+def _runs(run_ids: list[str]) -> list[tuple[str, dict]]:
+    with get_session() as s:
+        rows = s.scalars(select(Run).where(Run.id.in_(run_ids))).all()
+        by_id = {r.id: (r.status, json.loads(r.meta_json)["queue"]) for r in rows}
+    return [by_id[r] for r in run_ids]
+
+
+def test_claim_takes_a_whole_task_once(db):
+    _, first = _enqueue("true", "true")
+    _, second = _enqueue("true")
+    assert sorted(claim("w1")) == sorted(first)
+    assert claim("w2") == second
+    assert claim("w3") == []
+    assert all(q["worker"] == "w1" and q["attempts"] == 1 for _, q in _runs(first))
+    assert load_claim([]) is None
+
+
+def test_expired_lease_is_recovered_and_reclaimed(db):
+    _, ids = _enqueue("true")
+    now = time.time()
+    assert claim("w1", lease=10, now=now) == ids
+    # lease בתוקף — לא חוזר לתור
+    assert recover_expired(now=now + 5) == 0
+    assert claim("w2", now=now + 5) == []
+
+    assert recover_expired(now=now + 11) == 1
+    assert _runs(ids)[0][0] == "PENDING" and "worker" not in _runs(ids)[0][1]
+    assert claim("w2", now=now + 11) == ids
+    # ה-worker הקודם כבר לא מחזיק את ה-Run
+    assert heartbeat("w1", ids) == 0
+    assert _runs(ids)[0][1]["attempts"] == 2
+
+
+def test_second_sigterm_returns_unfinished_runs_to_the_queue(db):
+    tid, ids = _enqueue("true", "sleep 30")
+
+    async def scenario():
+        w = QueueWorker("w1", poll=0.02)
+        loop = asyncio.create_task(w.run())
+        while [st for st, _ in _runs(ids)] != ["SUCCEEDED", "RUNNING"]:
+            await asyncio.sleep(0.02)
+        w.stop()  # SIGTERM ראשון: לא תופסים יותר, ממתינים להרצה
+        await asyncio.sleep(0.1)
+        assert not loop.done()
+        await w.shutdown()  # SIGTERM שני: עוצרים ומחזירים לתור
+        await loop
+
+    asyncio.run(scenario())
+    done, released = _runs(ids)
+    assert done[0] == "SUCCEEDED"
+    assert released[0] == "PENDING" and "worker" not in released[1]
+    with get_session() as s:
+        assert s.get(Task, tid).status == "RUNNING"
+    # worker אחר ממשיך מאיפה שזה נעצר
+    assert claim("w2") == [ids[1]]
+
+
+def test_worker_survives_database_errors(db, monkeypatch):
+    _, ids = _enqueue("true")
+    real_claim, calls = job_queue.claim, []
+
+    def flaky_claim(worker, **kw):
+        calls.append(worker)
+        if len(calls) <= 2:
+            raise OperationalError("UPDATE runs", {}, Exception("database is locked"))
+        return real_claim(worker, **kw)
+
+    def broken_recover():
+        raise IndexError("list index out of range")
+
+    monkeypatch.setattr(job_queue, "claim", flaky_claim)
+    monkeypatch.setattr(job_queue, "recover_expired", broken_recover)
+
+    async def scenario():
+        w = QueueWorker("w1", poll=0.01)
+        loop = asyncio.create_task(w.run())
+        while _runs(ids)[0][0] != "SUCCEEDED":
+            assert not loop.done()
+            await asyncio.sleep(0.02)
+        w.stop()
+        await loop
+
+    asyncio.run(scenario())
+    assert len(calls) >= 3
+
+
+@pytest.mark.parametrize("ended", ["SUCCEEDED", "FAILED", "CANCELED"])
+def test_requeued_runs_skip_dependents_of_runs_that_did_not_succeed(db, ended):
+    _, ids = _enqueue(
+        {"params": {"cmd": "true"}, "depends_on": []},
+        {"params": {"cmd": "true"}, "depends_on": [0]},
+        {"params": {"cmd": "true"}, "depends_on": [1]},
+        {"params": {"cmd": "true"}, "depends_on": []},
+    )
+    now = time.time()
+    assert sorted(claim("w1", lease=10, now=now)) == sorted(ids)
+    # ה-worker סיים את הראשון ומת; השאר חוזרים לתור
+    with get_session() as s:
+        s.get(Run, ids[0]).status = ended
+        s.commit()
+    assert recover_expired(now=now + 11) == 3
+
+    jobs = {j.run_id: j for j in load_claim(ids[1:]).jobs}
+    assert jobs[ids[1]].depends_on == [] and jobs[ids[1]].dep_failed == (ended != "SUCCEEDED")
+    assert jobs[ids[2]].depends_on == [1] and not jobs[ids[2]].dep_failed
+
+    async def scenario():
+        w = QueueWorker("w2", poll=0.01)
+        loop = asyncio.create_task(w.run())
+        while any(st in ("PENDING", "RUNNING") for st, _ in _runs(ids[1:])):
+            await asyncio.sleep(0.02)
+        w.stop()
+        await loop
+
+    asyncio.run(scenario())
+    statuses = [st for st, _ in _runs(ids)]
+    if ended == "SUCCEEDED":
+        assert statuses == ["SUCCEEDED"] * 4
+    else:
+        # B ו-C (שתלוי בו) מדולגים; D הבלתי תלוי רץ
+        assert statuses == [ended, "CANCELED", "CANCELED", "SUCCEEDED"]
@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.lucy_agent import orchestrator, security
+from src.lucy_agent.db import Base, get_session
+from src.lucy_agent.main import app
+from src.lucy_agent.models import EventLog, Step, Task
+
+_HEADERS = {"X-Api-Key": "k"}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """DB זמני (aiosqlite) שה-orchestrator וה-router עובדים מולו; engine חדש לכל loop."""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'agent.db'}"
+
+    async def make():
+        eng = create_async_engine(url)
+        async with eng.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(bind=eng, expire_on_commit=False)
+        monkeypatch.setattr(orchestrator, "SessionLocal", factory)
+        return factory
+
+    async def session_override():
+        async with orchestrator.SessionLocal() as s:
+            yield s
+
+    monkeypatch.setattr(orchestrator, "_OUTPUT_DIR", str(tmp_path / "steps"))
+    monkeypatch.setattr(security, "AGENT_API_KEY", "k")
+    app.dependency_overrides[get_session] = session_override
+    try:
+        yield make
+    finally:
+        app.dependency_overrides.pop(get_session, None)
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t")
+
+
+async def _create(factory, task_id: str, *cmds: str) -> None:
+    async with factory() as s:
+        s.add(Task(id=task_id, title="t", status="PENDING"))
+        for i, cmd in enumerate(cmds):
+            step = Step(id=f"{task_id}-{i}", task_id=task_id, type="shell", status="PENDING")
+            step.params = {"cmd": cmd}
+            s.add(step)
+        await s.commit()
+
+
+async def _state(factory, task_id: str) -> tuple[str, list[tuple[str, str | None]]]:
+    async with factory() as s:
+        task = await s.get(Task, task_id)
+        rows = await s.scalars(select(Step).where(Step.task_id == task_id).order_by(Step.id))
+        steps = rows.all()
+        return task.status, [(st.status, st.stdout) for st in steps]
+
+
+def test_run_endpoint_runs_steps_with_sh(db):
+    async def scenario():
+        factory = await db()
+        await _create(factory, "t1", "echo $0", "printf ok")
+        async with _client() as c:
+            r = await c.post("/tasks/t1/run", headers=_HEADERS)
+            assert r.status_code == 202
+            await orchestrator._running["t1"]
+            assert (await c.post("/tasks/nope/run", headers=_HEADERS)).status_code == 404
+            assert (await c.post("/tasks/t1/cancel", headers=_HEADERS)).status_code == 409
+        return await _state(factory, "t1")
+
+    status, steps = asyncio.run(scenario())
+    # sh -c (כמו create_subprocess_shell), לא bash -lc
+    assert status == "SUCCEEDED"
+    assert steps == [("SUCCEEDED", "sh\n"), ("SUCCEEDED", "ok")]
+
+
+def test_cancel_endpoint_stops_a_running_task(db):
+    async def scenario():
+        factory = await db()
+        await _create(factory, "t2", "sleep 30", "echo never")
+        async with _client() as c:
+            assert (await c.post("/tasks/t2/run", headers=_HEADERS)).status_code == 202
+            assert (await c.post("/tasks/t2/run", headers=_HEADERS)).status_code == 409
+            while (await _state(factory, "t2"))[1][0][0] != "RUNNING":
+                await asyncio.sleep(0.02)
+            r = await c.post("/tasks/t2/cancel", headers=_HEADERS)
+            assert r.status_code == 202
+            with pytest.raises(asyncio.CancelledError):
+                await orchestrator._running["t2"]
+        async with factory() as s:
+            done = (await s.scalars(select(EventLog).where(EventLog.event_type == "done"))).one()
+        return await _state(factory, "t2"), done.payload["status"]
+
+    (status, steps), done = asyncio.run(scenario())
+    assert status == done == "CANCELED"
+    assert [st for st, _ in steps] == ["CANCELED", "CANCELED"]
+
+
+def test_recorder_flushes_rows_added_during_a_flush(db, monkeypatch):
+    monkeypatch.setattr(orchestrator, "_FLUSH_MS", 10)
+
+    async def scenario():
+        factory = await db()
+        rec = orchestrator._Recorder("t3", factory)
+        flushing = asyncio.Event()
+        real_flush = rec.flush
+
+        async def slow_flush():
+            await real_flush()
+            # ה-commit כבר בוצע, אבל ה-flusher עדיין פעיל
+            flushing.set()
+            await asyncio.sleep(0.05)
+
+        rec.flush = slow_flush
+        rec.event("first")
+        await flushing.wait()
+        rec.event("second")
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            if rec.commits == 2:
+                break
+        async with factory() as s:
+            return [e.event_type for e in await s.scalars(select(EventLog).order_by(EventLog.id))]
+
+    assert asyncio.run(scenario()) == ["first", "second"]
@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from starlette.testclient import TestClient
+
+from src.db import session as db_session
+from src.db.session import create_db_engine
+from src.main import app
+from src.models.tasks import Base
+from src.routers.tasks import _quick_run_collect
+
+
+@pytest.fixture
+def db(tmp_path):
+    """DB זמני שכל ה-sessions של האפליקציה עובדים מולו."""
+    eng = create_db_engine(tmp_path / "q.db")
+    Base.metadata.create_all(eng)
+    db_session.SessionLocal.configure(bind=eng)
+    try:
+        yield eng
+    finally:
+        db_session.SessionLocal.configure(bind=db_session._engine)
+        eng.dispose()
+
+
+@contextmanager
+def count_queries(eng):
+    """סופר SELECT-ים שנשלחים ל-DB בתוך הבלוק."""
+    selects: list[str] = []
+
+    def on_execute(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    event.listen(eng, "before_cursor_execute", on_execute)
+    try:
+        yield selects
+    finally:
+        event.remove(eng, "before_cursor_execute", on_execute)
+
+
+def _create(client, n: int) -> list[dict]:
+    body = {"title": "t", "require_approval": True, "actions": [{"params": {"cmd": "true"}}]}
+    return [client.post("/tasks/", json=body).json() for _ in range(n)]
+
+
+def test_single_task_endpoints_query_counts(db):
+    client = TestClient(app)
+    with count_queries(db) as q:
+        task = _create(client, 1)[0]
+    assert len(task["approvals"]) == 1
+    created = len(q)
+
+    with count_queries(db) as q:
+        assert client.get(f"/tasks/{task['id']}").json()["approvals"]
+    assert len(q) == 2  # task + approvals (selectin)
+
+    token = task["approvals"][0]["token"]
+    body = {"token": token, "decision": "APPROVE", "decided_by": "me"}
+    with count_queries(db) as q:
+        out = client.post(f"/tasks/{task['id']}/approve", json=body).json()
+    assert out["approvals"][0]["decision"] == "APPROVE"
+    approved = len(q)
+
+    with count_queries(db) as q:
+        assert _quick_run_collect(task["id"]).task.approvals
+    collected = len(q)
+
+    # אותו מספר שאילתות גם כשיש הרבה משימות/approvals ב-DB
+    _create(client, 20)
+    with count_queries(db) as q:
+        _create(client, 1)
+    assert len(q) == created
+    with count_queries(db) as q:
+        client.post(f"/tasks/{task['id']}/approve", json=body)
+    assert len(q) == approved
+    with count_queries(db) as q:
+        _quick_run_collect(task["id"])
+    assert len(q) == collected
+
+
+def test_full_listing_does_not_query_per_task(db):
+    client = TestClient(app)
+    _create(client, 3)
+    with count_queries(db) as few:
+        assert len(client.get("/tasks/", params={"view": "full"}).json()) == 3
+    _create(client, 30)
+    with count_queries(db) as many:
+        tasks = client.get("/tasks/", params={"view": "full", "limit": 33}).json()
+    assert len(tasks) == 33 and all(len(t["approvals"]) == 1 for t in tasks)
+    assert len(many) == len(few)
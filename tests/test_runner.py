@@ -0,0 +1,48 @@
+import asyncio
+import os
+import signal
+import time
+from pathlib import Path
+
+from src.services import runner
+from src.services.runner import run_shell_to_files
+
+
+def _alive(pid: int) -> bool:
+    """תהליך חי (zombie שעוד לא נאסף נחשב מת)."""
+    try:
+        return Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0] != "Z"
+    except (FileNotFoundError, IndexError):
+        return False
+
+
+def test_piped_run_does_not_wait_for_background_children(tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, "_PIPE_DRAIN_GRACE_SEC", 0.2)
+    chunks: list[tuple[str, bytes]] = []
+
+    async def on_output(stream: str, data: bytes) -> None:
+        chunks.append((stream, data))
+
+    async def scenario():
+        t0 = time.monotonic()
+        rc = await run_shell_to_files(
+            "echo hi; sleep 30 & echo $!",
+            tmp_path / "out.log",
+            tmp_path / "err.log",
+            timeout=10,
+            on_output=on_output,
+        )
+        elapsed = time.monotonic() - t0
+        child = int((tmp_path / "out.log").read_text().split()[1])
+        # daemon שהפקודה הפעילה לא נהרג כשההרצה מסתיימת
+        alive = _alive(child)
+        os.kill(child, signal.SIGKILL)
+        await asyncio.sleep(0.1)  # ה-pipes נסגרים וה-transport נסגר בתוך ה-loop
+        return rc, elapsed, alive
+
+    rc, elapsed, alive = asyncio.run(scenario())
+    out = (tmp_path / "out.log").read_text()
+    # ה-shell יצא מיד; רק grace קצר ל-pipe שה-sleep עדיין מחזיק
+    assert rc == 0 and elapsed < 2 and alive
+    assert out.startswith("hi\n")
+    assert b"".join(d for s, d in chunks if s == "stdout").decode() == out
@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+import asyncssh
+import pytest
+
+from src.services import ssh_pool
+from src.services.ssh_pool import SshConnectionPool, SshKey
+
+
+class _FakeConn:
+    def __init__(self, options: dict) -> None:
+        self.options = options
+        self.closed = False
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    def close(self) -> None:
+        self.closed = True
+
+    async def wait_closed(self) -> None:
+        pass
+
+
+@pytest.fixture
+def connects(monkeypatch) -> list[_FakeConn]:
+    """asyncssh.connect מזויף: כל handshake נרשם ברשימה."""
+    made: list[_FakeConn] = []
+
+    async def fake_connect(**options):
+        await asyncio.sleep(0)
+        made.append(_FakeConn(options))
+        return made[-1]
+
+    monkeypatch.setattr(ssh_pool.asyncssh, "connect", fake_connect)
+    return made
+
+
+def _key(user: str = "u", host: str = "h1") -> tuple[SshKey, dict]:
+    return SshKey(host, 22, user, "default"), {"host": host, "port": 22, "username": user}
+
+
+def test_channels_share_one_connection_until_it_is_full(connects):
+    pool = SshConnectionPool(max_per_host=4, max_channels=2)
+    key, opts = _key()
+
+    async def hold(release: asyncio.Event):
+        async with pool.connection(key, opts) as conn:
+            await release.wait()
+            return conn
+
+    async def scenario():
+        async with pool.connection(key, opts):
+            pass
+        async with pool.connection(key, opts):
+            pass
+        assert (len(connects), pool.reused) == (1, 1)
+
+        release = asyncio.Event()
+        holders = [asyncio.create_task(hold(release)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        busy = pool.stats()
+        release.set()
+        conns = await asyncio.gather(*holders)
+        await pool.close()
+        return busy, conns
+
+    busy, conns = asyncio.run(scenario())
+    # 5 channels, עד 2 לחיבור — 3 חיבורים, הראשון ממשיך לשמש
+    assert len(connects) == 3 and busy["channels"] == 5
+    assert conns.count(connects[0]) == 2
+    assert all(c.closed for c in connects)
+
+
+def test_per_host_limit_waits_and_evicts_idle_connection_of_other_key(connects):
+    pool = SshConnectionPool(max_per_host=1, max_channels=1)
+    (k1, o1), (k2, o2) = _key("u1"), _key("u2")
+
+    async def scenario():
+        async with pool.connection(k1, o1):
+            # ה-host מלא וה-channel היחיד תפוס — גם key אחר ממתין
+            with pytest.raises(TimeoutError):
+                async with pool.connection(k2, o2, timeout=0.05):
+                    pass
+            with pytest.raises(TimeoutError):
+                async with pool.connection(k1, o1, timeout=0.05):
+                    pass
+        # החיבור של u1 פנוי: מפנים אותו בשביל u2
+        async with pool.connection(k2, o2) as conn:
+            assert conn is connects[1]
+        # host אחר לא נספר במגבלה
+        async with pool.connection(*_key("u1", "h2")):
+            stats = pool.stats()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert [c.options["username"] for c in connects] == ["u1", "u2", "u1"]
+    assert connects[0].closed and not connects[1].closed
+    assert stats["connections"] == 2 and stats["hosts"] == 2 and stats["evicted"] == 1
+
+
+def test_evict_idle_closes_idle_and_dead_connections(connects):
+    pool = SshConnectionPool(max_per_host=4, max_channels=1, idle_timeout=10)
+    (k1, o1), (k2, o2) = _key("u1"), _key("u2")
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def busy():
+            async with pool.connection(k2, o2):
+                await release.wait()
+
+        async with pool.connection(k1, o1):
+            pass
+        holder = asyncio.create_task(busy())
+        await asyncio.sleep(0.01)
+        # עוד לא עבר idle_timeout
+        assert await pool.evict_idle() == 0
+        # חיבור פעיל לא נסגר גם אחרי idle_timeout
+        assert await pool.evict_idle(now=time.monotonic() + 60) == 1
+        assert connects[0].closed and not connects[1].closed
+        release.set()
+        await holder
+
+        # חיבור שהשרת סגר (keepalive) יוצא מה-pool ונפתח חדש במקומו
+        connects[1].close()
+        async with pool.connection(k2, o2) as conn:
+            assert conn is connects[2]
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["connections"] == 1 and stats["created"] == 3
+
+
+def test_channel_open_error_caps_the_connection_instead_of_closing_it(connects):
+    pool = SshConnectionPool(max_per_host=4, max_channels=3)
+    key, opts = _key()
+
+    async def scenario():
+        async with pool.connection(key, opts) as first:
+            async with pool.connection(key, opts):
+                with pytest.raises(asyncssh.ChannelOpenError):
+                    async with pool.connection(key, opts):
+                        raise asyncssh.ChannelOpenError(
+                            asyncssh.OPEN_ADMINISTRATIVELY_PROHIBITED, "no more sessions"
+                        )
+                # שתי הפקודות שכבר רצות ממשיכות; השלישית עוברת לחיבור חדש
+                assert not first.is_closed()
+                async with pool.connection(key, opts) as third:
+                    assert third is not first
+
+        with pytest.raises(asyncssh.ConnectionLost):
+            async with pool.connection(key, opts) as conn:
+                raise asyncssh.ConnectionLost("gone")
+        return conn
+
+    lost = asyncio.run(scenario())
+    assert len(connects) == 2 and not connects[1].closed
+    # רק ניתוק אמיתי סוגר את החיבור
+    assert lost is connects[0] and lost.closed
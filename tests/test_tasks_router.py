@@ -0,0 +1,238 @@
+import pytest
+from starlette.testclient import TestClient
+
+from src.db import session as db_session
+from src.db.session import create_db_engine, get_session
+from src.main import app
+from src.models.tasks import Action, Base, Run, Task
+from src.routers.tasks import AUDIT_PAGE_MAX, TASKS_PAGE_MAX, _encode_cursor
+from src.services.audit import build_audit
+
+
+@pytest.fixture
+def db(tmp_path):
+    """DB זמני שכל ה-sessions של האפליקציה עובדים מולו."""
+    eng = create_db_engine(tmp_path / "r.db")
+    Base.metadata.create_all(eng)
+    db_session.SessionLocal.configure(bind=eng)
+    try:
+        yield eng
+    finally:
+        db_session.SessionLocal.configure(bind=db_session._engine)
+        eng.dispose()
+
+
+def _ts(sec: int) -> str:
+    return f"2026-01-01T00:00:{sec:02d}Z"
+
+
+def _seed_audit() -> list[tuple[str, str, str | None, str | None]]:
+    """משימה עם audit בסדר ידוע: (event, created_at, action_id, run_id); כמה באותה שנייה."""
+    rows = [
+        ("task_created", _ts(0), None, None),
+        ("task_queued", _ts(1), None, None),
+        ("run_started", _ts(1), "a1", "r1"),
+        ("run_finished", _ts(1), "a1", "r1"),
+        ("run_started", _ts(2), "a2", "r2"),
+        ("run_finished", _ts(3), "a2", "r2"),
+        ("task_succeeded", _ts(3), None, None),
+    ]
+    with get_session() as s:
+        s.add(Task(id="t1", title="t", status="SUCCEEDED"))
+        s.add(Task(id="t2", title="other"))
+        for i in (1, 2):
+            s.add(Action(id=f"a{i}", task_id="t1", idx=i - 1))
+            s.add(Run(id=f"r{i}", action_id=f"a{i}", status="SUCCEEDED"))
+        s.flush()
+        for n, (event, at, action_id, run_id) in enumerate(rows):
+            a = build_audit("t1", event, {"n": n}, action_id=action_id, run_id=run_id)
+            a.created_at = at
+            s.add(a)
+        # audit של משימה אחרת לא דולף
+        s.add(build_audit("t2", "task_created"))
+        s.commit()
+    return rows
+
+
+def _events(r) -> list[str]:
+    assert r.status_code == 200, r.text
+    return [e["event"] for e in r.json()]
+
+
+def test_audit_cursor_pages_cover_everything_in_order(db):
+    rows = _seed_audit()
+    client = TestClient(app)
+
+    everything = client.get("/tasks/t1/audit")
+    assert _events(everything) == [e for e, *_ in rows]
+    assert "X-Next-Cursor" not in everything.headers
+    assert [e["data"] for e in everything.json()] == [{"n": n} for n in range(len(rows))]
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+        r = client.get("/tasks/t1/audit", params=params)
+        page = r.json()
+        assert 1 <= len(page) <= 2
+        seen += page
+        pages += 1
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    # אירועים מאותה שנייה לא נכפלים ולא נופלים בין עמודים
+    assert [e["id"] for e in seen] == [e["id"] for e in everything.json()]
+    assert pages == 4
+
+    # עמוד מלא בדיוק — אין cursor כשאין עוד שורות
+    r = client.get("/tasks/t1/audit", params={"limit": len(rows)})
+    assert len(r.json()) == len(rows) and "X-Next-Cursor" not in r.headers
+
+
+def test_audit_filters(db):
+    rows = _seed_audit()
+    client = TestClient(app)
+
+    def get(**params):
+        return _events(client.get("/tasks/t1/audit", params=params))
+
+    assert get(event_type="run_started") == ["run_started", "run_started"]
+    assert get(event_type=["task_created", "task_succeeded"]) == ["task_created", "task_succeeded"]
+    assert get(action_id="a1") == ["run_started", "run_finished"]
+    assert get(run_id="r2") == ["run_started", "run_finished"]
+    assert get(run_id="r2", event_type="run_finished") == ["run_finished"]
+    assert get(since=_ts(2)) == [e for e, at, *_ in rows if at >= _ts(2)]
+    assert get(since=_ts(9)) == []
+
+    # הסינון נשמר גם בין עמודים
+    first = client.get("/tasks/t1/audit", params={"event_type": "run_finished", "limit": 1})
+    assert _events(first) == ["run_finished"]
+    rest = client.get(
+        "/tasks/t1/audit",
+        params={"event_type": "run_finished", "limit": 1, "cursor": first.headers["X-Next-Cursor"]},
+    )
+    assert [e["data"] for e in rest.json()] == [{"n": 5}]
+    assert "X-Next-Cursor" not in rest.headers
+
+
+def test_audit_decode_false_returns_raw_json(db):
+    _seed_audit()
+    client = TestClient(app)
+
+    decoded = client.get("/tasks/t1/audit", params={"limit": 1}).json()[0]
+    assert decoded["data"] == {"n": 0} and "data_json" not in decoded
+
+    raw = client.get("/tasks/t1/audit", params={"limit": 1, "decode": "false"}).json()[0]
+    assert raw["data"] == {} and raw["data_json"] == '{"n": 0}'
+    assert raw["id"] == decoded["id"]
+
+
+def test_audit_limit_bounds_and_bad_cursor(db):
+    _seed_audit()
+    client = TestClient(app)
+
+    assert client.get("/tasks/t1/audit", params={"limit": 0}).status_code == 422
+    assert client.get("/tasks/t1/audit", params={"limit": AUDIT_PAGE_MAX + 1}).status_code == 422
+    assert client.get("/tasks/t1/audit", params={"limit": AUDIT_PAGE_MAX}).status_code == 200
+
+    for bad in ("!!", "bm90LWpzb24", _encode_cursor(_ts(0))):
+        r = client.get("/tasks/t1/audit", params={"limit": 1, "cursor": bad})
+        assert r.status_code == 400 and r.json()["detail"] == "Invalid cursor"
+
+
+_STATUSES = ("PENDING", "RUNNING", "SUCCEEDED", "FAILED", "CANCELED")
+
+
+def _seed_tasks() -> list[tuple[str, str, str]]:
+    """15 משימות (id, status, created_at) בסטטוסים מעורבים; זוגות חולקים את אותה שנייה."""
+    rows = [(f"t{i:02d}", _STATUSES[i % len(_STATUSES)], _ts(i // 2)) for i in range(15)]
+    with get_session() as s:
+        for tid, st, at in rows:
+            s.add(Task(id=tid, title=tid, status=st, created_at=at, updated_at=at))
+            s.flush()  # rowid בסדר ההכנסה
+        s.commit()
+    return rows
+
+
+def _pages(client, **params) -> tuple[list[str], int]:
+    ids, cursor, pages = [], None, 0
+    while True:
+        r = client.get("/tasks/", params=params | ({"cursor": cursor} if cursor else {}))
+        assert r.status_code == 200, r.text
+        assert len(r.json()) <= params.get("limit", 50)
+        ids += [t["id"] for t in r.json()]
+        pages += 1
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids, pages
+
+
+def test_list_tasks_pages_merge_statuses_in_both_orders(db):
+    rows = _seed_tasks()
+    client = TestClient(app)
+    oldest_first = [tid for tid, *_ in rows]
+
+    # desc: החדשות ראשונות, ובתוך אותה שנייה — האחרונה שנוספה ראשונה
+    assert _pages(client, limit=4) == (oldest_first[::-1], 4)
+    assert _pages(client, limit=4, order="asc") == (oldest_first, 4)
+    assert _pages(client, limit=1) == (oldest_first[::-1], 15)
+
+    first = client.get("/tasks/", params={"limit": 15})
+    assert len(first.json()) == 15 and "X-Next-Cursor" not in first.headers
+    full = client.get("/tasks/", params={"limit": 2, "view": "full"}).json()
+    assert [t["id"] for t in full] == ["t14", "t13"] and all("approvals" in t for t in full)
+
+
+def test_list_tasks_status_and_created_at_filters(db):
+    rows = _seed_tasks()
+    client = TestClient(app)
+
+    def expect(pred, order="desc"):
+        ids = [tid for tid, st, at in rows if pred(st, at)]
+        return ids[::-1] if order == "desc" else ids
+
+    ids, _ = _pages(client, limit=2, status="FAILED")
+    assert ids == expect(lambda st, at: st == "FAILED")
+    ids, _ = _pages(client, limit=2, status=["RUNNING", "CANCELED"], order="asc")
+    assert ids == expect(lambda st, at: st in ("RUNNING", "CANCELED"), "asc")
+
+    lo, hi = _ts(2), _ts(5)
+    ids, _ = _pages(client, limit=3, created_after=lo, created_before=hi)
+    assert ids == expect(lambda st, at: lo <= at < hi)
+    ids, _ = _pages(client, limit=1, status="PENDING", created_after=lo, order="asc")
+    assert ids == expect(lambda st, at: st == "PENDING" and at >= lo, "asc")
+    assert _pages(client, status="WAITING_APPROVAL") == ([], 1)
+
+    assert client.get("/tasks/", params={"status": "NOPE"}).status_code == 422
+
+
+def test_list_tasks_rejects_bad_cursor_and_limit(db):
+    _seed_tasks()
+    client = TestClient(app)
+
+    for bad in ("!!", "bm90LWpzb24", _encode_cursor(_ts(0)), _encode_cursor(_ts(0), 1, 2)):
+        r = client.get("/tasks/", params={"cursor": bad})
+        assert r.status_code == 400 and r.json()["detail"] == "Invalid cursor"
+    assert client.get("/tasks/", params={"limit": 0}).status_code == 422
+    assert client.get("/tasks/", params={"limit": TASKS_PAGE_MAX + 1}).status_code == 422
+
+
+def test_count_tasks(db):
+    rows = _seed_tasks()
+    client = TestClient(app)
+
+    def count(**params):
+        r = client.get("/tasks/count", params=params)
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    assert count() == {"total": 15, "by_status": {st: 3 for st in _STATUSES}}
+    assert count(status=["FAILED", "PENDING"]) == {
+        "total": 6,
+        "by_status": {"FAILED": 3, "PENDING": 3},
+    }
+    lo, hi = _ts(2), _ts(5)
+    in_range = [st for _, st, at in rows if lo <= at < hi]
+    got = count(created_after=lo, created_before=hi)
+    assert got["total"] == len(in_range) == 6
+    assert got["by_status"] == {st: in_range.count(st) for st in set(in_range)}
+    assert count(status="WAITING_APPROVAL") == {"total": 0, "by_status": {}}